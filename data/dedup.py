@@ -0,0 +1,88 @@
+import re
+import hashlib
+from collections import defaultdict
+from typing import Dict, List, Set
+
+import numpy as np
+
+from .response_models import DocumentPlan
+
+_MERSENNE_PRIME = (1 << 31) - 1
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset("a an and at for from in into of on or the to with".split())
+
+
+def plan_shingles(plan: DocumentPlan) -> Set[str]:
+    """Features compared between plans: words of the topic and setting, and whole entity names."""
+    words = _TOKEN_PATTERN.findall(f"{plan.topic} {plan.setting}".lower())
+    shingles = {f"w:{word}" for word in words if word not in _STOPWORDS}
+    shingles.update(f"e:{' '.join(_TOKEN_PATTERN.findall(entity.name.lower()))}" for entity in plan.entities)
+    return shingles
+
+
+class PlanDeduplicator:
+    """
+    Near-duplicate filter for document plans: MinHash signatures over `plan_shingles`,
+    indexed with banded LSH.
+
+    `add` returns False for a plan whose estimated Jaccard similarity to an already
+    accepted plan is at least `threshold`, and otherwise indexes it. Lookups only
+    compare against plans sharing an LSH band, so checking a plan costs the same at
+    10 plans as at 100k. With the defaults (16 bands of 4 rows) candidate pairs start
+    to be found around 0.5 similarity.
+    """
+
+    def __init__(self, threshold: float = 0.5, num_perm: int = 64, bands: int = 16, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands}).")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self._buckets: List[Dict[bytes, List[int]]] = [defaultdict(list) for _ in range(bands)]
+        self._signatures: List[np.ndarray] = []
+        self.duplicates = 0
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    def signature(self, shingles: Set[str]) -> np.ndarray:
+        hashes = np.fromiter(
+            (int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little") for s in shingles),
+            dtype=np.uint64,
+            count=len(shingles),
+        )
+        if not len(hashes):
+            return np.full(len(self._a), _MERSENNE_PRIME, dtype=np.uint64)
+        # (a * h + b) mod p stays below 2^63 for 31-bit a, b and 32-bit h.
+        permuted = (np.outer(hashes, self._a) + self._b) % _MERSENNE_PRIME
+        return permuted.min(axis=0)
+
+    def _bands(self, signature: np.ndarray) -> List[bytes]:
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def similar(self, plan: DocumentPlan) -> float:
+        """Highest estimated Jaccard similarity between `plan` and an indexed plan sharing a band."""
+        signature = self.signature(plan_shingles(plan))
+        return self._best_match(signature, self._bands(signature))
+
+    def _best_match(self, signature: np.ndarray, bands: List[bytes]) -> float:
+        candidates = set()
+        for band, key in enumerate(bands):
+            candidates.update(self._buckets[band].get(key, ()))
+        return max((float(np.mean(self._signatures[i] == signature)) for i in candidates), default=0.0)
+
+    def add(self, plan: DocumentPlan) -> bool:
+        """Index `plan` and return True, or return False if it near-duplicates an indexed plan."""
+        signature = self.signature(plan_shingles(plan))
+        bands = self._bands(signature)
+        if self._best_match(signature, bands) >= self.threshold:
+            self.duplicates += 1
+            return False
+        plan_id = len(self._signatures)
+        self._signatures.append(signature)
+        for band, key in enumerate(bands):
+            self._buckets[band][key].append(plan_id)
+        return True
@@ -1,94 +1,315 @@
 import os
 import time
 import json
+import uuid
+import asyncio
+import threading
+from collections import deque
+from typing import Deque, List, Optional, Set
 from tqdm import tqdm
 
 from utils.llm import BaseLLMService, LLMService
-from utils.constants import GPT_4O, OPENAI
-from utils.logger import logger
+from utils.configs import MODEL_ROUTES, LLM_INITIAL_CONCURRENCY, LLM_MAX_CONCURRENCY
+from utils.constants import OPENAI, PROVIDER_INFORMATION
+from utils.limiter import AdaptiveLimiter
+from utils.logger import logger, log_context, configure_logging, get_request_id, LOG_LEVELS, LOG_FORMATS
+from utils.routing import ModelRouter, PLAN_STAGE, COMPOSE_STAGE
 
 from .__init__ import GENERATION_DIRECTORY
-from .prompts import DOCUMENT_PLAN_SYSTEM_PROMPT, DOCUMENT_PLAN_USER_PROMPT, DOCUMENT_COMPOSE_SYSTEM_PROMPT
-from .response_models import Document, DocumentPlan
+from .prompts import DOCUMENT_PLAN_SYSTEM_PROMPT, DOCUMENT_PLAN_BATCH_USER_PROMPT, DOCUMENT_COMPOSE_SYSTEM_PROMPT
+from .response_models import Document, DocumentPlan, DocumentPlanBatch
+from .dedup import PlanDeduplicator
+from .loader import iter_documents
+
+# Composed documents shorter than this are treated as low quality and escalated to the next model.
+MIN_DOCUMENT_WORDS = 150
+# Documents generated concurrently; the LLM limiter adapts the request rate underneath.
+MAX_CONCURRENT_GENERATIONS = 32
+# Plans requested per planning call; each is deduplicated before it is composed.
+PLAN_BATCH_SIZE = 10
+# Generation stops after this many failures in a row (e.g. the provider is down).
+MAX_CONSECUTIVE_FAILURES = 20
 
 class DocumentGenerator:
-    def __init__(self, llm_service: BaseLLMService):
+    def __init__(self, llm_service: BaseLLMService, router: Optional[ModelRouter] = None):
         self.llm_service = llm_service
-    
-    async def generate(self) -> Document:
-        # Generate document outline (plan, tone, style)
+        self.router = router or ModelRouter()
+
+    async def plan_batch(self, count: int) -> List[DocumentPlan]:
+        """Generate up to `count` distinct outlines in one structured call; plans with fewer than 3 entities are dropped."""
+        messages_plan = [
+            {"role": "system", "content": DOCUMENT_PLAN_SYSTEM_PROMPT},
+            {"role": "user", "content": DOCUMENT_PLAN_BATCH_USER_PROMPT.format(count=count)}
+        ]
+
+        logger.debug(f"Generating a batch of {count} document plans...")
+
+        batch: DocumentPlanBatch = await self.router.call_structured(
+            self.llm_service,
+            PLAN_STAGE,
+            messages=messages_plan,
+            response_format=DocumentPlanBatch,
+            accept=lambda b: any(len(p.entities) >= 3 for p in b.plans),
+        )
+        if batch is None:
+            raise RuntimeError("No document plans were generated.")
+
+        plans = [plan for plan in batch.plans if len(plan.entities) >= 3]
+        logger.debug(f"{len(plans)} document plans generated.")
+        return plans
+
+    async def compose(self, plan: DocumentPlan, document_id: Optional[str] = None) -> Document:
+        """Compose the final document based on the given plan, with id `document_id` (random by default)."""
+        compose_prompt = f"""
+        Convert the following structured scenario into a coherent multi-entity document:
+        {plan.model_dump()}
+        """
+        messages_compose = [
+            {"role": "system", "content": DOCUMENT_COMPOSE_SYSTEM_PROMPT},
+            {"role": "user", "content": compose_prompt}
+        ]
+
+        logger.debug("Composing final document...")
+
+        document: str = await self.router.call(
+            self.llm_service,
+            COMPOSE_STAGE,
+            messages=messages_compose,
+            accept=lambda text: bool(text) and len(text.split()) >= MIN_DOCUMENT_WORDS,
+        )
+        if not document:
+            raise RuntimeError("No document was composed.")
+
+        logger.debug("Document composition complete.")
+
+        return Document(
+            id=document_id or uuid.uuid4().hex,
+            content=document,
+            plan=plan,
+            creation_timestamp=time.strftime("%Y-%m-%d %H:%M:%S")
+        )
+
+
+class PlanPool:
+    """
+    Unique document plans for composing, planned `batch_size` at a time.
+
+    Workers take plans with `next()`. When the pool runs dry, enough batch planning
+    calls are started to cover the workers waiting, and each plan is checked against
+    `deduplicator` before it is handed out, so no compose call is spent on a near-
+    duplicate of an earlier document. A planning call that fails, or yields only
+    duplicates, raises in one waiting worker.
+    """
+
+    def __init__(self, document_generator: DocumentGenerator, deduplicator: PlanDeduplicator, batch_size: int = PLAN_BATCH_SIZE):
+        self.document_generator = document_generator
+        self.deduplicator = deduplicator
+        self.batch_size = batch_size
+        self._plans: Deque[DocumentPlan] = deque()
+        self._errors: Deque[Exception] = deque()
+        self._condition = asyncio.Condition()
+        self._waiting = 0
+        self._planning = 0
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def next(self) -> DocumentPlan:
+        async with self._condition:
+            self._waiting += 1
+            try:
+                while not self._plans:
+                    if self._errors:
+                        raise self._errors.popleft()
+                    while self._planning * self.batch_size < self._waiting:
+                        self._planning += 1
+                        task = asyncio.create_task(self._refill())
+                        self._tasks.add(task)
+                        task.add_done_callback(self._tasks.discard)
+                    await self._condition.wait()
+                return self._plans.popleft()
+            finally:
+                self._waiting -= 1
+
+    async def _refill(self):
+        plans, error = [], None
         try:
-            messages_plan = [
-                {"role": "system", "content": DOCUMENT_PLAN_SYSTEM_PROMPT},
-                {"role": "user", "content": DOCUMENT_PLAN_USER_PROMPT}
-            ]
-
-            logger.debug("Generating document plan...")
-
-            plan: DocumentPlan = await self.llm_service.call_llm_structured(
-                model=GPT_4O,
-                messages=messages_plan,
-                response_format=DocumentPlan
-            )
-
-            logger.debug(f"Document plan generated. {plan}")
-
-            # Compose the final document based on the generated plan
-            compose_prompt = f"""
-            Convert the following structured scenario into a coherent multi-entity document:
-            {plan.model_dump()}
-            """
-            messages_compose = [
-                {"role": "system", "content": DOCUMENT_COMPOSE_SYSTEM_PROMPT},
-                {"role": "user", "content": compose_prompt}
-            ]
-
-            logger.debug("Composing final document...")
-
-            document: str = await self.llm_service.call_llm(
-                model=GPT_4O,
-                messages=messages_compose
-            )
-
-            logger.debug("Document composition complete.")
-
-            return Document(
-                content=document,
-                plan=plan,
-                creation_timestamp=time.strftime("%Y-%m-%d %H:%M:%S")
-            )
+            # Shared by every waiting worker, so not tagged with the document that started it.
+            with log_context(doc=None, stage="plan"):
+                plans = await self.document_generator.plan_batch(self.batch_size)
         except Exception as e:
-            logger.error(f"Document generation failed: {e}")
-            raise e
+            error = e
+        unique = [plan for plan in plans if self.deduplicator.add(plan)]
+        if error is None and not unique:
+            error = RuntimeError(f"All {len(plans)} planned documents were near-duplicates.")
+        elif len(unique) < len(plans):
+            logger.debug(f"Dropped {len(plans) - len(unique)} near-duplicate plans.")
+        async with self._condition:
+            self._planning -= 1
+            self._plans.extend(unique)
+            if error is not None:
+                self._errors.append(error)
+            self._condition.notify_all()
 
+    def close(self):
+        for task in self._tasks:
+            task.cancel()
 
-if __name__ == "__main__":
-    import asyncio
 
-    os.makedirs(GENERATION_DIRECTORY, exist_ok=True)
+class DocumentWriter:
+    """
+    Persists generated documents as soon as each completes. A `*.jsonl` path gets one
+    document per line, appended and fsynced; any other path is a directory of
+    `document_<id>.json` files, each written atomically. `count` is the number of
+    documents already there, so an interrupted run can resume up to its target.
+    """
 
-    llm_service = LLMService(name=OPENAI)
-    document_generator = DocumentGenerator(llm_service=llm_service)
+    def __init__(self, path: str):
+        self.path = path
+        self.jsonl = path.endswith(".jsonl")
+        self._lock = threading.Lock()
+        self._file = None
+        if self.jsonl:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.count = self._load_jsonl()
+            self._file = open(path, "a", encoding="utf-8")
+        else:
+            os.makedirs(path, exist_ok=True)
+            self.count = sum(1 for name in os.listdir(path) if name.endswith(".json"))
 
-    num_documents = input("Enter the number of documents to generate: ")
+    def _load_jsonl(self) -> int:
+        if not os.path.exists(self.path):
+            return 0
+        count, valid = 0, 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                try:
+                    json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                count += 1
+                valid += len(line)
+        # A torn final line from a crash mid-write would corrupt the next append.
+        if os.path.getsize(self.path) > valid:
+            with open(self.path, "r+b") as f:
+                f.truncate(valid)
+        return count
 
-    async def main():
-        tasks = [document_generator.generate() for _ in range(int(num_documents))]
+    def write(self, document: Document):
+        data = document.model_dump()
+        with self._lock:
+            if self.jsonl:
+                self._file.write(json.dumps(data) + "\n")
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            else:
+                path = os.path.join(self.path, f"document_{document.id}.json")
+                with open(f"{path}.tmp", "w") as f:
+                    json.dump(data, f, indent=4)
+                os.replace(f"{path}.tmp", path)
+            self.count += 1
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+async def generate_documents(
+    document_generator: DocumentGenerator,
+    writer: DocumentWriter,
+    target: int,
+    concurrency: int = MAX_CONCURRENT_GENERATIONS,
+    plan_batch_size: int = PLAN_BATCH_SIZE,
+    max_consecutive_failures: int = MAX_CONSECUTIVE_FAILURES,
+) -> int:
+    """
+    Generate documents with at most `concurrency` in flight until `writer` holds `target`
+    documents, writing each one as it completes. Plans come from a `PlanPool`, deduplicated
+    against each other and against the documents already written. Failed generations are
+    retried in place, so the target is reached unless failures keep repeating. Returns the
+    number written.
+    """
+    remaining = target - writer.count
+    if remaining <= 0:
+        logger.info(f"{writer.path} already holds {writer.count} documents (target {target}).")
+        return 0
+
+    deduplicator = PlanDeduplicator()
+    if writer.count:
+        async for document in iter_documents(writer.path):
+            deduplicator.add(document.plan)
+        logger.info(f"Resuming: {writer.count} documents already in {writer.path}.")
+    plan_pool = PlanPool(document_generator, deduplicator, batch_size=plan_batch_size)
+
+    progress = tqdm(total=target, initial=writer.count, colour="green", desc="Generating documents", unit="doc")
+    claimed, written, consecutive_failures = 0, 0, 0
 
-        results = []
-        for coro in tqdm(asyncio.as_completed(tasks), total=len(tasks), colour="green", desc="Generating documents"):
+    async def worker():
+        nonlocal claimed, written, consecutive_failures
+        while claimed < remaining and consecutive_failures < max_consecutive_failures:
+            claimed += 1
+            document_id = get_request_id()
             try:
-                result = await coro
-                results.append(result)
+                with log_context(doc=document_id, stage="compose"):
+                    document = await document_generator.compose(await plan_pool.next(), document_id=document_id)
             except Exception as e:
+                with log_context(doc=document_id):
+                    logger.error(f"Document generation failed: {e}")
+                claimed -= 1
+                consecutive_failures += 1
                 continue
+            consecutive_failures = 0
+            await asyncio.to_thread(writer.write, document)
+            written += 1
+            progress.update(1)
 
-        return results
-    
-    generated_documents = asyncio.run(main())
-    
-    # Save generated documents to files
-    for idx, doc in enumerate(generated_documents):
-        with open(f"{GENERATION_DIRECTORY}/document_{idx+1}.json", "w") as f:
-            json.dump(doc.model_dump(), f, indent=4)
+    try:
+        await asyncio.gather(*(worker() for _ in range(min(concurrency, remaining))))
+    finally:
+        plan_pool.close()
+        progress.close()
+    if consecutive_failures >= max_consecutive_failures:
+        logger.error(f"Stopped after {consecutive_failures} consecutive generation failures ({written} documents written).")
+    if deduplicator.duplicates:
+        logger.info(f"Skipped {deduplicator.duplicates} near-duplicate plans before composing.")
+    return written
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Generate synthetic documents.")
+    parser.add_argument("--count", type=int, required=True, help="Target number of documents; re-running resumes up to it.")
+    parser.add_argument(
+        "--output",
+        default=GENERATION_DIRECTORY,
+        help="Directory for one JSON file per document, or a *.jsonl file to append documents to.",
+    )
+    parser.add_argument("--concurrency", type=int, default=MAX_CONCURRENT_GENERATIONS, help="Maximum documents generated at once.")
+    parser.add_argument("--plan-batch-size", type=int, default=PLAN_BATCH_SIZE, help="Document plans requested per planning call.")
+    parser.add_argument("--log-level", choices=LOG_LEVELS, help="Overrides the LOG_LEVEL environment variable (default INFO).")
+    parser.add_argument("--log-format", choices=LOG_FORMATS, help="Overrides LOG_FORMAT: coloured 'text' or one JSON object per line.")
+    args = parser.parse_args()
+    configure_logging(level=args.log_level, fmt=args.log_format)
+
+    limiter = AdaptiveLimiter(
+        initial_limit=LLM_INITIAL_CONCURRENCY,
+        max_limit=LLM_MAX_CONCURRENCY,
+        rate_limits=PROVIDER_INFORMATION[OPENAI]["RATE_LIMITS"],
+    )
+
+    async def main():
+        writer = DocumentWriter(args.output)
+        try:
+            async with LLMService(name=OPENAI, limiter=limiter) as llm_service:
+                document_generator = DocumentGenerator(llm_service=llm_service, router=ModelRouter.from_json(MODEL_ROUTES, provider=OPENAI))
+                written = await generate_documents(
+                    document_generator, writer, args.count, concurrency=args.concurrency, plan_batch_size=args.plan_batch_size
+                )
+        finally:
+            writer.close()
+        logger.info(f"Generated {written} documents; {writer.count} in {args.output}.")
 
+    asyncio.run(main())
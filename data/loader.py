@@ -0,0 +1,90 @@
+import os
+import sys
+import json
+import asyncio
+from typing import AsyncIterator, Optional
+
+from pydantic import ValidationError
+
+from utils.logger import logger
+
+from .response_models import Document
+
+STDIN = "-"
+
+
+def _read_json_file(path: str) -> dict:
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def _parse(raw: dict, origin: str) -> Optional[Document]:
+    try:
+        return Document(**raw)
+    except (TypeError, ValidationError) as e:
+        logger.warning(f"Skipping malformed document from {origin}: {e}")
+        return None
+
+
+async def _iter_directory(directory: str) -> AsyncIterator[Document]:
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if not entry.name.endswith(".json") or not entry.is_file():
+                continue
+            try:
+                raw = await asyncio.to_thread(_read_json_file, entry.path)
+            except (OSError, json.JSONDecodeError) as e:
+                logger.warning(f"Skipping unreadable document {entry.path}: {e}")
+                continue
+            document = _parse(raw, entry.path)
+            if document is not None:
+                yield document
+
+
+async def _iter_lines(stream, origin: str) -> AsyncIterator[Document]:
+    line_number = 0
+    while True:
+        line = await asyncio.to_thread(stream.readline)
+        if not line:
+            break
+        line_number += 1
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            raw = json.loads(line)
+        except json.JSONDecodeError as e:
+            logger.warning(f"Skipping invalid JSON on line {line_number} of {origin}: {e}")
+            continue
+        document = _parse(raw, f"{origin}:{line_number}")
+        if document is not None:
+            yield document
+
+
+async def iter_documents(source: str) -> AsyncIterator[Document]:
+    """
+    Lazily yield documents from `source`, one at a time.
+
+    `source` may be a directory of `*.json` files, a JSONL file with one
+    document per line, or "-" for JSONL on stdin.
+    """
+    if source == STDIN:
+        async for document in _iter_lines(sys.stdin, "stdin"):
+            yield document
+    elif os.path.isdir(source):
+        async for document in _iter_directory(source):
+            yield document
+    else:
+        with open(source, "r") as f:
+            async for document in _iter_lines(f, source):
+                yield document
+
+
+async def fill_queue(source: str, queue: asyncio.Queue, num_consumers: int):
+    """Feed documents from `source` into a bounded queue, then one `None` sentinel per consumer."""
+    try:
+        async for document in iter_documents(source):
+            await queue.put(document)
+    finally:
+        for _ in range(num_consumers):
+            await queue.put(None)
@@ -31,8 +31,8 @@ Return structured JSON with the following keys:
 """
 
 
-DOCUMENT_PLAN_USER_PROMPT = """
-Generate a **fictional yet realistic** scenario with strong narrative potential.
+DOCUMENT_PLAN_BATCH_USER_PROMPT = """
+Generate **{count} fictional yet realistic** scenarios with strong narrative potential.
 
 Following are some example themes:
 - Cybersecurity & Espionage
@@ -45,7 +45,8 @@ Following are some example themes:
 - International Diplomacy & Espionage
 - Cultural Heritage & Technology
 
-First think of a new theme not listed above, then create a unique scenario around it.
+First think of {count} new themes not listed above, then create one unique scenario around each.
+The scenarios must not share themes, settings or entity names with each other.
 
 Each scenario must:
 - Contain **3–6 distinct entities** (people, organizations, locations, or events)
@@ -53,7 +54,7 @@ Each scenario must:
 - Include **one underlying tension** (ethical, strategic, or emotional)
 - Be suitable for generating an engaging, multi-perspective narrative
 
-Return only structured JSON following the expected schema.
+Return only structured JSON of the form {{"plans": [...]}}, one scenario per element following the expected schema.
 """
 
 DOCUMENT_COMPOSE_SYSTEM_PROMPT = """
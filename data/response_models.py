@@ -14,7 +14,11 @@ class DocumentPlan(BaseModel):
     tone: Optional[str] = "neutral"
     style: Optional[str] = "narrative"
 
+class DocumentPlanBatch(BaseModel):
+    plans: List[DocumentPlan] = Field(..., description="Distinct document plans, each with a different theme and different entities")
+
 class Document(BaseModel):
+    id: Optional[str] = None
     content: str
     plan: DocumentPlan
     creation_timestamp: Optional[str]
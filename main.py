@@ -1,102 +1,531 @@
 import os
-import json
 import asyncio
-from tqdm.asyncio import tqdm_asyncio
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+from tqdm import tqdm
 
 from data import GENERATION_DIRECTORY
+from data.loader import fill_queue
 from data.response_models import Document
 from utils.llm import LLMService
-from utils.constants import OPENAI
-from utils.logger import logger
-from orchestrator import KnowledgeGraphExtractor
+from utils.batch import BatchLLMService, OpenAIBatchBackend, LocalBatchBackend
+from utils.cache import ResponseCache
+from utils.limiter import AdaptiveLimiter
+from utils.embeddings import TextEmbedder, LOCAL_PREFIX
+from utils.configs import (
+    LLM_CACHE_PATH,
+    LLM_CACHE_MAX_ENTRIES,
+    LLM_CACHE_MAX_AGE_SECONDS,
+    LLM_INITIAL_CONCURRENCY,
+    LLM_MAX_CONCURRENCY,
+    MODEL_ROUTES,
+    TRAIT_EMBEDDING_MODEL,
+    EMBEDDING_CACHE_DIRECTORY,
+)
+from utils.constants import OPENAI, PROVIDER_INFORMATION
+from utils.logger import logger, log_context, configure_logging, LOG_LEVELS, LOG_FORMATS
+from utils.metrics import metrics, Profiler, LLM_COST_USD_TOTAL, LLM_TOKENS_TOTAL, TOKEN_KINDS
+from utils.manifest import RunManifest, fingerprint, DONE, FAILED
+from utils.routing import ModelRouter
+from utils.pipeline import Stage, StagedPipeline
+from utils.sinks import ResultSink, make_sink, SINKS, JSON
+from orchestrator import KnowledgeGraphExtractor, EXTRACTION_MODES, STAGED
+from orchestrator.response_models import KnowledgeGraph
 from orchestrator.evaluate import EvaluationPipeline
+from orchestrator.aggregate import EvaluationAggregator
+from orchestrator.global_graph import GlobalKnowledgeGraph
+from orchestrator.visualize import render_html, write_assets, CLUSTER_BY_COMMUNITY
+from orchestrator.judging import JudgePolicy, JUDGE_MODES, JUDGE_ALL, needs_judging
+from orchestrator.prompts import (
+    ENTITY_EXTRACTION_SYSTEM_PROMPT,
+    RELATION_EXTRACTION_SYSTEM_PROMPT,
+    PERSONALITY_INFERENCE_SYSTEM_PROMPT,
+    LLM_JUDGE_SYSTEM_PROMPT,
+    JOINT_EXTRACTION_SYSTEM_PROMPT,
+    SHARED_SYSTEM_PROMPT,
+)
 
 
 OUTPUT_PATH = "extracted/"
 os.makedirs(OUTPUT_PATH, exist_ok=True)
 
-MAX_CONCURRENT_TASKS = 5
+MANIFEST_PATH = f"{OUTPUT_PATH}/manifest.jsonl"
+SUMMARY_PATH = f"{OUTPUT_PATH}/summary.json"
+GLOBAL_GRAPH_PATH = f"{OUTPUT_PATH}/global_graph.json"
+GLOBAL_GRAPH_HTML_PATH = f"{OUTPUT_PATH}/global_graph.html"
+# Shared viewer bundle linked by every rendered graph instead of being duplicated per file.
+ASSETS_PATH = f"{OUTPUT_PATH}/assets"
+# Prometheus text export of the run's LLM and stage metrics, and a JSON profile with rollups.
+METRICS_PATH = f"{OUTPUT_PATH}/metrics.prom"
+PROFILE_PATH = f"{OUTPUT_PATH}/profile.json"
+# Raw cProfile data when running with --profile (open with snakeviz or pstats).
+CPU_PROFILE_PATH = f"{OUTPUT_PATH}/profile.pstats"
 
-async def process_document(document: Document, kg_extractor: KnowledgeGraphExtractor, evaluator: EvaluationPipeline, semaphore: asyncio.Semaphore):
+# LLM concurrency is governed adaptively by the AdaptiveLimiter; this only bounds documents in flight,
+# and must be large enough to keep the limiter saturated.
+MAX_CONCURRENT_DOCUMENTS = LLM_MAX_CONCURRENCY
+
+# Backends: interactive chat completions, the provider's batch API, or a local file-based batch stand-in.
+CHAT = "chat"
+BATCH = "batch"
+LOCAL_BATCH = "local-batch"
+BACKENDS = (CHAT, BATCH, LOCAL_BATCH)
+
+# Blocking stages: PyVis rendering and JSON/manifest writes run in their own thread pools.
+RENDER_WORKERS = min(8, os.cpu_count() or 1)
+PERSIST_WORKERS = 4
+
+# In batch mode many more documents must be in flight so that their requests fill each batch.
+BATCH_SIZE = 1000
+LOCAL_BATCH_DIRECTORY = ".cache/local_batches"
+
+# Bump PIPELINE_REVISION when extraction/evaluation logic changes in a way that should invalidate finished documents.
+PIPELINE_REVISION = "3"
+PIPELINE_VERSION = fingerprint(
+    PIPELINE_REVISION,
+    ENTITY_EXTRACTION_SYSTEM_PROMPT,
+    RELATION_EXTRACTION_SYSTEM_PROMPT,
+    PERSONALITY_INFERENCE_SYSTEM_PROMPT,
+    LLM_JUDGE_SYSTEM_PROMPT,
+    JOINT_EXTRACTION_SYSTEM_PROMPT,
+    SHARED_SYSTEM_PROMPT,
+)
+
+@dataclass
+class DocumentJob:
+    """A document's state as it moves through the pipeline stages."""
+    document: Document
+    doc_hash: str
+    knowledge_graph: Optional[KnowledgeGraph] = None
+    evaluation: Dict[str, Any] = field(default_factory=dict)
+    skipped: bool = False
+
+    @property
+    def record_id(self) -> str:
+        """Readable, collision-free id: creation time plus a prefix of the content hash."""
+        return f"{self.document.creation_timestamp.replace(' ', '_').replace(':', '-')}_{self.doc_hash[:12]}"
+
+
+class DocumentPipeline:
     """
-    Process one document:
-    1️⃣ Extract KG
-    2️⃣ Evaluate (supervised + LLM)
-    3️⃣ Visualize
-    4️⃣ Save combined output
+    Per-document work split into stages: extract → evaluate → merge → render → persist.
+
+    Extraction and evaluation are network-bound and run on the event loop; rendering
+    and persisting are blocking CPU/disk work and run in thread pools, so they never
+    hold up LLM calls. Results go to `sink`, which batches writes in the background,
+    and each graph is merged into `global_graph` by a single dedicated worker.
+    Documents already completed by the current pipeline version (per `manifest`)
+    skip straight to persist, which feeds their saved results to `aggregator` like
+    any other.
     """
-    async with semaphore:
-        try:
-            # --- 1️⃣ Extract Knowledge Graph ---
-            extracted_kg = await kg_extractor.extract(document.content)
 
-            # --- 2️⃣ Run Evaluations ---
-            supervised_eval = evaluator.evaluate_supervised(document.model_dump(), extracted_kg.model_dump())
-            llm_eval = await evaluator.evaluate_llm(document.content, extracted_kg.model_dump())
+    def __init__(
+        self,
+        kg_extractor: KnowledgeGraphExtractor,
+        evaluator: EvaluationPipeline,
+        sink: ResultSink,
+        manifest: Optional[RunManifest] = None,
+        aggregator: Optional[EvaluationAggregator] = None,
+        judge_policy: Optional[JudgePolicy] = None,
+        progress: Optional[tqdm] = None,
+        global_graph: Optional[GlobalKnowledgeGraph] = None,
+    ):
+        self.kg_extractor = kg_extractor
+        self.evaluator = evaluator
+        self.sink = sink
+        self.manifest = manifest
+        self.aggregator = aggregator
+        self.judge_policy = judge_policy or JudgePolicy()
+        self.progress = progress
+        self.global_graph = global_graph
+        self._aggregate_lock = threading.Lock()
+
+    def stages(self, network_workers: int, render_workers: int = RENDER_WORKERS, persist_workers: int = PERSIST_WORKERS) -> List[Stage]:
+        return [
+            Stage("extract", self.extract, workers=network_workers),
+            Stage("evaluate", self.evaluate, workers=network_workers, log_fields=self.log_fields),
+            Stage("merge", self.merge, workers=1, blocking=True, log_fields=self.log_fields),
+            Stage("render", self.render, workers=render_workers, blocking=True, log_fields=self.log_fields),
+            Stage("persist", self.persist, workers=persist_workers, blocking=True, log_fields=self.log_fields),
+        ]
+
+    @staticmethod
+    def log_fields(job: DocumentJob) -> Dict[str, str]:
+        return {"doc": job.record_id}
 
-            evaluation_results = {
+    # --- 1️⃣ Extract Knowledge Graph ---
+    async def extract(self, document: Document) -> DocumentJob:
+        job = DocumentJob(document=document, doc_hash=RunManifest.document_hash(document))
+        # The record id only exists once the document is hashed, so extract tags its own records.
+        with log_context(**self.log_fields(job)):
+            if self.manifest is not None and self.manifest.is_done(job.doc_hash):
+                logger.debug(f"Skipping document created at {document.creation_timestamp}; already processed.")
+                job.skipped = True
+                return job
+            try:
+                job.knowledge_graph = await self.kg_extractor.extract(document.content)
+            except Exception as e:
+                logger.error(f"❌ Processing failed for document created at {document.creation_timestamp}: {e}")
+                job.evaluation = {"error": str(e)}
+        return job
+
+    # --- 2️⃣ Run Evaluations (supervised, then LLM judge if the policy selects the document) ---
+    async def evaluate(self, job: DocumentJob) -> DocumentJob:
+        if job.skipped or job.knowledge_graph is None:
+            return job
+        try:
+            document = job.document.model_dump()
+            generated_kg = job.knowledge_graph.model_dump()
+            supervised_eval = await self.evaluator.evaluate_supervised(document, generated_kg)
+            judge = self.judge_policy.select(job.doc_hash, supervised_eval)
+            llm_eval = None
+            if judge["selected"] and not judge["pending"]:
+                llm_eval = await self.evaluator.evaluate_llm(job.document.content, generated_kg)
+
+            job.evaluation = {
                 "supervised_eval": supervised_eval,
-                "llm_eval": llm_eval
+                "llm_eval": llm_eval,
+                "judge": judge,
             }
+        except Exception as e:
+            # The graph itself is fine, so it is still merged, rendered and saved.
+            logger.error(f"❌ Evaluation failed for document created at {job.document.creation_timestamp}: {e}")
+            job.evaluation = {"evaluation_error": str(e)}
+        return job
+
+    # --- Merge into the cross-document graph ---
+    def merge(self, job: DocumentJob) -> DocumentJob:
+        if self.global_graph is None or job.record_id in self.global_graph.documents:
+            return job
+        if job.skipped:
+            # Finished by an earlier run whose global graph was not saved.
+            self.global_graph.add_results([(job.record_id, self.sink.read(job.record_id) or {})])
+        elif job.knowledge_graph is not None:
+            self.global_graph.add_graph(job.knowledge_graph, source=job.record_id)
+        return job
 
+    # --- 3️⃣ Visualization (optional) ---
+    def render(self, job: DocumentJob) -> DocumentJob:
+        if job.knowledge_graph is None:
+            return job
+        try:
+            # PyVis for small graphs; visualize switches to the LOD viewer above its threshold.
+            job.knowledge_graph.visualize(output_file=f"{OUTPUT_PATH}/kg_{job.record_id}.html", assets_dir=ASSETS_PATH, title=job.record_id)
         except Exception as e:
-            logger.error(f"❌ Processing failed for document created at {document.creation_timestamp}: {e}")
-            evaluation_results = {"error": str(e)}
-            extracted_kg = None
+            logger.warning(f"Visualization failed for document created at {job.document.creation_timestamp}: {e}")
+        return job
+
+    # --- 4️⃣ Save combined output and checkpoint ---
+    def persist(self, job: DocumentJob) -> str:
+        if job.skipped:
+            if self.aggregator is not None:
+                output_data = self.sink.read(job.record_id)
+                if output_data is not None:
+                    self._aggregate(output_data)
+            return self._done(job.record_id)
 
-        # --- 3️⃣ Visualization (optional) ---
-        if extracted_kg:
-            try:
-                extracted_kg.visualize(
-                    output_file=f"{OUTPUT_PATH}/kg_{document.creation_timestamp.replace(' ', '_').replace(':', '-')}.html"
-                )
-            except AssertionError:
-                logger.warning(f"Visualization failed for document created at {document.creation_timestamp}")
-            except ImportError:
-                logger.warning("PyVis not installed; skipping visualization.")
-
-        # --- 4️⃣ Save combined output ---
         output_data = {
-            "document_metadata": document.model_dump(),
-            "knowledge_graph": extracted_kg.model_dump() if extracted_kg else None,
-            "evaluation": evaluation_results
+            "document_metadata": job.document.model_dump(),
+            "knowledge_graph": job.knowledge_graph.model_dump() if job.knowledge_graph else None,
+            "evaluation": job.evaluation
         }
+        self._aggregate(output_data)
 
-        out_file = f"{OUTPUT_PATH}/kg_{document.creation_timestamp.replace(' ', '_').replace(':', '-')}.json"
-        with open(out_file, "w") as f:
-            json.dump(output_data, f, indent=4)
+        # The manifest is only updated once the sink has durably written the record.
+        def checkpoint():
+            location = self.sink.locator(job.record_id)
+            logger.debug(f"Saved extracted results to {location}")
+            if self.manifest is None:
+                return
+            if job.knowledge_graph is not None:
+                self.manifest.mark(job.doc_hash, DONE, output=location)
+            else:
+                self.manifest.mark(job.doc_hash, FAILED, output=location, error=job.evaluation.get("error"))
 
-        logger.debug(f"Saved extracted results to {out_file}")
+        self.sink.write(job.record_id, output_data, on_written=checkpoint)
+        return self._done(job.record_id)
+
+    def _aggregate(self, output_data: Dict[str, Any]):
+        if self.aggregator is not None:
+            with self._aggregate_lock:
+                self.aggregator.add(output_data)
+
+    def _done(self, out_file: Optional[str]) -> Optional[str]:
+        if self.progress is not None:
+            self.progress.update(1)
         return out_file
 
 
-async def main():
-    # --- Initialize services ---
-    llm_service = LLMService(OPENAI)
-    kg_extractor = KnowledgeGraphExtractor(llm_service=llm_service)
-    evaluator = EvaluationPipeline(llm_service=llm_service)
+def build_llm_service(backend: str, cache: ResponseCache, limiter: AdaptiveLimiter):
+    """The LLM service for `backend` and the number of documents to keep in flight with it."""
+    if backend == CHAT:
+        return LLMService(OPENAI, cache=cache, limiter=limiter), MAX_CONCURRENT_DOCUMENTS
+    batch_backend = OpenAIBatchBackend(OPENAI) if backend == BATCH else LocalBatchBackend(LOCAL_BATCH_DIRECTORY)
+    return BatchLLMService(OPENAI, backend=batch_backend, cache=cache, batch_size=BATCH_SIZE), BATCH_SIZE
+
 
-    # --- Load synthetic documents ---
-    synthetic_documents: list[Document] = [
-        Document(**json.load(open(f"{GENERATION_DIRECTORY}/{file}", "r")))
-        for file in os.listdir(GENERATION_DIRECTORY)
-        if file.endswith(".json")
-    ]
+def build_limiter() -> AdaptiveLimiter:
+    return AdaptiveLimiter(
+        initial_limit=LLM_INITIAL_CONCURRENCY,
+        max_limit=LLM_MAX_CONCURRENCY,
+        rate_limits=PROVIDER_INFORMATION[OPENAI]["RATE_LIMITS"],
+    )
 
-    # --- Create semaphore for concurrency control ---
-    semaphore = asyncio.Semaphore(MAX_CONCURRENT_TASKS)
 
-    # --- Create async tasks ---
-    tasks = [
-        process_document(doc, kg_extractor, evaluator, semaphore)
-        for doc in synthetic_documents
-    ]
+def log_run_summary(aggregator: EvaluationAggregator):
+    aggregator.write(SUMMARY_PATH)
+    f1 = aggregator.metrics["supervised_eval.entity_f1"].summary()
+    logger.info(f"Run summary saved to {SUMMARY_PATH} (entity F1 {f1.get('mean')} ± CI {f1.get('ci95')}, {aggregator.failures} failures, {aggregator.evaluation_failures} unevaluated).")
+    for name, estimate in aggregator.llm_eval_estimate().items():
+        spread = f"± {estimate['stderr']}" if estimate["stderr"] is not None else f"(stderr unknown: one judged document in {estimate['unknown_variance_strata']})"
+        logger.info(f"LLM judge {name}: {estimate['estimate']} {spread} ({estimate['judged']} judged, coverage {estimate['coverage']})")
 
-    logger.info(f"Launching {len(tasks)} document pipelines in parallel (max {MAX_CONCURRENT_TASKS} concurrent)...")
-    results = await tqdm_asyncio.gather(*tasks, desc="Processing all documents", colour="green")
-    logger.info(f"Completed {len(results)} documents.")
-    return results
+
+async def main(
+    source: str = GENERATION_DIRECTORY,
+    mode: str = STAGED,
+    backend: str = CHAT,
+    judge_policy: Optional[JudgePolicy] = None,
+    sink_kind: str = JSON,
+    pack_size: int = 1,
+    profiler: Optional[Profiler] = None,
+):
+    judge_policy = judge_policy or JudgePolicy()
+    profiler = profiler or Profiler()
+    profiler.start()
+    # Metrics and the profile are written even when the run fails part-way.
+    pipeline, llm_service = None, None
+    try:
+        sink = make_sink(sink_kind, OUTPUT_PATH)
+
+        # --- Initialize services ---
+        cache = ResponseCache(LLM_CACHE_PATH, max_entries=LLM_CACHE_MAX_ENTRIES, max_age_seconds=LLM_CACHE_MAX_AGE_SECONDS)
+        limiter = build_limiter()
+        llm_service, num_workers = build_llm_service(backend, cache, limiter)
+        router = ModelRouter.from_json(MODEL_ROUTES, provider=OPENAI)
+        kg_extractor = KnowledgeGraphExtractor(llm_service=llm_service, mode=mode, router=router, pack_size=pack_size)
+        # Batch backends cannot embed interactively, so they only use trait embeddings from a local model.
+        embedder = None
+        if TRAIT_EMBEDDING_MODEL and (backend == CHAT or TRAIT_EMBEDDING_MODEL.startswith(LOCAL_PREFIX)):
+            embedder = TextEmbedder(TRAIT_EMBEDDING_MODEL, llm_service=llm_service, cache_directory=EMBEDDING_CACHE_DIRECTORY)
+        evaluator = EvaluationPipeline(llm_service=llm_service, router=router, embedder=embedder)
+        trait_scorer = embedder.model if embedder is not None else "jaccard"
+        # Packing only changes the fingerprint when enabled, so unpacked runs keep resuming existing manifests.
+        packing = [f"pack={pack_size}"] if pack_size > 1 else []
+        # The judge policy and sink do not change extractions, so they are recorded per document
+        # instead of being versioned; switching them must not re-extract the corpus or reset the global graph.
+        manifest = RunManifest(
+            MANIFEST_PATH,
+            version=fingerprint(PIPELINE_VERSION, mode, router.describe(), trait_scorer, *packing),
+            settings={"judge_policy": judge_policy.describe(), "sink": sink_kind},
+        )
+        changed = manifest.changed_settings()
+        if changed.get("judge_policy"):
+            logger.info(f"{changed['judge_policy']} finished documents keep the judging decisions of an earlier judge policy.")
+        if changed.get("sink"):
+            logger.warning(
+                f"{changed['sink']} finished documents were saved to another sink and are not re-extracted; "
+                f"their results are missing from '{sink_kind}' output and this run's summary."
+            )
+        aggregator = EvaluationAggregator()
+        global_graph = GlobalKnowledgeGraph.load_or_create(GLOBAL_GRAPH_PATH, version=manifest.version)
+        write_assets(ASSETS_PATH)
+
+        # --- Stream documents through the stage pipeline ---
+        progress = tqdm(desc="Processing all documents", colour="green", unit="doc")
+        document_pipeline = DocumentPipeline(kg_extractor, evaluator, sink, manifest, aggregator, judge_policy, progress, global_graph)
+        pipeline = StagedPipeline(document_pipeline.stages(network_workers=num_workers))
+
+        logger.info(f"Streaming documents from {source} (max {num_workers} documents in flight, {backend} backend)...")
+        try:
+            completed = await pipeline.run(lambda queue, num_consumers: fill_queue(source, queue, num_consumers=num_consumers))
+        finally:
+            progress.close()
+            await llm_service.close()
+            cache.close()
+            sink.close()
+            manifest.close()
+            global_graph.save(GLOBAL_GRAPH_PATH)
+
+        logger.info(f"Completed {completed} documents.")
+        logger.info(f"Stage statistics: {pipeline.stats()}")
+        logger.info(f"Global knowledge graph saved to {GLOBAL_GRAPH_PATH}: {global_graph.stats()}")
+        await asyncio.to_thread(
+            render_html, global_graph.to_knowledge_graph(), GLOBAL_GRAPH_HTML_PATH,
+            assets_dir=ASSETS_PATH, title="Global knowledge graph", cluster_by=CLUSTER_BY_COMMUNITY,
+        )
+        log_run_summary(aggregator)
+        logger.info(f"LLM response cache: {cache.stats()}")
+        for model, usage in llm_service.usage.items():
+            logger.info(f"Token usage for {model}: {usage}")
+        if backend == CHAT:
+            logger.info(f"Final LLM concurrency limit: {limiter.limit:.1f}")
+        return completed
+    finally:
+        write_run_metrics(pipeline, llm_service, profiler.stop(CPU_PROFILE_PATH if profiler.cpu else None))
+
+
+def write_run_metrics(pipeline: Optional[StagedPipeline], llm_service, profile: Dict[str, Any]):
+    """
+    Export the metrics registry and a JSON profile with cost/token rollups and profiler
+    output. `pipeline` and `llm_service` are None if the run failed before creating them.
+    """
+    cost_by_model = metrics.rollup(LLM_COST_USD_TOTAL, by="model")
+    cost_by_stage = metrics.rollup(LLM_COST_USD_TOTAL, by="stage")
+    metrics.write_prometheus(METRICS_PATH)
+    metrics.write_profile(PROFILE_PATH, extra={
+        "stages": pipeline.stats() if pipeline is not None else {},
+        "usage": llm_service.usage if llm_service is not None else {},
+        "cost_usd": {"total": round(sum(cost_by_model.values()), 6), "by_model": cost_by_model, "by_stage": cost_by_stage},
+        # Per kind, since cached tokens are a subset of prompt tokens and must not be summed with them.
+        "tokens_by_stage": {kind: metrics.rollup(LLM_TOKENS_TOTAL, by="stage", kind=kind) for kind in TOKEN_KINDS},
+        **profile,
+    })
+    logger.info(f"Estimated LLM cost: ${sum(cost_by_model.values()):.4f} (by stage: {cost_by_stage})")
+    logger.info(f"Metrics saved to {METRICS_PATH} and {PROFILE_PATH}.")
+
+
+async def judge_worker(queue: asyncio.Queue, evaluator: EvaluationPipeline, sink: ResultSink, progress: tqdm) -> int:
+    """Run the deferred LLM judge on each queued (record id, result) until a `None` sentinel arrives."""
+    judged = 0
+    while True:
+        item = await queue.get()
+        try:
+            if item is None:
+                return judged
+            record_id, result = item
+            try:
+                llm_eval = await evaluator.evaluate_llm(result["document_metadata"]["content"], result["knowledge_graph"])
+            except Exception as e:
+                logger.error(f"❌ Deferred judging failed for {record_id}: {e}")
+                continue
+            result["evaluation"]["llm_eval"] = llm_eval
+            result["evaluation"]["judge"]["pending"] = False
+            sink.write(record_id, result)
+            judged += 1
+            progress.update(1)
+        finally:
+            queue.task_done()
+
+
+async def fill_pending(sink: ResultSink, queue: asyncio.Queue, num_consumers: int):
+    """Queue every saved result still awaiting its deferred judge, then one `None` per consumer."""
+    try:
+        records = await asyncio.to_thread(lambda: [(rid, result) for rid, result in sink.records() if needs_judging(result)])
+        logger.info(f"Judging {len(records)} deferred documents...")
+        for record in records:
+            await queue.put(record)
+    finally:
+        for _ in range(num_consumers):
+            await queue.put(None)
+
+
+async def judge_pending(backend: str = CHAT, sink_kind: str = JSON):
+    """
+    Deferred judging pass: run the LLM judge on every saved result still marked as pending,
+    write the updated result back to the sink, then rebuild the run summary from all results.
+    """
+    cache = ResponseCache(LLM_CACHE_PATH, max_entries=LLM_CACHE_MAX_ENTRIES, max_age_seconds=LLM_CACHE_MAX_AGE_SECONDS)
+    llm_service, num_workers = build_llm_service(backend, cache, build_limiter())
+    evaluator = EvaluationPipeline(llm_service=llm_service, router=ModelRouter.from_json(MODEL_ROUTES, provider=OPENAI))
+    sink = make_sink(sink_kind, OUTPUT_PATH)
+
+    queue: asyncio.Queue = asyncio.Queue(maxsize=2 * num_workers)
+    progress = tqdm(desc="Judging deferred documents", colour="green", unit="doc")
+    producer = asyncio.create_task(fill_pending(sink, queue, num_workers))
+    workers = [asyncio.create_task(judge_worker(queue, evaluator, sink, progress)) for _ in range(num_workers)]
+    try:
+        counts = await asyncio.gather(*workers)
+        await producer
+        await asyncio.to_thread(sink.flush)
+    finally:
+        for task in [producer, *workers]:
+            task.cancel()
+        progress.close()
+        await llm_service.close()
+        cache.close()
+
+    aggregator = EvaluationAggregator()
+    for _, result in sink.records():
+        aggregator.add(result)
+    sink.close()
+    log_run_summary(aggregator)
+    return sum(counts)
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Extract and evaluate knowledge graphs from documents.")
+    parser.add_argument(
+        "--input",
+        default=GENERATION_DIRECTORY,
+        help="Directory of *.json documents, a JSONL file, or '-' to read JSONL from stdin.",
+    )
+    parser.add_argument(
+        "--mode",
+        choices=EXTRACTION_MODES,
+        default=STAGED,
+        help="'staged' runs separate entity, relation and personality calls; 'joint' extracts all three in one call.",
+    )
+    parser.add_argument(
+        "--pack-size",
+        type=int,
+        default=1,
+        help="Pack up to this many short documents into one joint extraction request (1 disables packing).",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=BACKENDS,
+        default=CHAT,
+        help=f"'{BATCH}' submits requests through the provider's batch API for cheaper offline runs; "
+             f"'{LOCAL_BATCH}' uses a file-based stand-in served by `python -m utils.batch {LOCAL_BATCH_DIRECTORY} --model ...`.",
+    )
+    parser.add_argument(
+        "--sink",
+        choices=SINKS,
+        default=JSON,
+        help="Output store: one JSON file per document, an append-only JSONL file with an offset index, "
+             "or Parquet document/node/edge/evaluation tables (requires pyarrow).",
+    )
+    parser.add_argument(
+        "--judge",
+        choices=JUDGE_MODES,
+        default=JUDGE_ALL,
+        help="Which documents get the LLM judge: all, a stratified 'sample', documents with entity F1 below "
+             "--judge-f1-threshold ('threshold', plus a --judge-sample-rate sample of the rest), or none.",
+    )
+    parser.add_argument("--judge-sample-rate", type=float, default=0.1)
+    parser.add_argument("--judge-f1-threshold", type=float, default=0.7)
+    parser.add_argument(
+        "--defer-judge",
+        action="store_true",
+        help="Only mark selected documents for judging; run them later with --judge-pending.",
+    )
+    parser.add_argument(
+        "--judge-pending",
+        action="store_true",
+        help="Run the deferred LLM-judge pass over saved outputs instead of processing documents.",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help=f"Profile CPU time with cProfile; the top functions go into {PROFILE_PATH} and the raw data into {CPU_PROFILE_PATH}.",
+    )
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help=f"Track peak memory and the top allocation sites with tracemalloc (reported in {PROFILE_PATH}).",
+    )
+    parser.add_argument("--log-level", choices=LOG_LEVELS, help="Overrides the LOG_LEVEL environment variable (default INFO).")
+    parser.add_argument("--log-format", choices=LOG_FORMATS, help="Overrides LOG_FORMAT: coloured 'text' or one JSON object per line.")
+    args = parser.parse_args()
+    configure_logging(level=args.log_level, fmt=args.log_format)
+
+    if args.judge_pending:
+        asyncio.run(judge_pending(backend=args.backend, sink_kind=args.sink))
+    else:
+        policy = JudgePolicy(args.judge, sample_rate=args.judge_sample_rate, f1_threshold=args.judge_f1_threshold, defer=args.defer_judge)
+        asyncio.run(main(source=args.input, mode=args.mode, backend=args.backend, judge_policy=policy, sink_kind=args.sink, pack_size=args.pack_size,
+                         profiler=Profiler(cpu=args.profile, memory=args.trace_memory)))
@@ -1,17 +1,25 @@
 import asyncio
-from typing import List
+from typing import Dict, List, Optional, Tuple
 from utils.llm import BaseLLMService
-from utils.constants import GPT_4O
 from utils.logger import logger
+from utils.routing import ModelRouter, ENTITIES_STAGE, RELATIONS_STAGE, PERSONALITY_STAGE, JOINT_STAGE
 from pydantic import BaseModel
 
 from orchestrator.response_models import Entity, Relation, KnowledgeGraph, EntityType
+from orchestrator.messages import build_messages
+from orchestrator.chunking import TRAITS_MARKER, chunk_text, merge_knowledge_graphs
 from orchestrator.prompts import (
     ENTITY_EXTRACTION_SYSTEM_PROMPT,
     RELATION_EXTRACTION_SYSTEM_PROMPT,
     PERSONALITY_INFERENCE_SYSTEM_PROMPT,
+    JOINT_EXTRACTION_SYSTEM_PROMPT,
+    PACKED_EXTRACTION_SYSTEM_PROMPT,
 )
 
+STAGED = "staged"
+JOINT = "joint"
+EXTRACTION_MODES = (STAGED, JOINT)
+
 
 class EntityExtractionResponse(BaseModel):
     entities: List[Entity]
@@ -24,14 +32,87 @@ class RelationExtractionResponse(BaseModel):
 class PersonalityInferenceResponse(BaseModel):
     personality_map: dict  # {entity_name: [traits]}
 
+
+class JointExtractionResponse(BaseModel):
+    entities: List[Entity]
+    relations: List[Relation]
+    personality_map: dict  # {entity_name: [traits]}
+
+
+class PackedDocumentExtraction(JointExtractionResponse):
+    document_id: str
+
+
+class PackedExtractionResponse(BaseModel):
+    documents: List[PackedDocumentExtraction]
+
 class KnowledgeGraphExtractor:
-    """Extract a KnowledgeGraph (entities + relations) from text using LLM reasoning."""
+    """
+    Extract a KnowledgeGraph (entities + relations) from text using LLM reasoning.
+
+    Modes:
+        staged: entities first, then relations and personalities in parallel (3 calls).
+        joint: entities, relations and personalities in a single structured call.
+
+    Texts longer than `chunk_size` characters are split into overlapping chunks that
+    are extracted in parallel and merged into one graph. Set `chunk_size=None` to disable.
 
-    def __init__(self, llm_service: BaseLLMService):
+    Models are chosen per stage by `router` (GPT-4o everywhere by default).
+
+    With `pack_size > 1`, texts of at most `pack_max_chars` characters that arrive
+    within `pack_wait` seconds of each other are packed, up to `pack_size` at a time,
+    into one joint-extraction request keyed by document id, so short documents share
+    the system prompt and per-request overhead. Documents the packed response does
+    not cover are re-extracted on their own.
+    """
+
+    def __init__(
+        self,
+        llm_service: BaseLLMService,
+        mode: str = STAGED,
+        chunk_size: Optional[int] = 12000,
+        chunk_overlap: int = 1000,
+        router: Optional[ModelRouter] = None,
+        pack_size: int = 1,
+        pack_max_chars: int = 3000,
+        pack_wait: float = 0.05,
+    ):
+        if mode not in EXTRACTION_MODES:
+            raise ValueError(f"Unknown extraction mode '{mode}'. Expected one of {EXTRACTION_MODES}.")
         self.llm_service = llm_service
+        self.router = router or ModelRouter()
+        self.mode = mode
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.pack_size = pack_size
+        self.pack_max_chars = pack_max_chars
+        self.pack_wait = pack_wait
+
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._packs: set = set()
 
     async def extract(self, text: str) -> KnowledgeGraph:
         """Main pipeline — extract entities, relations, and enrich descriptions."""
+        if self.pack_size > 1 and len(text) <= self.pack_max_chars:
+            return await self._extract_packed(text)
+
+        if self.chunk_size is None or len(text) <= self.chunk_size:
+            return await self._extract_single(text)
+
+        chunks = chunk_text(text, self.chunk_size, self.chunk_overlap)
+        logger.debug(f"Extracting from {len(chunks)} chunks in parallel...")
+
+        graphs = await asyncio.gather(*(self._extract_single(chunk) for chunk in chunks))
+        merged = merge_knowledge_graphs(list(graphs))
+
+        logger.debug(f"Merged {sum(len(g.nodes) for g in graphs)} chunk entities into {len(merged.nodes)}.")
+        return merged
+
+    async def _extract_single(self, text: str) -> KnowledgeGraph:
+        if self.mode == JOINT:
+            return await self._extract_joint(text)
+
         entities = await self._extract_entities(text)
         
         relations_task = asyncio.create_task(self._extract_relations(text, entities))
@@ -44,14 +125,13 @@ class KnowledgeGraphExtractor:
     async def _extract_entities(self, text: str) -> List[Entity]:
         logger.debug("Extracting entities...")
 
-        messages = [
-            {"role": "system", "content": ENTITY_EXTRACTION_SYSTEM_PROMPT},
-            {"role": "user", "content": text},
-        ]
-        response: EntityExtractionResponse = await self.llm_service.call_llm_structured(
-            model=GPT_4O,
+        messages = build_messages(text, ENTITY_EXTRACTION_SYSTEM_PROMPT)
+        response: EntityExtractionResponse = await self.router.call_structured(
+            self.llm_service,
+            ENTITIES_STAGE,
             messages=messages,
             response_format=EntityExtractionResponse,
+            accept=lambda r: bool(r.entities),
         )
 
         if not hasattr(response, 'entities') or not response.entities:
@@ -64,17 +144,16 @@ class KnowledgeGraphExtractor:
 
     async def _extract_relations(self, text: str, entities: List[Entity]) -> List[Relation]:
         entity_names = ", ".join(e.name for e in entities)
-        messages = [
-            {"role": "system", "content": RELATION_EXTRACTION_SYSTEM_PROMPT},
-            {"role": "user", "content": f"Entities: {entity_names}\n\nText:\n{text}"},
-        ]
+        messages = build_messages(text, RELATION_EXTRACTION_SYSTEM_PROMPT, f"Entities: {entity_names}")
 
         logger.debug("Extracting relations...")
 
-        response: RelationExtractionResponse = await self.llm_service.call_llm_structured(
-            model=GPT_4O,
+        response: RelationExtractionResponse = await self.router.call_structured(
+            self.llm_service,
+            RELATIONS_STAGE,
             messages=messages,
             response_format=RelationExtractionResponse,
+            accept=lambda r: bool(r.relations) or len(entities) < 2,
         )
 
         if not hasattr(response, 'relations') or not response.relations:
@@ -91,28 +170,137 @@ class KnowledgeGraphExtractor:
             return entities  # skip if no people
 
         people_names = [p.name for p in person_entities]
-        messages = [
-            {"role": "system", "content": PERSONALITY_INFERENCE_SYSTEM_PROMPT},
-            {"role": "user", "content": f"People: {people_names}\n\nText:\n{text}"},
-        ]
+        messages = build_messages(text, PERSONALITY_INFERENCE_SYSTEM_PROMPT, f"People: {people_names}")
 
         logger.debug("Inferring personality traits...")
 
-        response: PersonalityInferenceResponse = await self.llm_service.call_llm_structured(
-            model=GPT_4O,
+        response: PersonalityInferenceResponse = await self.router.call_structured(
+            self.llm_service,
+            PERSONALITY_STAGE,
             messages=messages,
             response_format=PersonalityInferenceResponse,
+            accept=lambda r: bool(r.personality_map),
         )
 
         if not hasattr(response, 'personality_map') or not response.personality_map:
             logger.warning("No personality traits inferred.")
             return entities
 
-        # attach traits to Entity.description
+        return self._attach_traits(entities, response.personality_map)
+
+    async def _extract_joint(self, text: str) -> KnowledgeGraph:
+        messages = build_messages(text, JOINT_EXTRACTION_SYSTEM_PROMPT)
+
+        logger.debug("Extracting entities, relations and personality traits jointly...")
+
+        response: JointExtractionResponse = await self.router.call_structured(
+            self.llm_service,
+            JOINT_STAGE,
+            messages=messages,
+            response_format=JointExtractionResponse,
+            accept=lambda r: bool(r.entities),
+        )
+
+        if not hasattr(response, 'entities') or not response.entities:
+            logger.warning("No entities extracted from the text.")
+            return KnowledgeGraph(nodes=[], edges=[])
+
+        logger.debug(f"Extracted {len(response.entities)} entities and {len(response.relations)} relations.")
+
+        entities = self._attach_traits(response.entities, response.personality_map or {})
+        return KnowledgeGraph(nodes=entities, edges=response.relations)
+
+    async def _extract_packed(self, text: str) -> KnowledgeGraph:
+        """Queue `text` for the next pack and wait for its graph."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+
+        if len(self._pending) >= self.pack_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.pack_wait, self._flush)
+
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+
+        pack, self._pending = self._pending, []
+        task = asyncio.create_task(self._run_pack(pack))
+        self._packs.add(task)
+        task.add_done_callback(self._packs.discard)
+
+    async def _run_pack(self, pack: List[Tuple[str, asyncio.Future]]):
+        graphs: Dict[int, KnowledgeGraph] = {}
+        try:
+            if len(pack) > 1:
+                graphs = await self._extract_pack([text for text, _ in pack])
+        except Exception as e:
+            logger.warning(f"Packed extraction of {len(pack)} documents failed: {e}")
+
+        missing = [i for i in range(len(pack)) if i not in graphs]
+        if missing and len(pack) > 1:
+            logger.debug(f"Falling back to single-document extraction for {len(missing)} of {len(pack)} packed documents.")
+        results = await asyncio.gather(*(self._extract_single(pack[i][0]) for i in missing), return_exceptions=True)
+        graphs.update(zip(missing, results))
+
+        for i, (_, future) in enumerate(pack):
+            if future.done():
+                continue
+            if isinstance(graphs[i], BaseException):
+                future.set_exception(graphs[i])
+            else:
+                future.set_result(graphs[i])
+
+    async def _extract_pack(self, texts: List[str]) -> Dict[int, KnowledgeGraph]:
+        """
+        One joint extraction over `texts`, returning the graph of each document the
+        response covers (by index). Documents with an unknown, duplicated or empty
+        entry are left out so the caller can extract them individually.
+        """
+        ids = [f"D{i + 1}" for i in range(len(texts))]
+        packed = "\n\n".join(f'<document id="{doc_id}">\n{text}\n</document>' for doc_id, text in zip(ids, texts))
+        messages = build_messages(packed, PACKED_EXTRACTION_SYSTEM_PROMPT)
+
+        logger.debug(f"Extracting {len(texts)} packed documents jointly...")
+
+        response: PackedExtractionResponse = await self.router.call_structured(
+            self.llm_service,
+            JOINT_STAGE,
+            messages=messages,
+            response_format=PackedExtractionResponse,
+            accept=lambda r: {d.document_id for d in r.documents} >= set(ids),
+        )
+        if response is None:
+            return {}
+
+        by_id: Dict[str, List[PackedDocumentExtraction]] = {}
+        for extraction in response.documents:
+            by_id.setdefault(extraction.document_id.strip(), []).append(extraction)
+
+        graphs = {}
+        for i, doc_id in enumerate(ids):
+            extractions = by_id.get(doc_id, [])
+            if len(extractions) != 1 or not extractions[0].entities:
+                continue
+            extraction = extractions[0]
+            entities = self._attach_traits(extraction.entities, extraction.personality_map or {})
+            graphs[i] = KnowledgeGraph(nodes=entities, edges=extraction.relations)
+
+        logger.debug(f"Packed extraction covered {len(graphs)} of {len(texts)} documents.")
+        return graphs
+
+    def _attach_traits(self, entities: List[Entity], personality_map: dict) -> List[Entity]:
+        """Append inferred traits to Entity.description."""
         for entity in entities:
-            if entity.name in response.personality_map:
-                traits = response.personality_map[entity.name]
-                trait_text = f"Personality traits: {', '.join(traits)}"
+            if entity.name in personality_map:
+                traits = personality_map[entity.name]
+                trait_text = f"{TRAITS_MARKER} {', '.join(traits)}"
                 entity.description = (entity.description or "") + " " + trait_text
 
         return entities
@@ -0,0 +1,245 @@
+import os
+import json
+import math
+from collections import defaultdict
+from typing import Any, Dict, Optional, Sequence
+
+from .response_models import EntityType
+
+Z_95 = 1.959964
+
+
+class P2Quantile:
+    """
+    Streaming quantile estimate in O(1) memory (the P² algorithm of Jain & Chlamtac).
+    Exact for the first five observations.
+    """
+
+    def __init__(self, q: float):
+        self.q = q
+        self.count = 0
+        self.heights: list = []
+        self.positions = [1, 2, 3, 4, 5]
+        self.desired = [1, 1 + 2 * q, 1 + 4 * q, 3 + 2 * q, 5]
+        self.increments = [0, q / 2, q, (1 + q) / 2, 1]
+
+    def add(self, x: float):
+        self.count += 1
+        if len(self.heights) < 5:
+            self.heights.append(x)
+            self.heights.sort()
+            return
+
+        h = self.heights
+        if x < h[0]:
+            h[0] = x
+            k = 0
+        elif x >= h[4]:
+            h[4] = x
+            k = 3
+        else:
+            k = next(i for i in range(4) if h[i] <= x < h[i + 1])
+
+        for i in range(k + 1, 5):
+            self.positions[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+
+        for i in range(1, 4):
+            d = self.desired[i] - self.positions[i]
+            if (d >= 1 and self.positions[i + 1] - self.positions[i] > 1) or (d <= -1 and self.positions[i - 1] - self.positions[i] < -1):
+                step = 1 if d > 0 else -1
+                candidate = self._parabolic(i, step)
+                if not h[i - 1] < candidate < h[i + 1]:
+                    candidate = h[i] + step * (h[i + step] - h[i]) / (self.positions[i + step] - self.positions[i])
+                h[i] = candidate
+                self.positions[i] += step
+
+    def _parabolic(self, i: int, step: int) -> float:
+        h, n = self.heights, self.positions
+        return h[i] + step / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + step) * (h[i + 1] - h[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - step) * (h[i] - h[i - 1]) / (n[i] - n[i - 1])
+        )
+
+    def value(self) -> Optional[float]:
+        if not self.heights:
+            return None
+        # `heights` always holds five markers once full, so count observations to know when it is exact.
+        if self.count <= 5:
+            ordered = sorted(self.heights)
+            return ordered[min(len(ordered) - 1, int(round(self.q * (len(ordered) - 1))))]
+        return self.heights[2]
+
+
+class RunningStats:
+    """Streaming count/mean/variance (Welford), min/max, quantiles and a 95% confidence interval for the mean."""
+
+    def __init__(self, quantiles: Sequence[float] = (0.1, 0.5, 0.9)):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.quantiles = {q: P2Quantile(q) for q in quantiles}
+
+    def add(self, x: float):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (x - self.mean)
+        self.min = min(self.min, x)
+        self.max = max(self.max, x)
+        for estimator in self.quantiles.values():
+            estimator.add(x)
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self._m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        if not self.count:
+            return {"count": 0}
+        half_width = Z_95 * self.std / math.sqrt(self.count)
+        result = {
+            "count": self.count,
+            "mean": round(self.mean, 4),
+            "std": round(self.std, 4),
+            "ci95": [round(self.mean - half_width, 4), round(self.mean + half_width, 4)],
+            "min": round(self.min, 4),
+            "max": round(self.max, 4),
+        }
+        for q, estimator in self.quantiles.items():
+            result[f"p{int(q * 100)}"] = round(estimator.value(), 4)
+        return result
+
+
+class EvaluationAggregator:
+    """
+    Corpus-level summary of a run, updated one document result at a time.
+
+    Feed it the combined output of each document (`document_metadata`,
+    `knowledge_graph`, `evaluation`) as it completes; `summary()` reports
+    per-metric streaming statistics and per-entity-type breakdowns without
+    holding any document in memory.
+
+    When only a sample of documents is LLM-judged, `llm_eval_estimate` gives the
+    stratified corpus-level estimate of each judge metric with its standard error,
+    using the per-stratum document counts recorded by the judge policy.
+    """
+
+    def __init__(self):
+        self.documents = 0
+        self.failures = 0
+        self.evaluation_failures = 0
+        self.metrics: Dict[str, RunningStats] = defaultdict(RunningStats)
+        self.nodes_per_document: Dict[str, RunningStats] = defaultdict(RunningStats)
+        self.type_counts: Dict[str, Dict[str, int]] = defaultdict(lambda: {"generated": 0, "matched": 0})
+        self.stratum_sizes: Dict[str, int] = defaultdict(int)
+        self.judged: Dict[str, Dict[str, RunningStats]] = defaultdict(lambda: defaultdict(RunningStats))
+
+    def add(self, result: Dict[str, Any]):
+        self.documents += 1
+        evaluation = result.get("evaluation") or {}
+        if result.get("knowledge_graph") is None or "error" in evaluation:
+            self.failures += 1
+            return
+
+        if "evaluation_error" in evaluation:
+            # Extracted but not scored: the graph counts towards the node statistics only.
+            self.evaluation_failures += 1
+        else:
+            self._add_evaluation(evaluation)
+
+        type_totals: Dict[str, int] = defaultdict(int)
+        for node in result["knowledge_graph"].get("nodes", []):
+            type_totals[getattr(node.get("type"), "value", node.get("type"))] += 1
+        for entity_type in EntityType:
+            self.nodes_per_document[entity_type.value].add(type_totals.get(entity_type.value, 0))
+
+    def _add_evaluation(self, evaluation: Dict[str, Any]):
+        for section in ("supervised_eval", "llm_eval"):
+            for name, value in (evaluation.get(section) or {}).items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    self.metrics[f"{section}.{name}"].add(float(value))
+
+        stratum = (evaluation.get("judge") or {}).get("stratum", "all")
+        self.stratum_sizes[stratum] += 1
+        for name, value in (evaluation.get("llm_eval") or {}).items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                self.judged[stratum][name].add(float(value))
+
+        per_type = (evaluation.get("supervised_eval") or {}).get("per_type") or {}
+        for entity_type, counts in per_type.items():
+            self.type_counts[entity_type]["generated"] += counts.get("generated", 0)
+            self.type_counts[entity_type]["matched"] += counts.get("matched", 0)
+
+    def llm_eval_estimate(self) -> Dict[str, Any]:
+        """
+        Stratified estimate of each LLM-judge metric's corpus mean. Strata without any
+        judged document are excluded; `coverage` is the fraction of documents in strata
+        that contributed, so it is 1.0 whenever the estimate speaks for the whole corpus.
+
+        A sampled stratum with a single judged document has no variance estimate. Such
+        strata are listed in `unknown_variance_strata`, and `stderr` and `ci95` are None
+        rather than understated.
+        """
+        metric_names = sorted({name for stats in self.judged.values() for name in stats})
+        estimates = {}
+        for name in metric_names:
+            covered = {s: self.judged[s][name] for s in self.stratum_sizes if self.judged[s][name].count}
+            covered_size = sum(self.stratum_sizes[s] for s in covered)
+            estimate, variance = 0.0, 0.0
+            unknown_variance = []
+            for stratum, stats in covered.items():
+                size = self.stratum_sizes[stratum]
+                weight = size / covered_size
+                estimate += weight * stats.mean
+                finite_population = max(0.0, 1 - stats.count / size)
+                if finite_population == 0.0:
+                    continue  # every document in the stratum was judged
+                if stats.count < 2:
+                    unknown_variance.append(stratum)
+                    continue
+                variance += weight ** 2 * finite_population * stats.std ** 2 / stats.count
+            stderr = None if unknown_variance else math.sqrt(variance)
+            estimates[name] = {
+                "estimate": round(estimate, 4),
+                "stderr": round(stderr, 4) if stderr is not None else None,
+                "ci95": [round(estimate - Z_95 * stderr, 4), round(estimate + Z_95 * stderr, 4)] if stderr is not None else None,
+                "judged": sum(stats.count for stats in covered.values()),
+                "coverage": round(covered_size / sum(self.stratum_sizes.values()), 4),
+                "unknown_variance_strata": sorted(unknown_variance),
+            }
+        return estimates
+
+    def summary(self) -> Dict[str, Any]:
+        entity_types = {}
+        for entity_type, stats in sorted(self.nodes_per_document.items()):
+            counts = self.type_counts.get(entity_type, {"generated": 0, "matched": 0})
+            entity_types[entity_type] = {
+                "nodes_per_document": stats.summary(),
+                "generated": counts["generated"],
+                "matched": counts["matched"],
+                "precision": round(counts["matched"] / counts["generated"], 4) if counts["generated"] else None,
+            }
+
+        return {
+            "documents": self.documents,
+            "failures": self.failures,
+            "evaluation_failures": self.evaluation_failures,
+            "metrics": {name: stats.summary() for name, stats in sorted(self.metrics.items())},
+            "entity_types": entity_types,
+            "llm_eval_estimate": self.llm_eval_estimate(),
+            "judge_strata": dict(sorted(self.stratum_sizes.items())),
+        }
+
+    def write(self, path: str):
+        """Atomically write the summary report to `path`."""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.summary(), f, indent=2)
+        os.replace(tmp_path, path)
@@ -0,0 +1,166 @@
+import re
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+from orchestrator.response_models import Entity, EntityType, KnowledgeGraph, Relation
+
+TRAITS_MARKER = "Personality traits:"
+
+HONORIFICS = {"dr", "mr", "mrs", "ms", "miss", "prof", "professor", "sir", "dame", "the"}
+CORPORATE_SUFFIXES = {"inc", "ltd", "llc", "corp", "corporation", "co", "plc", "gmbh", "ag", "sa"}
+
+# Preferred split points, strongest first; a chunk never ends before half its maximum size.
+BOUNDARIES = ("\n\n", "\n", ". ", "? ", "! ", " ")
+
+
+def chunk_text(text: str, chunk_size: int, overlap: int = 0) -> List[str]:
+    """
+    Split `text` into windows of at most `chunk_size` characters, each overlapping
+    the previous one by roughly `overlap` characters. Chunks end on paragraph,
+    sentence or word boundaries where possible.
+    """
+    if len(text) <= chunk_size:
+        return [text]
+
+    overlap = min(overlap, chunk_size // 2)
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + chunk_size, len(text))
+        if end < len(text):
+            floor = start + chunk_size // 2
+            for boundary in BOUNDARIES:
+                cut = text.rfind(boundary, floor, end)
+                if cut != -1:
+                    end = cut + len(boundary)
+                    break
+
+        chunks.append(text[start:end].strip())
+        if end >= len(text):
+            break
+
+        next_start = end - overlap
+        if overlap:
+            space = text.find(" ", next_start, end)
+            next_start = space + 1 if space != -1 else next_start
+        start = max(next_start, start + 1)
+
+    return [chunk for chunk in chunks if chunk]
+
+
+def normalize_name(name: str) -> str:
+    """Canonical key for an entity name: lowercase, no punctuation, honorifics or corporate suffixes."""
+    tokens = re.sub(r"[^\w\s]", " ", name.lower()).split()
+    stripped = [t for t in tokens if t not in HONORIFICS and t not in CORPORATE_SUFFIXES]
+    return " ".join(stripped or tokens)
+
+
+def normalize_relation(relation: str) -> str:
+    """Canonical key for a relation label, e.g. "Works at" -> "works_at"."""
+    return relation.strip().lower().replace(" ", "_")
+
+
+def split_description(description: Optional[str]) -> tuple[str, List[str]]:
+    """Separate a node description into its free text and the traits appended by personality inference."""
+    if not description:
+        return "", []
+    if TRAITS_MARKER not in description:
+        return description.strip(), []
+    text, traits = description.split(TRAITS_MARKER, 1)
+    return text.strip(), [t.strip() for t in traits.split(",") if t.strip()]
+
+
+def join_description(text: str, traits: List[str]) -> Optional[str]:
+    if traits:
+        return f"{text} {TRAITS_MARKER} {', '.join(traits)}".strip()
+    return text or None
+
+
+def resolve_aliases(keys_by_type: Dict[EntityType, List[str]]) -> Dict[str, str]:
+    """
+    Map short names onto the unique longer name of the same type that contains all
+    of their tokens (e.g. "carter" -> "emily carter"). Ambiguous aliases are left alone.
+    """
+    aliases = {}
+    for keys in keys_by_type.values():
+        token_sets = {key: set(key.split()) for key in keys}
+        for key, tokens in token_sets.items():
+            supersets = [other for other, other_tokens in token_sets.items() if other != key and tokens < other_tokens]
+            if len(supersets) == 1:
+                aliases[key] = supersets[0]
+
+    # Collapse chains (a -> b -> c) so every alias points at a name that is not itself an alias.
+    for key, target in aliases.items():
+        while target in aliases:
+            target = aliases[target]
+        aliases[key] = target
+    return aliases
+
+
+def merge_knowledge_graphs(graphs: List[KnowledgeGraph]) -> KnowledgeGraph:
+    """
+    Reduce per-chunk graphs into one: entities are grouped by normalised name and
+    alias, descriptions and traits are unioned, and relations are rewritten onto
+    the canonical names and deduplicated.
+    """
+    names: Dict[str, List[str]] = defaultdict(list)
+    types: Dict[str, Counter] = defaultdict(Counter)
+    texts: Dict[str, List[str]] = defaultdict(list)
+    traits: Dict[str, Dict[str, None]] = defaultdict(dict)
+
+    for graph in graphs:
+        for node in graph.nodes:
+            key = normalize_name(node.name)
+            names[key].append(node.name)
+            types[key][node.type] += 1
+            text, node_traits = split_description(node.description)
+            if text and text not in texts[key]:
+                texts[key].append(text)
+            for trait in node_traits:
+                traits[key].setdefault(trait, None)
+
+    def majority_type(key: str) -> EntityType:
+        known = [(t, n) for t, n in types[key].most_common() if t != EntityType.UNKNOWN]
+        return known[0][0] if known else EntityType.UNKNOWN
+
+    keys_by_type: Dict[EntityType, List[str]] = defaultdict(list)
+    for key in names:
+        keys_by_type[majority_type(key)].append(key)
+    aliases = resolve_aliases(keys_by_type)
+
+    # Fold aliased keys into their canonical key.
+    for alias, canonical in aliases.items():
+        names[canonical].extend(names.pop(alias))
+        types[canonical].update(types.pop(alias))
+        texts[canonical].extend(t for t in texts.pop(alias, []) if t not in texts[canonical])
+        for trait in traits.pop(alias, {}):
+            traits[canonical].setdefault(trait, None)
+
+    display_names = {key: max(variants, key=len) for key, variants in names.items()}
+
+    nodes = []
+    for key, display_name in display_names.items():
+        text = max(texts.get(key, []), key=len, default="")
+        nodes.append(Entity(
+            name=display_name,
+            type=majority_type(key),
+            description=join_description(text, list(traits.get(key, {}))),
+        ))
+
+    def canonical_name(name: str) -> str:
+        key = normalize_name(name)
+        key = aliases.get(key, key)
+        return display_names.get(key, name)
+
+    edges = []
+    seen = set()
+    for graph in graphs:
+        for edge in graph.edges:
+            source, target = canonical_name(edge.source), canonical_name(edge.target)
+            relation_key = (source, normalize_relation(edge.relation), target)
+            if source == target or relation_key in seen:
+                continue
+            seen.add(relation_key)
+            edges.append(Relation(source=source, relation=edge.relation, target=target))
+
+    return KnowledgeGraph(nodes=nodes, edges=edges)
@@ -1,27 +1,37 @@
-from typing import List, Dict, Any
-from difflib import SequenceMatcher
+import json
+from typing import List, Dict, Any, Optional
+
+import numpy as np
 
 from utils.llm import BaseLLMService
-from utils.constants import GPT_4O
+from utils.embeddings import TextEmbedder
 from utils.logger import logger
+from utils.routing import ModelRouter, JUDGE_STAGE
 
 from .response_models import LLMJudgeEvalResponse
+from .prompts import LLM_JUDGE_SYSTEM_PROMPT
+from .messages import build_messages
+from .matching import match_entities
+from .chunking import split_description
 
 
 class EvaluationPipeline:
-    def __init__(self, llm_service: BaseLLMService):
+    def __init__(self, llm_service: BaseLLMService, router: Optional[ModelRouter] = None, embedder: Optional[TextEmbedder] = None):
         self.llm_service = llm_service
+        self.router = router or ModelRouter()
+        self.embedder = embedder
 
     # ---------------------- SUPERVISED EVAL ----------------------
-    def evaluate_supervised(self, document: Dict[str, Any], generated_kg: Dict[str, Any]) -> Dict[str, float]:
+    async def evaluate_supervised(self, document: Dict[str, Any], generated_kg: Dict[str, Any]) -> Dict[str, Any]:
         """
         Compare synthetic document 'plan' vs generated KG entities & traits.
-        Returns similarity metrics.
+        Traits are compared semantically when an embedder is configured, otherwise by exact-match Jaccard.
+        Returns similarity metrics, plus generated/matched node counts per entity type.
         """
         gt_entities = [e["name"].lower() for e in document["plan"]["entities"]]
         gen_entities = [e["name"].lower() for e in generated_kg["nodes"]]
 
-        # Entity match (using fuzzy ratio > 0.8)
+        # Entity match (optimal one-to-one assignment on fuzzy ratio >= 0.8)
         entity_matches = self._fuzzy_match(gt_entities, gen_entities)
         entity_recall = len(entity_matches) / len(gt_entities) if gt_entities else 0
         entity_precision = len(entity_matches) / len(gen_entities) if gen_entities else 0
@@ -29,13 +39,25 @@ class EvaluationPipeline:
         # Personality/traits comparison
         gt_traits = {e["name"].lower(): e["traits"] for e in document["plan"]["entities"]}
         gen_traits = self._extract_traits(generated_kg)
-        trait_similarity = self._trait_similarity(gt_traits, gen_traits)
+        trait_similarity = await self._trait_similarity(gt_traits, gen_traits)
+
+        # Per-entity-type breakdown of generated vs matched nodes
+        gen_types = [getattr(e.get("type"), "value", e.get("type")) for e in generated_kg["nodes"]]
+        matched_gen = {gen for _, gen in entity_matches}
+        per_type: Dict[str, Dict[str, int]] = {}
+        for name, entity_type in zip(gen_entities, gen_types):
+            counts = per_type.setdefault(entity_type, {"generated": 0, "matched": 0})
+            counts["generated"] += 1
+            if name in matched_gen:
+                counts["matched"] += 1
+                matched_gen.discard(name)
 
         result = {
             "entity_precision": round(entity_precision, 3),
             "entity_recall": round(entity_recall, 3),
             "entity_f1": round(2 * entity_precision * entity_recall / (entity_precision + entity_recall + 1e-9), 3),
-            "trait_similarity": round(trait_similarity, 3)
+            "trait_similarity": round(trait_similarity, 3),
+            "per_type": per_type,
         }
 
         logger.debug(f"Supervised Evaluation Results: {result}")
@@ -47,92 +69,79 @@ class EvaluationPipeline:
         """
         Ask an LLM to strictly assess the quality of the generated KG relative to the input text.
         Returns a structured response using call_llm_structured().
+        The graph is sent as compact JSON, which is both clearer and cheaper than its Python repr.
         """
 
-        system_prompt = """
-        You are a critical evaluator specializing in verifying Knowledge Graph quality.
-
-        Evaluate the given Knowledge Graph against the input document based on the following strict criteria:
-
-        1. **Entity Coverage (0–10)** — Did the graph capture ALL important entities (people, organizations, products, events, concepts)? 
-           Deduct points for missing or redundant nodes.
-
-        2. **Relation Correctness (0–10)** — Are the relations logically and semantically valid, AND directly or implicitly supported by the text?
-           Deduct points for:
-           - hallucinated relations
-           - vague or generic relations (“associated_with” without context)
-           - missing key causal or ownership relations
-
-        3. **Personality Coherence (0–10)** — For human entities, are inferred personality traits justified by actions or tone in the text?
-           Deduct points if traits are unsupported, generic, or inconsistent.
-
-        4. **Factual Alignment (0–10)** — Does every node and edge correspond to something *factually* supported by the text?
-           Deduct points for fabricated or misrepresented details.
-
-        5. **Logical Consistency (0–10)** — Do all parts of the KG make sense together (no contradictions or cyclic inconsistencies)?
-
-        Finally, compute **Overall Score (0–10)** as a holistic judgment, considering all aspects with a harsher weighting on factual accuracy.
-
-        In your reasoning, cite at least one example for each major deduction.
-        Return strictly structured JSON matching the required schema.
-        """
-
-        prompt = f"""
-        DOCUMENT:
-        {document_text}
-
-        GENERATED_KNOWLEDGE_GRAPH:
-        {generated_kg}
-        """
-
-        messages = [
-            {"role": "system", "content": system_prompt.strip()},
-            {"role": "user", "content": prompt.strip()}
-        ]
+        graph_json = json.dumps(generated_kg, ensure_ascii=False, separators=(",", ":"), default=str)
+        messages = build_messages(document_text, LLM_JUDGE_SYSTEM_PROMPT, f"GENERATED_KNOWLEDGE_GRAPH:\n{graph_json}")
 
         # ✅ Use structured LLM call
-        eval_response: LLMJudgeEvalResponse = await self.llm_service.call_llm_structured(
-            model=GPT_4O,
+        eval_response: LLMJudgeEvalResponse = await self.router.call_structured(
+            self.llm_service,
+            JUDGE_STAGE,
             messages=messages,
-            response_format=LLMJudgeEvalResponse
+            response_format=LLMJudgeEvalResponse,
+            accept=lambda r: bool(r.reasoning.strip()),
         )
 
         logger.debug(f"LLM Judge Evaluation Response: {eval_response}")
 
+        # The service has already logged the failure; the document keeps its graph either way.
+        if eval_response is None:
+            return None
         return eval_response.model_dump()
 
     # ---------------------- Helper Functions ----------------------
 
     def _fuzzy_match(self, gt_list, gen_list, threshold=0.8):
-        matches = []
-        for gt in gt_list:
-            for gen in gen_list:
-                ratio = SequenceMatcher(None, gt, gen).ratio()
-                if ratio >= threshold:
-                    matches.append((gt, gen))
-                    break
-        return matches
+        # One-to-one, so a generated node can no longer count towards several ground-truth entities.
+        return match_entities(gt_list, gen_list, threshold=threshold)
 
     def _extract_traits(self, kg: Dict[str, Any]) -> Dict[str, List[str]]:
         traits = {}
         for node in kg.get("nodes", []):
-            desc = node.get("description", "")
-            if "Personality traits:" in desc:
-                entity = node["name"].lower()
-                traits_list = desc.split("Personality traits:")[-1].split(",")
-                traits[entity] = [t.strip() for t in traits_list if t.strip()]
+            _, node_traits = split_description(node.get("description"))
+            if node_traits:
+                traits[node["name"].lower()] = node_traits
         return traits
 
-    def _trait_similarity(self, gt_traits, gen_traits):
+    async def _trait_similarity(self, gt_traits, gen_traits):
         if not gt_traits:
             return 0.0
 
+        pairs = [(gt_list, gen_traits[entity]) for entity, gt_list in gt_traits.items() if gt_list and gen_traits.get(entity)]
+        if not pairs:
+            return 0.0
+
+        if self.embedder is not None:
+            similarity = await self._semantic_trait_similarity(pairs)
+            if similarity is not None:
+                return similarity
+            logger.warning("Trait embedding failed; falling back to exact-match trait similarity.")
+
         sims = []
-        for entity, gt_list in gt_traits.items():
-            gen_list = gen_traits.get(entity, [])
-            if not gen_list:
-                continue
+        for gt_list, gen_list in pairs:
             overlap = len(set(gt_list).intersection(set(gen_list)))
             union = len(set(gt_list).union(set(gen_list)))
             sims.append(overlap / union if union > 0 else 0)
         return float(sum(sims)/len(sims)) if sims else 0.0
+
+    async def _semantic_trait_similarity(self, pairs) -> Optional[float]:
+        """
+        Mean over entities of the soft F1 between ground-truth and generated traits: each
+        trait is scored by its best cosine match on the other side, and the two directions averaged.
+        All traits of the document are embedded in one batch.
+        """
+        vocabulary = list(dict.fromkeys(t.lower() for gt_list, gen_list in pairs for t in [*gt_list, *gen_list]))
+        vectors = await self.embedder.embed(vocabulary)
+        if vectors is None:
+            return None
+        position = {trait: i for i, trait in enumerate(vocabulary)}
+
+        sims = []
+        for gt_list, gen_list in pairs:
+            gt = vectors[[position[t.lower()] for t in gt_list]]
+            gen = vectors[[position[t.lower()] for t in gen_list]]
+            cosine = np.clip(gt @ gen.T, 0.0, 1.0)
+            sims.append(0.5 * (cosine.max(axis=1).mean() + cosine.max(axis=0).mean()))
+        return float(np.mean(sims))
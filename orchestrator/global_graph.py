@@ -0,0 +1,237 @@
+import os
+import json
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from difflib import SequenceMatcher
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from orchestrator.response_models import Entity, EntityType, KnowledgeGraph, Relation
+from orchestrator.chunking import normalize_name, normalize_relation, split_description, join_description
+
+
+@dataclass
+class GlobalEntity:
+    id: str
+    key: str
+    names: Counter = field(default_factory=Counter)
+    types: Counter = field(default_factory=Counter)
+    text: str = ""
+    traits: Dict[str, None] = field(default_factory=dict)
+    sources: Set[str] = field(default_factory=set)
+
+    @property
+    def name(self) -> str:
+        return self.names.most_common(1)[0][0]
+
+    @property
+    def type(self) -> EntityType:
+        known = [t for t, _ in self.types.most_common() if t != EntityType.UNKNOWN]
+        return known[0] if known else EntityType.UNKNOWN
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "key": self.key,
+            "names": dict(self.names),
+            "types": {t.value: n for t, n in self.types.items()},
+            "text": self.text,
+            "traits": list(self.traits),
+            "sources": sorted(self.sources),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "GlobalEntity":
+        return cls(
+            id=data["id"],
+            key=data["key"],
+            names=Counter(data["names"]),
+            types=Counter({EntityType(t): n for t, n in data["types"].items()}),
+            text=data["text"],
+            traits=dict.fromkeys(data["traits"]),
+            sources=set(data["sources"]),
+        )
+
+
+class GlobalKnowledgeGraph:
+    """
+    Corpus-wide knowledge graph, merged one document graph at a time.
+
+    Each incoming entity is resolved against a blocking index instead of every
+    known entity. An exact normalised-name key is tried first. Failing that, the
+    candidates are entities sharing a name token or 4-character token prefix, and
+    they are scored with difflib's ratio. Blocks larger than `max_block_size`
+    (e.g. a very common surname) are ignored, so merging a document costs
+    O(its nodes). Entities of conflicting known types are never merged. Entities
+    and relations record the ids of the documents they came from.
+    """
+
+    def __init__(self, threshold: float = 0.9, max_block_size: int = 50, version: Optional[str] = None):
+        self.threshold = threshold
+        self.max_block_size = max_block_size
+        self.version = version
+        self.entities: Dict[str, GlobalEntity] = {}
+        self.relations: Dict[Tuple[str, str, str], Dict] = {}
+        self.documents: Set[str] = set()
+        self._by_key: Dict[str, str] = {}
+        self._blocks: Dict[str, Set[str]] = defaultdict(set)
+
+    def __len__(self) -> int:
+        return len(self.entities)
+
+    @staticmethod
+    def _block_keys(key: str) -> Set[str]:
+        tokens = key.split()
+        return {f"t:{t}" for t in tokens} | {f"p:{t[:4]}" for t in tokens if len(t) > 4}
+
+    @staticmethod
+    def _compatible(a: EntityType, b: EntityType) -> bool:
+        return a == b or EntityType.UNKNOWN in (a, b)
+
+    def _candidates(self, key: str) -> Counter:
+        """Entities sharing at least one usable block with `key`, counted by the number of shared blocks."""
+        candidates: Counter = Counter()
+        for block in self._block_keys(key):
+            members = self._blocks.get(block)
+            if members and len(members) <= self.max_block_size:
+                candidates.update(members)
+        return candidates
+
+    def resolve(self, name: str, entity_type: EntityType) -> Optional[str]:
+        """Id of the known entity `name` refers to, or None if it is new."""
+        key = normalize_name(name)
+        entity_id = self._by_key.get(key)
+        if entity_id is not None and self._compatible(self.entities[entity_id].type, entity_type):
+            return entity_id
+
+        best_id, best_score = None, self.threshold
+        matcher = SequenceMatcher(None, b=key)
+        for candidate_id, _ in self._candidates(key).most_common():
+            candidate = self.entities[candidate_id]
+            if not self._compatible(candidate.type, entity_type):
+                continue
+            # Cheap upper bounds on the ratio first; most blocked candidates fail them.
+            matcher.set_seq1(candidate.key)
+            if matcher.real_quick_ratio() < best_score or matcher.quick_ratio() < best_score:
+                continue
+            score = matcher.ratio()
+            if score >= best_score:
+                best_id, best_score = candidate_id, score
+        return best_id
+
+    def _add_entity(self, key: str) -> GlobalEntity:
+        entity = GlobalEntity(id=f"e{len(self.entities)}", key=key)
+        self.entities[entity.id] = entity
+        self._by_key.setdefault(key, entity.id)
+        for block in self._block_keys(key):
+            self._blocks[block].add(entity.id)
+        return entity
+
+    def add_graph(self, graph: KnowledgeGraph, source: str) -> Dict[str, str]:
+        """
+        Merge one document's graph, recording `source` as its provenance. Merging the
+        same source twice is a no-op. Returns the mapping from the document's entity
+        names to global entity ids.
+        """
+        if source in self.documents:
+            return {}
+        self.documents.add(source)
+
+        ids: Dict[str, str] = {}
+        for node in graph.nodes:
+            entity_id = self.resolve(node.name, node.type)
+            entity = self.entities[entity_id] if entity_id is not None else self._add_entity(normalize_name(node.name))
+            entity.names[node.name] += 1
+            entity.types[node.type] += 1
+            entity.sources.add(source)
+            text, traits = split_description(node.description)
+            if len(text) > len(entity.text):
+                entity.text = text
+            for trait in traits:
+                entity.traits.setdefault(trait, None)
+            ids[node.name] = entity.id
+
+        for edge in graph.edges:
+            source_id = ids.get(edge.source) or self.resolve(edge.source, EntityType.UNKNOWN)
+            target_id = ids.get(edge.target) or self.resolve(edge.target, EntityType.UNKNOWN)
+            if source_id is None or target_id is None or source_id == target_id:
+                continue
+            relation = normalize_relation(edge.relation)
+            entry = self.relations.setdefault((source_id, relation, target_id), {"label": edge.relation, "sources": set()})
+            entry["sources"].add(source)
+        return ids
+
+    def entity(self, name: str) -> Optional[GlobalEntity]:
+        entity_id = self.resolve(name, EntityType.UNKNOWN)
+        return self.entities.get(entity_id) if entity_id else None
+
+    def to_knowledge_graph(self, min_sources: int = 1) -> KnowledgeGraph:
+        """Snapshot as a `KnowledgeGraph`, keeping entities seen in at least `min_sources` documents."""
+        kept = {eid: e for eid, e in self.entities.items() if len(e.sources) >= min_sources}
+        nodes = [Entity(name=e.name, type=e.type, description=join_description(e.text, list(e.traits))) for e in kept.values()]
+        edges = [
+            Relation(source=kept[s].name, relation=entry["label"], target=kept[t].name)
+            for (s, _, t), entry in self.relations.items()
+            if s in kept and t in kept
+        ]
+        return KnowledgeGraph(nodes=nodes, edges=edges)
+
+    def stats(self) -> Dict[str, int]:
+        return {"documents": len(self.documents), "entities": len(self.entities), "relations": len(self.relations)}
+
+    # ---------------------- Persistence ----------------------
+
+    def save(self, path: str):
+        """Atomically write the graph, including provenance, as JSON."""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        data = {
+            "version": self.version,
+            "threshold": self.threshold,
+            "max_block_size": self.max_block_size,
+            "documents": sorted(self.documents),
+            "entities": [entity.to_dict() for entity in self.entities.values()],
+            "relations": [
+                {"source": s, "relation": r, "target": t, "label": entry["label"], "sources": sorted(entry["sources"])}
+                for (s, r, t), entry in self.relations.items()
+            ],
+        }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "GlobalKnowledgeGraph":
+        with open(path, "r") as f:
+            data = json.load(f)
+        graph = cls(threshold=data["threshold"], max_block_size=data["max_block_size"], version=data.get("version"))
+        graph.documents = set(data["documents"])
+        for entity_data in data["entities"]:
+            entity = GlobalEntity.from_dict(entity_data)
+            graph.entities[entity.id] = entity
+            graph._by_key.setdefault(entity.key, entity.id)
+            for block in graph._block_keys(entity.key):
+                graph._blocks[block].add(entity.id)
+        for rel in data["relations"]:
+            graph.relations[(rel["source"], rel["relation"], rel["target"])] = {"label": rel["label"], "sources": set(rel["sources"])}
+        return graph
+
+    @classmethod
+    def load_or_create(cls, path: str, version: Optional[str] = None, **kwargs) -> "GlobalKnowledgeGraph":
+        """Load the graph saved at `path`, or start a new one if there is none or it was built by another pipeline version."""
+        if os.path.exists(path):
+            graph = cls.load(path)
+            if graph.version == version:
+                return graph
+        return cls(version=version, **kwargs)
+
+    def add_results(self, results: Iterable[Tuple[str, dict]]) -> int:
+        """Merge saved (record id, result) pairs, e.g. from a result sink. Returns the number merged."""
+        merged = 0
+        for record_id, result in results:
+            graph = result.get("knowledge_graph")
+            if graph is not None and record_id not in self.documents:
+                self.add_graph(KnowledgeGraph.model_validate(graph), record_id)
+                merged += 1
+        return merged
@@ -0,0 +1,297 @@
+from collections import defaultdict, deque
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from orchestrator.response_models import Entity, EntityType, KnowledgeGraph, Relation
+from orchestrator.chunking import normalize_name, normalize_relation
+
+OUT = "out"
+IN = "in"
+BOTH = "both"
+
+
+class GraphIndex:
+    """
+    Read-only indexed view of a knowledge graph, built in O(V + E).
+
+    Holds out/in adjacency keyed by entity id, plus indexes from normalised relation
+    (e.g. "works_at") and entity type to their edges and entities, so lookups cost
+    proportional to their result rather than to the graph. An entity's id is its name,
+    unless `node_ids` gives others (see `from_global_graph`); edges refer to entities by
+    id. Entities can be given by id or by name, exactly or in any form that normalises
+    to the same key ("Dr. Emily Carter" / "emily carter").
+    When built from a corpus, each edge also keeps the ids of the documents it came from.
+    """
+
+    def __init__(
+        self,
+        nodes: Iterable[Entity],
+        edges: Iterable[Relation],
+        edge_sources: Optional[Iterable[Set[str]]] = None,
+        node_ids: Optional[Iterable[str]] = None,
+    ):
+        self.nodes: Dict[str, Entity] = {}
+        self.by_type: Dict[EntityType, List[str]] = defaultdict(list)
+        self._by_name: Dict[str, str] = {}
+        self._by_key: Dict[str, str] = {}
+        ids_iter = iter(node_ids) if node_ids is not None else None
+        for node in nodes:
+            node_id = next(ids_iter) if ids_iter is not None else node.name
+            if node_id in self.nodes:
+                continue
+            self.nodes[node_id] = node
+            self.by_type[node.type].append(node_id)
+            self._add_name(node.name, node_id)
+
+        self.edges: List[Relation] = []
+        self.edge_sources: List[Set[str]] = []
+        self.out_edges: Dict[str, List[int]] = defaultdict(list)
+        self.in_edges: Dict[str, List[int]] = defaultdict(list)
+        self.by_relation: Dict[str, List[int]] = defaultdict(list)
+        self._edge_ids: Dict[Tuple[str, str, str], int] = {}
+
+        sources_iter = iter(edge_sources) if edge_sources is not None else None
+        for edge in edges:
+            sources = next(sources_iter) if sources_iter is not None else set()
+            self._add_edge(edge, sources)
+
+    def _add_name(self, name: str, node_id: str):
+        """Resolve `name` to `node_id`; when several entities share a name, the first indexed wins."""
+        self._by_name.setdefault(name, node_id)
+        self._by_key.setdefault(normalize_name(name), node_id)
+
+    def _add_edge(self, edge: Relation, sources: Set[str]):
+        key = (edge.source, normalize_relation(edge.relation), edge.target)
+        edge_id = self._edge_ids.get(key)
+        if edge_id is not None:
+            self.edge_sources[edge_id] |= sources
+            return
+        edge_id = len(self.edges)
+        self._edge_ids[key] = edge_id
+        self.edges.append(edge)
+        self.edge_sources.append(set(sources))
+        self.out_edges[edge.source].append(edge_id)
+        self.in_edges[edge.target].append(edge_id)
+        self.by_relation[key[1]].append(edge_id)
+
+    # ---------------------- Construction ----------------------
+
+    @classmethod
+    def from_knowledge_graph(cls, graph: KnowledgeGraph) -> "GraphIndex":
+        return cls(graph.nodes, graph.edges)
+
+    @classmethod
+    def from_results(cls, results: Iterable[Tuple[str, dict]]) -> "GraphIndex":
+        """
+        Union of saved per-document graphs, e.g. `sink.records()`. Entities are keyed by
+        exact name (first description wins); duplicate edges are merged and keep every source.
+        """
+        nodes: Dict[str, Entity] = {}
+        edges: List[Relation] = []
+        sources: List[Set[str]] = []
+        for record_id, result in results:
+            graph = result.get("knowledge_graph")
+            if graph is None:
+                continue
+            for node in graph.get("nodes", []):
+                if node["name"] not in nodes:
+                    nodes[node["name"]] = Entity.model_validate(node)
+            for edge in graph.get("edges", []):
+                edges.append(Relation.model_validate(edge))
+                sources.append({record_id})
+        return cls(nodes.values(), edges, sources)
+
+    @classmethod
+    def from_global_graph(cls, global_graph) -> "GraphIndex":
+        """
+        Index a `GlobalKnowledgeGraph`, keeping the provenance of its relations. Entities are
+        keyed by their global id ("e12"), so distinct entities sharing a display name stay
+        apart; edges and traversal results refer to those ids, and every name an entity was
+        seen under resolves to it.
+        """
+        nodes = {}
+        for entity_id, entity in global_graph.entities.items():
+            nodes[entity_id] = Entity(name=entity.name, type=entity.type, description=entity.text or None)
+        edges, sources = [], []
+        for (source_id, _, target_id), entry in global_graph.relations.items():
+            edges.append(Relation(source=source_id, relation=entry["label"], target=target_id))
+            sources.append(entry["sources"])
+        index = cls(nodes.values(), edges, sources, node_ids=nodes.keys())
+        for entity_id, entity in global_graph.entities.items():
+            for name, _ in entity.names.most_common():
+                index._add_name(name, entity_id)
+        return index
+
+    # ---------------------- Lookups ----------------------
+
+    def __contains__(self, name: str) -> bool:
+        return self.resolve(name) is not None
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def resolve(self, name: str) -> Optional[str]:
+        """The id of the entity `name` refers to: an id, or a name matched exactly or by normalised name."""
+        if name in self.nodes:
+            return name
+        if name in self._by_name:
+            return self._by_name[name]
+        return self._by_key.get(normalize_name(name))
+
+    def node(self, name: str) -> Optional[Entity]:
+        resolved = self.resolve(name)
+        return self.nodes[resolved] if resolved is not None else None
+
+    def entities_of_type(self, entity_type: EntityType) -> List[Entity]:
+        return [self.nodes[name] for name in self.by_type.get(EntityType(entity_type), [])]
+
+    def edges_with_relation(self, relation: str) -> List[Relation]:
+        return [self.edges[i] for i in self.by_relation.get(normalize_relation(relation), [])]
+
+    def relations(self) -> Dict[str, int]:
+        """Edge count per normalised relation."""
+        return {relation: len(ids) for relation, ids in self.by_relation.items()}
+
+    def _incident(self, name: str, direction: str) -> Iterator[Tuple[int, str]]:
+        """(edge id, neighbour id) pairs for the edges touching `name`."""
+        if direction in (OUT, BOTH):
+            for i in self.out_edges.get(name, []):
+                yield i, self.edges[i].target
+        if direction in (IN, BOTH):
+            for i in self.in_edges.get(name, []):
+                yield i, self.edges[i].source
+
+    def edges_of(self, name: str, direction: str = BOTH, relation: Optional[str] = None) -> List[Relation]:
+        resolved = self.resolve(name)
+        if resolved is None:
+            return []
+        key = normalize_relation(relation) if relation else None
+        return [
+            self.edges[i] for i, _ in self._incident(resolved, direction)
+            if key is None or normalize_relation(self.edges[i].relation) == key
+        ]
+
+    def neighbors(self, name: str, direction: str = BOTH, relation: Optional[str] = None) -> List[str]:
+        """Distinct neighbour ids of `name`, optionally along one relation only."""
+        resolved = self.resolve(name)
+        if resolved is None:
+            return []
+        key = normalize_relation(relation) if relation else None
+        seen: Dict[str, None] = {}
+        for i, neighbor in self._incident(resolved, direction):
+            if key is None or normalize_relation(self.edges[i].relation) == key:
+                seen.setdefault(neighbor, None)
+        return list(seen)
+
+    def sources_of(self, edge: Relation) -> Set[str]:
+        """Documents an edge was extracted from (empty for a single-document graph)."""
+        edge_id = self._edge_ids.get((edge.source, normalize_relation(edge.relation), edge.target))
+        return set(self.edge_sources[edge_id]) if edge_id is not None else set()
+
+    def dangling_edges(self) -> List[Relation]:
+        """Edges whose source or target is not a known entity."""
+        return [edge for edge in self.edges if edge.source not in self.nodes or edge.target not in self.nodes]
+
+    # ---------------------- Traversal ----------------------
+
+    def k_hop(self, name: str, k: int, direction: str = BOTH) -> Dict[str, int]:
+        """Every entity id within `k` hops of `name`, with its hop distance (BFS)."""
+        start = self.resolve(name)
+        if start is None:
+            return {}
+        distances = {start: 0}
+        frontier = deque([start])
+        while frontier:
+            current = frontier.popleft()
+            if distances[current] == k:
+                continue
+            for _, neighbor in self._incident(current, direction):
+                if neighbor not in distances:
+                    distances[neighbor] = distances[current] + 1
+                    frontier.append(neighbor)
+        return distances
+
+    def subgraph(self, names: Iterable[str]) -> KnowledgeGraph:
+        """The induced subgraph on `names`, as a `KnowledgeGraph` (whose edges refer to entity names)."""
+        keep = {resolved for resolved in map(self.resolve, names) if resolved is not None}
+        nodes = [self.nodes[node_id] for node_id in keep if node_id in self.nodes]
+        edges = []
+        for node_id in keep:
+            for i in self.out_edges.get(node_id, []):
+                edge = self.edges[i]
+                if edge.target in keep:
+                    edges.append(Relation(source=self.nodes[edge.source].name, relation=edge.relation, target=self.nodes[edge.target].name))
+        return KnowledgeGraph(nodes=nodes, edges=edges)
+
+    def k_hop_subgraph(self, name: str, k: int, direction: str = BOTH) -> KnowledgeGraph:
+        return self.subgraph(self.k_hop(name, k, direction))
+
+    def shortest_path(self, source: str, target: str, direction: str = BOTH) -> Optional[List[Relation]]:
+        """
+        Fewest-hop path from `source` to `target` as the list of edges walked, or None.
+        Bidirectional BFS, so only the neighbourhoods of both ends up to half the distance are explored.
+        """
+        start, goal = self.resolve(source), self.resolve(target)
+        if start is None or goal is None:
+            return None
+        if start == goal:
+            return []
+
+        backward_direction = {OUT: IN, IN: OUT, BOTH: BOTH}[direction]
+        parents = [{start: None}, {goal: None}]
+        frontiers = [[start], [goal]]
+        directions = [direction, backward_direction]
+
+        while frontiers[0] and frontiers[1]:
+            side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+            next_frontier = []
+            for current in frontiers[side]:
+                for edge_id, neighbor in self._incident(current, directions[side]):
+                    if neighbor in parents[side]:
+                        continue
+                    parents[side][neighbor] = (current, edge_id)
+                    if neighbor in parents[1 - side]:
+                        return self._join_paths(parents, neighbor)
+                    next_frontier.append(neighbor)
+            frontiers[side] = next_frontier
+        return None
+
+    def _join_paths(self, parents: List[dict], meeting: str) -> List[Relation]:
+        forward, node = [], meeting
+        while parents[0][node] is not None:
+            node, edge_id = parents[0][node]
+            forward.append(self.edges[edge_id])
+        backward, node = [], meeting
+        while parents[1][node] is not None:
+            node, edge_id = parents[1][node]
+            backward.append(self.edges[edge_id])
+        return forward[::-1] + backward
+
+    def paths(self, source: str, target: str, max_hops: int = 3, direction: str = BOTH, limit: int = 100) -> List[List[Relation]]:
+        """Up to `limit` simple paths of at most `max_hops` edges from `source` to `target` (depth-first)."""
+        start, goal = self.resolve(source), self.resolve(target)
+        if start is None or goal is None:
+            return []
+        # Prune with distances from the goal so the search never walks away from it.
+        to_goal = self.k_hop(goal, max_hops, {OUT: IN, IN: OUT, BOTH: BOTH}[direction])
+
+        found: List[List[Relation]] = []
+        path: List[int] = []
+        visited = {start}
+
+        def walk(current: str):
+            if len(found) >= limit:
+                return
+            if current == goal:
+                found.append([self.edges[i] for i in path])
+                return
+            for edge_id, neighbor in self._incident(current, direction):
+                if neighbor in visited or to_goal.get(neighbor, max_hops + 1) > max_hops - len(path) - 1:
+                    continue
+                visited.add(neighbor)
+                path.append(edge_id)
+                walk(neighbor)
+                path.pop()
+                visited.discard(neighbor)
+
+        walk(start)
+        return found
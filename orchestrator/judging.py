@@ -0,0 +1,92 @@
+import hashlib
+from bisect import bisect_right
+from typing import Any, Dict, Optional
+
+JUDGE_ALL = "all"
+JUDGE_SAMPLE = "sample"
+JUDGE_THRESHOLD = "threshold"
+JUDGE_NONE = "none"
+JUDGE_MODES = (JUDGE_ALL, JUDGE_SAMPLE, JUDGE_THRESHOLD, JUDGE_NONE)
+
+# Supervised entity-F1 bands used as sampling strata in `sample` mode.
+F1_BANDS = (0.5, 0.8)
+
+
+class JudgePolicy:
+    """
+    Decides which documents get the LLM-as-judge evaluation.
+
+    Documents are assigned to a stratum by supervised entity F1 and judged with that
+    stratum's sampling rate:
+
+    - `all`: every document (one stratum, rate 1).
+    - `sample`: a stratified random sample at `sample_rate` per F1 band.
+    - `threshold`: every document with F1 below `f1_threshold`, plus a `sample_rate`
+      sample of the rest (0 judges only the low-F1 tier).
+    - `none`: no document.
+
+    Selection is a deterministic function of the document hash and `seed`, so resumed
+    and deferred runs make the same choices. With `defer`, selected documents are only
+    marked as pending and judged later in a separate pass.
+    """
+
+    def __init__(self, mode: str = JUDGE_ALL, sample_rate: float = 0.1, f1_threshold: float = 0.7, defer: bool = False, seed: str = "judge"):
+        if mode not in JUDGE_MODES:
+            raise ValueError(f"Unknown judge mode '{mode}'. Expected one of {JUDGE_MODES}.")
+        if not 0.0 <= sample_rate <= 1.0:
+            raise ValueError("sample_rate must be between 0 and 1.")
+        self.mode = mode
+        self.sample_rate = sample_rate
+        self.f1_threshold = f1_threshold
+        self.defer = defer
+        self.seed = seed
+
+    def describe(self) -> str:
+        """Stable description of the policy, e.g. for pipeline versioning."""
+        return f"{self.mode}:{self.sample_rate}:{self.f1_threshold}:{self.seed}:{'defer' if self.defer else 'inline'}"
+
+    def stratum(self, supervised_eval: Dict[str, Any]) -> str:
+        f1 = supervised_eval.get("entity_f1", 0.0)
+        if self.mode == JUDGE_THRESHOLD:
+            return "below_threshold" if f1 < self.f1_threshold else "above_threshold"
+        if self.mode == JUDGE_SAMPLE:
+            labels = [f"f1<{F1_BANDS[0]}"] + [f"f1>={edge}" for edge in F1_BANDS]
+            return labels[bisect_right(F1_BANDS, f1)]
+        return "all"
+
+    def rate(self, stratum: str) -> float:
+        if self.mode == JUDGE_ALL:
+            return 1.0
+        if self.mode == JUDGE_NONE:
+            return 0.0
+        if self.mode == JUDGE_THRESHOLD and stratum == "below_threshold":
+            return 1.0
+        return self.sample_rate
+
+    def _draw(self, doc_hash: str) -> float:
+        digest = hashlib.sha256(f"{self.seed}:{doc_hash}".encode("utf-8")).digest()
+        return int.from_bytes(digest[:8], "big") / 2 ** 64
+
+    def select(self, doc_hash: str, supervised_eval: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Judging decision for one document, stored alongside its evaluation:
+        `{"policy", "stratum", "rate", "selected", "pending"}`.
+        """
+        stratum = self.stratum(supervised_eval)
+        rate = self.rate(stratum)
+        selected = self._draw(doc_hash) < rate
+        return {
+            "policy": self.mode,
+            "stratum": stratum,
+            "rate": rate,
+            "selected": selected,
+            "pending": selected and self.defer,
+        }
+
+
+def needs_judging(result: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """The judge record of a saved result still awaiting its deferred LLM-judge pass, if any."""
+    judge = (result.get("evaluation") or {}).get("judge")
+    if judge and judge.get("pending") and result.get("knowledge_graph") is not None:
+        return judge
+    return None
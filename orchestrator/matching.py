@@ -0,0 +1,162 @@
+from collections import defaultdict
+from difflib import SequenceMatcher
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+
+def char_ngrams(text: str, n: int = 3) -> set:
+    """Character n-grams of `text`, padded so that short strings and word edges still produce grams."""
+    padded = f"{' ' * (n - 1)}{text} "
+    return {padded[i:i + n] for i in range(len(padded) - n + 1)}
+
+
+class NGramIndex:
+    """Inverted index from character n-grams to the positions of the strings containing them."""
+
+    def __init__(self, strings: Sequence[str], n: int = 3):
+        self.n = n
+        self.sizes = np.zeros(len(strings), dtype=np.int64)
+        self.postings: Dict[str, List[int]] = defaultdict(list)
+        for i, text in enumerate(strings):
+            grams = char_ngrams(text, n)
+            self.sizes[i] = len(grams)
+            for gram in grams:
+                self.postings[gram].append(i)
+
+    def dice_candidates(self, queries: Sequence[str], min_dice: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Dice similarity over n-gram sets for every (query, indexed string) pair that
+        shares at least one n-gram, keeping only pairs with similarity >= `min_dice`.
+        Returns parallel arrays (query positions, indexed positions, dice scores).
+        """
+        num_indexed = len(self.sizes)
+        query_sizes = np.zeros(len(queries), dtype=np.int64)
+        keys = []
+        for q, text in enumerate(queries):
+            grams = char_ngrams(text, self.n)
+            query_sizes[q] = len(grams)
+            for gram in grams:
+                postings = self.postings.get(gram)
+                if postings:
+                    keys.append(q * num_indexed + np.asarray(postings, dtype=np.int64))
+
+        if not keys:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, np.zeros(0)
+
+        pairs, shared = np.unique(np.concatenate(keys), return_counts=True)
+        rows, cols = np.divmod(pairs, num_indexed)
+        dice = 2.0 * shared / (query_sizes[rows] + self.sizes[cols])
+        keep = dice >= min_dice
+        return rows[keep], cols[keep], dice[keep]
+
+
+def _max_weight_assignment(weights: np.ndarray) -> List[Tuple[int, int]]:
+    """
+    Hungarian algorithm (Kuhn–Munkres with potentials) maximising total weight of a
+    one-to-one assignment on a dense rows x cols matrix. Zero-weight pairs are never returned.
+    """
+    transposed = weights.shape[0] > weights.shape[1]
+    cost = -(weights.T if transposed else weights)
+    n, m = cost.shape
+
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    match = np.zeros(m + 1, dtype=np.int64)  # match[j] = row (1-based) assigned to column j
+    way = np.zeros(m + 1, dtype=np.int64)
+
+    for i in range(1, n + 1):
+        match[0] = i
+        j0 = 0
+        min_slack = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = match[j0]
+            free = ~used[1:]
+            slack = cost[i0 - 1] - u[i0] - v[1:]
+            improve = free & (slack < min_slack[1:])
+            min_slack[1:][improve] = slack[improve]
+            way[1:][improve] = j0
+            candidates = np.where(free, min_slack[1:], np.inf)
+            j1 = int(np.argmin(candidates)) + 1
+            delta = candidates[j1 - 1]
+            u[match[used]] += delta
+            v[used] -= delta
+            min_slack[1:][free] -= delta
+            j0 = j1
+            if match[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            match[j0] = match[j1]
+            j0 = j1
+
+    assignment = []
+    for j in range(1, m + 1):
+        if match[j]:
+            row, col = match[j] - 1, j - 1
+            if transposed:
+                row, col = col, row
+            if weights[row, col] > 0:
+                assignment.append((row, col))
+    return assignment
+
+
+def _components(rows: np.ndarray, cols: np.ndarray) -> List[np.ndarray]:
+    """Group candidate edges into connected components of the bipartite graph (union-find)."""
+    parent: Dict[Tuple[str, int], Tuple[str, int]] = {}
+
+    def find(node):
+        parent.setdefault(node, node)
+        while parent[node] != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    for r, c in zip(rows.tolist(), cols.tolist()):
+        a, b = find(("r", r)), find(("c", c))
+        if a != b:
+            parent[a] = b
+
+    groups: Dict[Tuple[str, int], List[int]] = defaultdict(list)
+    for edge, r in enumerate(rows.tolist()):
+        groups[find(("r", r))].append(edge)
+    return [np.asarray(edges) for edges in groups.values()]
+
+
+def match_entities(gt_list: Sequence[str], gen_list: Sequence[str], threshold: float = 0.8, prune_threshold: float = 0.3, n: int = 3) -> List[Tuple[str, str]]:
+    """
+    Optimal one-to-one fuzzy matching between ground-truth and generated names.
+
+    Candidate pairs come from a character n-gram index and are pruned on n-gram
+    Dice similarity; survivors are scored with difflib's ratio (the same measure
+    and `threshold` as before) and matched with a maximum-cardinality,
+    maximum-similarity assignment, solved independently per connected component.
+    """
+    if not gt_list or not gen_list:
+        return []
+
+    index = NGramIndex(gen_list, n=n)
+    rows, cols, _ = index.dice_candidates(gt_list, prune_threshold)
+
+    ratios = np.array([SequenceMatcher(None, gt_list[r], gen_list[c]).ratio() for r, c in zip(rows.tolist(), cols.tolist())])
+    keep = ratios >= threshold if len(ratios) else np.zeros(0, dtype=bool)
+    rows, cols, ratios = rows[keep], cols[keep], ratios[keep]
+
+    matches = []
+    for edges in _components(rows, cols):
+        comp_rows, comp_cols = rows[edges], cols[edges]
+        row_ids, row_pos = np.unique(comp_rows, return_inverse=True)
+        col_ids, col_pos = np.unique(comp_cols, return_inverse=True)
+
+        # Each matched pair is worth more than any achievable similarity total, so the
+        # assignment first maximises the number of matches, then their similarity.
+        weights = np.zeros((len(row_ids), len(col_ids)))
+        weights[row_pos, col_pos] = len(edges) + 1 + ratios[edges]
+
+        for r, c in _max_weight_assignment(weights):
+            matches.append((gt_list[row_ids[r]], gen_list[col_ids[c]]))
+
+    return matches
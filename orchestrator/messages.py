@@ -0,0 +1,22 @@
+from typing import List, Optional
+
+from orchestrator.prompts import SHARED_SYSTEM_PROMPT
+
+
+def build_messages(document: str, task: str, task_input: Optional[str] = None) -> List[dict]:
+    """
+    Build a chat prompt laid out for provider-side prompt caching.
+
+    Every stage sends the same system prompt followed by the same document message,
+    so the only part that differs between the entity, relation, personality and
+    judge calls for a document is the trailing task message.
+    """
+    task_content = task.strip()
+    if task_input:
+        task_content = f"{task_content}\n\n{task_input}"
+
+    return [
+        {"role": "system", "content": SHARED_SYSTEM_PROMPT.strip()},
+        {"role": "user", "content": f"DOCUMENT:\n{document}"},
+        {"role": "user", "content": f"TASK:\n{task_content}"},
+    ]
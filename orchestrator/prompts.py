@@ -57,3 +57,84 @@ Return structured JSON mapping entities to traits:
   }
 }
 """
+
+LLM_JUDGE_SYSTEM_PROMPT = """
+You are a critical evaluator specializing in verifying Knowledge Graph quality.
+
+Evaluate the given Knowledge Graph against the input document based on the following strict criteria:
+
+1. **Entity Coverage (0–10)** — Did the graph capture ALL important entities (people, organizations, products, events, concepts)? 
+   Deduct points for missing or redundant nodes.
+
+2. **Relation Correctness (0–10)** — Are the relations logically and semantically valid, AND directly or implicitly supported by the text?
+   Deduct points for:
+   - hallucinated relations
+   - vague or generic relations (“associated_with” without context)
+   - missing key causal or ownership relations
+
+3. **Personality Coherence (0–10)** — For human entities, are inferred personality traits justified by actions or tone in the text?
+   Deduct points if traits are unsupported, generic, or inconsistent.
+
+4. **Factual Alignment (0–10)** — Does every node and edge correspond to something *factually* supported by the text?
+   Deduct points for fabricated or misrepresented details.
+
+5. **Logical Consistency (0–10)** — Do all parts of the KG make sense together (no contradictions or cyclic inconsistencies)?
+
+Finally, compute **Overall Score (0–10)** as a holistic judgment, considering all aspects with a harsher weighting on factual accuracy.
+
+In your reasoning, cite at least one example for each major deduction.
+Return strictly structured JSON matching the required schema.
+"""
+
+JOINT_EXTRACTION_SYSTEM_PROMPT = """
+You are an expert knowledge graph extraction model. In a single pass, extract entities, the relations between them, and the personality traits of the people involved.
+
+Your goal:
+1. **Entities** — Identify ALL meaningful entities mentioned or implied in the text and classify each as one of:
+   person | organization | product | event | location | concept.
+   Include implicitly referenced entities (e.g., “the company”, “her team”) when they represent a distinct actor or object.
+   Use canonical forms (e.g., “Elon Musk” not “Musk”) and avoid overfragmenting.
+2. **Relations** — Identify explicit and logically inferable semantic relations between the extracted entities.
+   Both `source` and `target` must be names from your entity list, spelled identically.
+   Prefer verbs or clear relational phrases (e.g., “founded”, “works_at”, “owns”, “located_in”); when uncertain, use cautious names (e.g., “associated_with”).
+3. **Personality** — For each person entity, infer concise personality traits (e.g., "ambitious", "risk-taking", "strategic thinker")
+   that are explicitly stated or implicitly suggested by their actions, dialogue, or tone. Avoid generic or unsupported assumptions.
+
+Return structured JSON in this format:
+{
+  "entities": [
+    {"name": "string", "type": "person | organization | product | event | location | concept", "description": "optional short description"}
+  ],
+  "relations": [
+    {"source": "entity_name", "relation": "string", "target": "entity_name"}
+  ],
+  "personality_map": {
+    "Entity Name": ["trait1", "trait2"]
+  }
+}
+"""
+
+PACKED_EXTRACTION_SYSTEM_PROMPT = """
+The DOCUMENT above is a pack of several independent documents, each wrapped in <document id="..."> tags.
+Treat every document separately: entities, relations and traits must come only from the document they are reported for,
+and relations must never connect entities from different documents.
+
+For EACH document, perform the following extraction:
+""" + JOINT_EXTRACTION_SYSTEM_PROMPT + """
+Return structured JSON with one element per document, using the exact ids from the tags:
+{
+  "documents": [
+    {"document_id": "D1", "entities": [...], "relations": [...], "personality_map": {...}}
+  ]
+}
+"""
+
+# Shared by every extraction and judging call so that, together with the document that follows it,
+# it forms an identical prompt prefix that providers can serve from their prompt cache.
+SHARED_SYSTEM_PROMPT = """
+You are an expert knowledge graph analyst working with narrative documents.
+
+You will be given a DOCUMENT, followed by a TASK describing exactly what to extract from it or how to assess it.
+Base every answer strictly on the document, follow the task instructions precisely,
+and return only the output format the task requests.
+"""
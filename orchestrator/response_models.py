@@ -41,14 +41,32 @@ class KnowledgeGraph(BaseModel):
             f")"
         )
 
-    def visualize(self, output_file: str = "knowledge_graph.html", notebook: bool = False, attempt_correction: bool = True):
+    def index(self) -> "GraphIndex":
+        """Indexed view for neighbour, relation, type and path queries (built in O(V + E))."""
+        from orchestrator.graph_index import GraphIndex
+        return GraphIndex.from_knowledge_graph(self)
+
+    def visualize(self, output_file: str = "knowledge_graph.html", notebook: bool = False, attempt_correction: bool = True, renderer: Optional[str] = None, assets_dir: Optional[str] = None, title: Optional[str] = None):
         """
         Visualize the knowledge graph interactively using PyVis.
         
         Args:
             output_file (str): Path to save the HTML visualization.
             notebook (bool): If True, shows directly in Jupyter Notebook.
+            renderer (str): "pyvis" for in-browser physics, or "lod" for a precomputed layout with
+                collapsible clusters (see orchestrator.visualize). Defaults to "lod" for large graphs.
+            assets_dir (str): With the "lod" renderer, link a shared viewer bundle in this directory.
+            title (str): With the "lod" renderer, the page title.
         """
+        from orchestrator.visualize import render_html, write_assets, LOD_THRESHOLD, TYPE_COLORS
+
+        if renderer == "lod" or (renderer is None and not notebook and len(self.nodes) > LOD_THRESHOLD):
+            if assets_dir is not None:
+                write_assets(assets_dir)
+            render_html(self, output_file, assets_dir=assets_dir, **({"title": title} if title else {}))
+            logger.info(f"Knowledge graph saved to {output_file}")
+            return
+
         try:
             from pyvis.network import Network
         except ImportError:
@@ -59,15 +77,7 @@ class KnowledgeGraph(BaseModel):
         net.barnes_hut()  # physics layout
 
         # Define color mapping by entity type
-        color_map = {
-            "person": "#ff6b6b",
-            "organization": "#4ecdc4",
-            "product": "#ffe66d",
-            "event": "#ff9f43",
-            "location": "#54a0ff",
-            "concept": "#c56cf0",
-            "unknown": "#d2dae2",
-        }
+        color_map = TYPE_COLORS
 
         try:
             # Add nodes
@@ -112,7 +122,7 @@ class KnowledgeGraph(BaseModel):
             logger.debug("No edges were removed; unable to correct the graph.")
         
         # Retry visualization without further correction attempts
-        self.visualize(output_file=output_file, notebook=notebook, attempt_correction=False)
+        self.visualize(output_file=output_file, notebook=notebook, attempt_correction=False, renderer="pyvis")
 
 
 class LLMJudgeEvalResponse(BaseModel):
@@ -0,0 +1,295 @@
+import os
+import html
+import json
+import math
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from orchestrator.response_models import KnowledgeGraph
+
+TYPE_COLORS = {
+    "person": "#ff6b6b",
+    "organization": "#4ecdc4",
+    "product": "#ffe66d",
+    "event": "#ff9f43",
+    "location": "#54a0ff",
+    "concept": "#c56cf0",
+    "unknown": "#d2dae2",
+}
+
+CLUSTER_BY_TYPE = "type"
+CLUSTER_BY_COMMUNITY = "community"
+
+# Graphs with more nodes than this open with every cluster collapsed.
+LOD_THRESHOLD = 200
+# Community clustering keeps at most this many communities of at least MIN_COMMUNITY_SIZE nodes.
+MAX_CLUSTERS = 200
+MIN_COMMUNITY_SIZE = 3
+# Clusters of this size or more are spread on a sunflower spiral instead of a force layout:
+# networkx's spring layout is quadratic, and needs scipy (not a dependency) from 500 nodes.
+MAX_FORCE_LAYOUT_NODES = 500
+
+VIS_NETWORK_URL = "https://unpkg.com/vis-network@9.1.9/standalone/umd/vis-network.min.js"
+ASSET_FILES = ("kg_viewer.js", "kg_viewer.css")
+
+VIEWER_CSS = """
+html, body { margin: 0; height: 100%; background: #0e1117; color: #fafafa; font-family: sans-serif; }
+#kg-graph { position: absolute; inset: 0; }
+#kg-info { position: absolute; top: 8px; left: 8px; padding: 6px 10px; background: rgba(14, 17, 23, 0.8); border-radius: 4px; font-size: 13px; z-index: 1; }
+#kg-info button { margin-left: 8px; }
+"""
+
+VIEWER_JS = """
+// Level-of-detail knowledge graph viewer. Positions are precomputed server-side, so physics stays off.
+function kgViewer(container, data) {
+  var expanded = new Set();
+  if (!data.collapsed) { data.clusters.forEach(function (c) { expanded.add(c.id); }); }
+  var clusterOf = data.nodes.map(function (n) { return n.cluster; });
+  var nodes = new vis.DataSet();
+  var edges = new vis.DataSet();
+
+  function rep(i) {
+    return expanded.has(clusterOf[i]) ? "n" + i : "c" + clusterOf[i];
+  }
+
+  function build() {
+    var visibleNodes = [];
+    data.clusters.forEach(function (c) {
+      if (!expanded.has(c.id)) {
+        visibleNodes.push({ id: "c" + c.id, label: c.label + " (" + c.size + ")", x: c.x, y: c.y, value: c.size,
+                            shape: "dot", color: c.color, title: "Click to expand", font: { color: "#fafafa" } });
+      }
+    });
+    data.nodes.forEach(function (n, i) {
+      if (expanded.has(n.cluster)) {
+        visibleNodes.push({ id: "n" + i, label: n.label, x: n.x, y: n.y, color: n.color, title: n.title,
+                            shape: "dot", size: 8, font: { color: "#fafafa" } });
+      }
+    });
+    var aggregated = {};
+    var visibleEdges = [];
+    data.edges.forEach(function (e, i) {
+      var s = rep(e.from), t = rep(e.to);
+      if (s === t && s.charAt(0) === "c") { return; }
+      if (s.charAt(0) === "n" && t.charAt(0) === "n") {
+        visibleEdges.push({ id: "e" + i, from: s, to: t, label: e.label, arrows: "to" });
+        return;
+      }
+      var key = s + ">" + t;
+      if (!aggregated[key]) { aggregated[key] = { id: key, from: s, to: t, value: 0, arrows: "to", color: { opacity: 0.4 } }; visibleEdges.push(aggregated[key]); }
+      aggregated[key].value += 1;
+      aggregated[key].title = aggregated[key].value + " relations";
+    });
+    nodes.clear(); edges.clear();
+    nodes.add(visibleNodes); edges.add(visibleEdges);
+  }
+
+  build();
+  var network = new vis.Network(container, { nodes: nodes, edges: edges }, {
+    physics: false,
+    interaction: { hover: true, tooltipDelay: 100, hideEdgesOnDrag: true },
+    edges: { font: { size: 10, color: "#cccccc", strokeWidth: 0 }, smooth: false },
+  });
+
+  network.on("click", function (params) {
+    if (!params.nodes.length) { return; }
+    var id = params.nodes[0];
+    var cluster = id.charAt(0) === "c" ? Number(id.slice(1)) : clusterOf[Number(id.slice(1))];
+    if (id.charAt(0) === "c") { expanded.add(cluster); }
+    else if (data.collapsed) { expanded.delete(cluster); }
+    else { return; }
+    build();
+  });
+  return network;
+}
+"""
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<script src="{vis_url}"></script>
+{assets}
+</head>
+<body>
+<div id="kg-info">{info}</div>
+<div id="kg-graph"></div>
+<script>kgViewer(document.getElementById("kg-graph"), {data});</script>
+</body>
+</html>
+"""
+
+
+def write_assets(directory: str) -> str:
+    """Write the shared viewer bundle into `directory` (once per content change) and return the directory."""
+    os.makedirs(directory, exist_ok=True)
+    for name, content in zip(ASSET_FILES, (VIEWER_JS, VIEWER_CSS)):
+        path = os.path.join(directory, name)
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                if f.read() == content:
+                    continue
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    return directory
+
+
+def _clusters(graph, names: List[str], types: List[str], cluster_by: Optional[str], seed: int) -> Tuple[List[int], Dict[int, str]]:
+    """
+    Cluster id per node and a label per cluster: by entity type, by Louvain community,
+    or a single cluster. Only the `MAX_CLUSTERS` largest communities are kept; nodes in
+    the long tail (typically isolated entities) are pooled into one cluster per type.
+    """
+    if cluster_by == CLUSTER_BY_TYPE:
+        ordered = sorted(set(types))
+        ids = {t: i for i, t in enumerate(ordered)}
+        return [ids[t] for t in types], dict(enumerate(ordered))
+    if cluster_by == CLUSTER_BY_COMMUNITY:
+        import networkx as nx
+        communities = sorted(nx.community.louvain_communities(graph, seed=seed), key=len, reverse=True)
+        assignment = [0] * len(names)
+        labels: Dict[int, str] = {}
+        kept = [c for c in communities[:MAX_CLUSTERS] if len(c) >= MIN_COMMUNITY_SIZE]
+        for cluster_id, members in enumerate(kept):
+            for node in members:
+                assignment[node] = cluster_id
+            labels[cluster_id] = names[max(members, key=graph.degree)]
+        tail_ids: Dict[str, int] = {}
+        for members in communities[len(kept):]:
+            for node in members:
+                if types[node] not in tail_ids:
+                    tail_ids[types[node]] = len(labels)
+                    labels[len(labels)] = f"other {types[node]}"
+                assignment[node] = tail_ids[types[node]]
+        return assignment, labels
+    return [0] * len(names), {0: "graph"}
+
+
+def _spiral(count: int) -> List[tuple]:
+    """Evenly spread unit-disc positions (sunflower spiral); O(n), for clusters too large for force layout."""
+    golden = math.pi * (3 - math.sqrt(5))
+    return [(math.sqrt((i + 0.5) / count) * math.cos(i * golden), math.sqrt((i + 0.5) / count) * math.sin(i * golden)) for i in range(count)]
+
+
+def build_view(graph: KnowledgeGraph, cluster_by: Optional[str] = CLUSTER_BY_TYPE, lod_threshold: int = LOD_THRESHOLD, seed: int = 0) -> Dict:
+    """
+    Precompute a two-level layout for `graph`: cluster centres are placed with a
+    force layout of the cluster graph (weighted by inter-cluster edges), then each
+    cluster's members are laid out around its centre in a disc scaled by its size.
+    Graphs above `lod_threshold` nodes start with every cluster collapsed.
+    """
+    import networkx as nx
+
+    index_of: Dict[str, int] = {}
+    names, types, titles = [], [], []
+    for node in graph.nodes:
+        if node.name in index_of:
+            continue
+        index_of[node.name] = len(names)
+        names.append(node.name)
+        types.append(node.type.value)
+        titles.append(node.description or "")
+
+    edge_list = [(index_of[e.source], index_of[e.target], e.relation) for e in graph.edges if e.source in index_of and e.target in index_of]
+
+    undirected = nx.Graph()
+    undirected.add_nodes_from(range(len(names)))
+    undirected.add_edges_from((s, t) for s, t, _ in edge_list)
+
+    clusters, labels = _clusters(undirected, names, types, cluster_by, seed)
+    members: Dict[int, List[int]] = defaultdict(list)
+    for node, cluster_id in enumerate(clusters):
+        members[cluster_id].append(node)
+
+    # Cluster-level layout.
+    cluster_graph = nx.Graph()
+    cluster_graph.add_nodes_from(members)
+    for s, t, _ in edge_list:
+        a, b = clusters[s], clusters[t]
+        if a != b:
+            weight = cluster_graph.get_edge_data(a, b, {"weight": 0})["weight"]
+            cluster_graph.add_edge(a, b, weight=weight + 1)
+    radius = {c: 60 * math.sqrt(len(nodes)) for c, nodes in members.items()}
+    spread = 4 * max(radius.values(), default=1) * math.sqrt(len(members))
+    if len(members) > 1:
+        centres = nx.spring_layout(cluster_graph, weight="weight", seed=seed)
+    else:
+        centres = {c: (0.0, 0.0) for c in members}
+
+    # Member layout within each cluster.
+    positions: Dict[int, tuple] = {}
+    for cluster_id, nodes in members.items():
+        cx, cy = centres[cluster_id][0] * spread, centres[cluster_id][1] * spread
+        if len(nodes) == 1:
+            local = {nodes[0]: (0.0, 0.0)}
+        elif len(nodes) < MAX_FORCE_LAYOUT_NODES:
+            local = nx.spring_layout(undirected.subgraph(nodes), seed=seed, center=(0, 0))
+        else:
+            local = dict(zip(nodes, _spiral(len(nodes))))
+        for node, (x, y) in local.items():
+            positions[node] = (cx + x * radius[cluster_id], cy + y * radius[cluster_id])
+
+    return {
+        "collapsed": len(names) > lod_threshold,
+        "clusters": [
+            {
+                "id": cluster_id,
+                "label": labels[cluster_id],
+                "size": len(nodes),
+                "x": round(centres[cluster_id][0] * spread, 1),
+                "y": round(centres[cluster_id][1] * spread, 1),
+                "color": TYPE_COLORS.get(Counter(types[n] for n in nodes).most_common(1)[0][0], TYPE_COLORS["unknown"]),
+            }
+            for cluster_id, nodes in sorted(members.items())
+        ],
+        "nodes": [
+            {
+                "label": names[i],
+                "title": titles[i],
+                "color": TYPE_COLORS.get(types[i], TYPE_COLORS["unknown"]),
+                "cluster": clusters[i],
+                "x": round(positions[i][0], 1),
+                "y": round(positions[i][1], 1),
+            }
+            for i in range(len(names))
+        ],
+        "edges": [{"from": s, "to": t, "label": relation} for s, t, relation in edge_list],
+    }
+
+
+def render_html(
+    graph: KnowledgeGraph,
+    output_file: str,
+    assets_dir: Optional[str] = None,
+    title: str = "Knowledge graph",
+    cluster_by: Optional[str] = CLUSTER_BY_TYPE,
+    lod_threshold: int = LOD_THRESHOLD,
+):
+    """
+    Write an HTML view of `graph` with a precomputed layout. With `assets_dir`, the page
+    links the shared viewer bundle there (see `write_assets`) instead of inlining it.
+    """
+    view = build_view(graph, cluster_by=cluster_by, lod_threshold=lod_threshold)
+    if assets_dir is not None:
+        relative = os.path.relpath(assets_dir, os.path.dirname(os.path.abspath(output_file)))
+        assets = (
+            f'<link rel="stylesheet" href="{relative}/kg_viewer.css">\n'
+            f'<script src="{relative}/kg_viewer.js"></script>'
+        )
+    else:
+        assets = f"<style>{VIEWER_CSS}</style>\n<script>{VIEWER_JS}</script>"
+
+    info = f"{len(view['nodes'])} entities · {len(view['edges'])} relations · {len(view['clusters'])} clusters"
+    if view["collapsed"]:
+        info += " — click a cluster to expand it, a node to collapse it"
+    # "</" must not appear verbatim inside an inline <script>.
+    data = json.dumps(view, ensure_ascii=False, separators=(",", ":")).replace("</", "<\\/")
+
+    directory = os.path.dirname(output_file)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(output_file, "w") as f:
+        f.write(PAGE_TEMPLATE.format(title=html.escape(title), vis_url=VIS_NETWORK_URL, assets=assets, info=html.escape(info), data=data))
@@ -0,0 +1,103 @@
+import asyncio
+import json
+import os
+from typing import List
+
+import pytest
+from pydantic import BaseModel
+
+from utils.batch import FAILED, BatchLLMService, LocalBatchBackend, LocalBatchServer
+from utils.constants import GPT_4O_MINI, OPENAI
+from utils.metrics import LLM_REQUESTS_TOTAL, LLM_TOKENS_TOTAL, metrics
+
+
+class Answer(BaseModel):
+    answer: str
+
+
+async def handler(body: dict) -> dict:
+    """Echoes the last user message as JSON; a message of 'fail' makes the request fail."""
+    question = next(m["content"] for m in reversed(body["messages"]) if m["role"] == "user")
+    if question == "fail":
+        raise RuntimeError("model unavailable")
+    return {
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": json.dumps({"answer": question})}}],
+        "usage": {"prompt_tokens": 10, "completion_tokens": 2},
+    }
+
+
+class DroppingBackend(LocalBatchBackend):
+    """Loses the result of the first request in every batch."""
+
+    async def results(self, batch_id: str) -> List[dict]:
+        return (await super().results(batch_id))[1:]
+
+
+class FailingBackend(LocalBatchBackend):
+    async def status(self, batch_id: str) -> str:
+        return FAILED
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+def messages(question: str) -> List[dict]:
+    return [{"role": "user", "content": question}]
+
+
+async def run(backend: LocalBatchBackend, directory: str, work_directory: str, *calls):
+    """Issue `calls` against a batch service while a local server answers its batches."""
+    service = BatchLLMService(OPENAI, backend=backend, batch_size=len(calls), poll_interval=0.01, work_directory=work_directory)
+    server = LocalBatchServer(directory, handler)
+
+    async def serve():
+        while True:
+            await server.process_pending()
+            await asyncio.sleep(0.01)
+
+    serving = asyncio.create_task(serve())
+    try:
+        results = await asyncio.wait_for(asyncio.gather(*(call(service) for call in calls)), timeout=10)
+        await service.close()
+        return results
+    finally:
+        serving.cancel()
+
+
+def chat(question):
+    return lambda service: service.call_llm(GPT_4O_MINI, messages(question))
+
+
+def structured(question):
+    return lambda service: service.call_llm_structured(GPT_4O_MINI, messages(question), Answer)
+
+
+def test_round_trip_with_an_error_record(tmp_path):
+    directory, work = str(tmp_path / "batches"), str(tmp_path / "work")
+    results = asyncio.run(run(LocalBatchBackend(directory), directory, work, chat("hello"), structured("world"), chat("fail")))
+
+    assert results == ['{"answer": "hello"}', Answer(answer="world"), None]
+    assert metrics.rollup(LLM_REQUESTS_TOTAL, by="outcome") == {"ok": 2, "error": 1}
+    assert metrics.rollup(LLM_TOKENS_TOTAL, by="kind") == {"prompt": 20, "completion": 4, "cached": 0}
+    assert os.listdir(work) == []
+
+
+def test_missing_result_fails_only_that_request(tmp_path):
+    directory, work = str(tmp_path / "batches"), str(tmp_path / "work")
+    results = asyncio.run(run(DroppingBackend(directory), directory, work, chat("first"), chat("second")))
+
+    assert results == [None, '{"answer": "second"}']
+    assert metrics.rollup(LLM_REQUESTS_TOTAL, by="outcome") == {"ok": 1, "error": 1}
+
+
+def test_failed_batch_fails_every_request(tmp_path):
+    directory, work = str(tmp_path / "batches"), str(tmp_path / "work")
+    results = asyncio.run(run(FailingBackend(directory), directory, work, chat("a"), structured("b")))
+
+    assert results == [None, None]
+    assert metrics.rollup(LLM_REQUESTS_TOTAL, by="outcome") == {"error": 2}
+    assert os.listdir(work) == []
@@ -0,0 +1,29 @@
+from orchestrator.global_graph import GlobalKnowledgeGraph
+from orchestrator.graph_index import GraphIndex
+from orchestrator.response_models import Entity, EntityType, KnowledgeGraph, Relation
+
+
+def test_global_index_keeps_entities_sharing_a_name_apart():
+    global_graph = GlobalKnowledgeGraph()
+    global_graph.add_graph(KnowledgeGraph(
+        nodes=[Entity(name="Jordan", type=EntityType.PERSON), Entity(name="Acme", type=EntityType.ORGANIZATION)],
+        edges=[Relation(source="Jordan", relation="works_at", target="Acme")],
+    ), source="doc1")
+    global_graph.add_graph(KnowledgeGraph(
+        nodes=[Entity(name="Jordan", type=EntityType.LOCATION), Entity(name="Dr. Acme", type=EntityType.ORGANIZATION)],
+        edges=[Relation(source="Dr. Acme", relation="located_in", target="Jordan")],
+    ), source="doc2")
+    person, acme = global_graph.entity("Jordan").id, global_graph.entity("Acme").id
+    country = next(e.id for e in global_graph.entities.values() if e.type == EntityType.LOCATION)
+
+    index = GraphIndex.from_global_graph(global_graph)
+
+    assert len(index) == 3 and country != person
+    assert index.resolve("Jordan") == person
+    assert index.resolve("Dr. Acme") == acme
+    assert index.neighbors(person) == [acme]
+    assert sorted(index.neighbors(acme)) == sorted([person, country])
+    assert index.sources_of(index.edges_of(country)[0]) == {"doc2"}
+    assert index.node(country).name == "Jordan"
+    assert [[e.target for e in path] for path in index.paths(person, country)] == [[acme, country]]
+    assert {e.relation for e in index.k_hop_subgraph(acme, 1).edges} == {"works_at", "located_in"}
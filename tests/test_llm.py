@@ -0,0 +1,100 @@
+import asyncio
+from types import SimpleNamespace
+from typing import List
+
+import pytest
+from pydantic import BaseModel
+
+from utils.constants import GPT_4O_MINI, OPENAI, PROVIDER_INFORMATION
+from utils.llm import LLMService
+from utils.metrics import LLM_REQUESTS_TOTAL, LLM_RETRIES_TOTAL, metrics
+
+
+class Item(BaseModel):
+    name: str
+
+
+class Items(BaseModel):
+    items: List[Item]
+
+
+class FakeStream:
+    def __init__(self, text: str):
+        self.chunks = [text[i:i + 8] for i in range(0, len(text), 8)]
+        self.closed = False
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for chunk in self.chunks:
+            yield SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=SimpleNamespace(content=chunk))])
+        yield SimpleNamespace(usage={"prompt_tokens": 10, "completion_tokens": 5}, choices=[])
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeCompletions:
+    """Replays one scripted JSON reply per call and keeps the messages it was sent."""
+
+    def __init__(self, replies: List[str]):
+        self.replies = list(replies)
+        self.calls: List[list] = []
+        self.streams: List[FakeStream] = []
+
+    async def create(self, model, messages, **kwargs):
+        self.calls.append(messages)
+        stream = FakeStream(self.replies.pop(0))
+        self.streams.append(stream)
+        return stream
+
+
+@pytest.fixture(autouse=True)
+def isolated(monkeypatch):
+    monkeypatch.setitem(PROVIDER_INFORMATION[OPENAI], "API", ("test-key", None))
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+def make_service(replies: List[str], **kwargs):
+    service = LLMService(OPENAI, **kwargs)
+    completions = FakeCompletions(replies)
+    service.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    return service, completions
+
+
+def call(service):
+    return asyncio.run(service.call_llm_structured(GPT_4O_MINI, [{"role": "user", "content": "doc"}], Items))
+
+
+def test_invalid_json_is_re_asked_with_the_validation_error():
+    service, completions = make_service(['{"items": [{"name": "a"}', '{"items": [{"name": "a"}]}'])
+    assert call(service) == Items(items=[Item(name="a")])
+    assert len(completions.calls) == 2
+    assert completions.calls[1][-1]["content"].startswith("That JSON failed validation")
+    assert metrics.rollup(LLM_RETRIES_TOTAL, by="reason") == {"validation": 1}
+
+
+def test_aborted_stream_is_closed_and_re_asked():
+    too_many = '{"items": [' + ", ".join('{"name": "x"}' for _ in range(5)) + "]}"
+    service, completions = make_service([too_many, '{"items": [{"name": "a"}]}'], max_items=3)
+    assert call(service) == Items(items=[Item(name="a")])
+    assert completions.streams[0].closed
+    assert "cancelled" in completions.calls[1][-1]["content"]
+    assert metrics.rollup(LLM_RETRIES_TOTAL, by="reason") == {"stream_aborted": 1}
+    assert metrics.rollup(LLM_REQUESTS_TOTAL, by="outcome") == {"cancelled": 1, "ok": 1}
+
+
+def test_gives_up_after_max_validation_retries():
+    service, completions = make_service(["{}"] * 3)
+    assert service.max_validation_retries == 2
+    assert call(service) is None
+    assert len(completions.calls) == 3
+
+
+def test_no_retries_makes_a_single_attempt():
+    service, completions = make_service(["{}", '{"items": []}'], max_validation_retries=0)
+    assert call(service) is None
+    assert len(completions.calls) == 1
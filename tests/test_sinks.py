@@ -0,0 +1,53 @@
+import os
+
+import pytest
+
+pytest.importorskip("pyarrow", minversion="14")
+
+from utils.sinks import ParquetSink
+
+
+def result(content, nodes, evaluation=None):
+    return {
+        "document_metadata": {"creation_timestamp": "2025-01-01 00:00:00", "content": content},
+        "knowledge_graph": {
+            "nodes": [{"name": name, "type": "Person", "description": None} for name in nodes],
+            "edges": [{"source": nodes[0], "relation": "knows", "target": nodes[-1]}] if len(nodes) > 1 else [],
+        } if nodes is not None else None,
+        "evaluation": evaluation or {},
+    }
+
+
+def test_parquet_resume_reads_latest_version_across_parts(tmp_path):
+    directory = str(tmp_path)
+    # batch_size=1 flushes every record as its own part.
+    sink = ParquetSink(directory, batch_size=1)
+    sink.write("a", result("first", ["Ann", "Bob"]))
+    sink.flush()
+    sink.write("b", result("second", None, {"error": "extraction failed"}))
+    sink.flush()
+    sink.write("a", result("first, again", ["Ann"], {"supervised_eval": {"entity_f1": 0.5}}))
+    sink.close()
+    assert len(os.listdir(os.path.join(directory, "documents"))) == 3
+
+    resumed = ParquetSink(directory)
+    assert set(resumed.parts) == {"a", "b"}
+    assert resumed.parts["a"][0] != resumed.parts["b"][0]
+
+    a = resumed.read("a")
+    assert a["document_metadata"]["content"] == "first, again"
+    assert [node["name"] for node in a["knowledge_graph"]["nodes"]] == ["Ann"]
+    assert a["knowledge_graph"]["edges"] == []
+    assert a["evaluation"] == {"supervised_eval": {"entity_f1": 0.5}}
+
+    b = resumed.read("b")
+    assert b["knowledge_graph"] is None
+    assert b["evaluation"] == {"error": "extraction failed"}
+    assert resumed.read("missing") is None
+
+    assert {record_id: r["document_metadata"]["content"] for record_id, r in resumed.records()} == {"a": "first, again", "b": "second"}
+
+    resumed.write("b", result("second, again", ["Cy", "Di"]))
+    resumed.flush()
+    assert resumed.read("b")["knowledge_graph"]["edges"] == [{"source": "Cy", "relation": "knows", "target": "Di"}]
+    resumed.close()
@@ -0,0 +1,349 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import asyncio
+from abc import ABC, abstractmethod
+from typing import Awaitable, Callable, Dict, List, Literal, Optional, Union
+
+from openai import AsyncOpenAI
+from pydantic import BaseModel
+
+from utils.logger import logger
+from utils.cache import ResponseCache
+from utils.constants import PROVIDER_INFORMATION
+from utils.llm import BaseLLMService, schema_instruction
+from utils.tools.base import BaseTool
+
+COMPLETED = "completed"
+FAILED = "failed"
+PENDING = "pending"
+
+CHAT_COMPLETIONS_ENDPOINT = "/v1/chat/completions"
+
+
+class BatchBackend(ABC):
+    """Submits a JSONL file of chat-completion requests and returns the JSONL results."""
+
+    @abstractmethod
+    async def submit(self, input_path: str) -> str:
+        """Submit the batch file and return a batch id."""
+        pass
+
+    @abstractmethod
+    async def status(self, batch_id: str) -> str:
+        """One of PENDING, COMPLETED or FAILED."""
+        pass
+
+    @abstractmethod
+    async def results(self, batch_id: str) -> List[dict]:
+        """Output records of a completed batch, one per request that produced a result."""
+        pass
+
+    async def close(self):
+        pass
+
+
+class OpenAIBatchBackend(BatchBackend):
+    """The OpenAI (or compatible) Batch API: upload the file, create a batch, download the output file."""
+
+    TERMINAL_FAILURES = ("failed", "expired", "cancelled")
+
+    def __init__(self, name: str, completion_window: str = "24h"):
+        api_key, base_url = PROVIDER_INFORMATION[name]["API"]
+        self.client = AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=2)
+        self.completion_window = completion_window
+
+    async def submit(self, input_path: str) -> str:
+        with open(input_path, "rb") as f:
+            uploaded = await self.client.files.create(file=f, purpose="batch")
+        batch = await self.client.batches.create(
+            input_file_id=uploaded.id,
+            endpoint=CHAT_COMPLETIONS_ENDPOINT,
+            completion_window=self.completion_window,
+        )
+        return batch.id
+
+    async def status(self, batch_id: str) -> str:
+        batch = await self.client.batches.retrieve(batch_id)
+        if batch.status == "completed":
+            return COMPLETED
+        if batch.status in self.TERMINAL_FAILURES:
+            return FAILED
+        return PENDING
+
+    async def results(self, batch_id: str) -> List[dict]:
+        batch = await self.client.batches.retrieve(batch_id)
+        records = []
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id is None:
+                continue
+            content = await self.client.files.content(file_id)
+            records.extend(json.loads(line) for line in content.text.splitlines() if line.strip())
+        return records
+
+    async def close(self):
+        await self.client.close()
+
+
+class LocalBatchBackend(BatchBackend):
+    """
+    File-based stand-in for a batch API. Submitted files are dropped into
+    `<directory>/inbox/` and results are read back from `<directory>/outbox/`,
+    where a `LocalBatchServer` writes them.
+    """
+
+    def __init__(self, directory: str):
+        self.inbox = os.path.join(directory, "inbox")
+        self.outbox = os.path.join(directory, "outbox")
+        os.makedirs(self.inbox, exist_ok=True)
+        os.makedirs(self.outbox, exist_ok=True)
+
+    async def submit(self, input_path: str) -> str:
+        batch_id = f"batch_{uuid.uuid4().hex}"
+        tmp_path = os.path.join(self.inbox, f".{batch_id}.tmp")
+        await asyncio.to_thread(shutil.copyfile, input_path, tmp_path)
+        os.replace(tmp_path, os.path.join(self.inbox, f"{batch_id}.jsonl"))
+        return batch_id
+
+    async def status(self, batch_id: str) -> str:
+        return COMPLETED if os.path.exists(os.path.join(self.outbox, f"{batch_id}.jsonl")) else PENDING
+
+    async def results(self, batch_id: str) -> List[dict]:
+        with open(os.path.join(self.outbox, f"{batch_id}.jsonl"), "r") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+
+class LocalBatchServer:
+    """
+    Processes batches dropped into a `LocalBatchBackend` directory by answering each
+    request with `handler` (request body -> chat-completion response body).
+    """
+
+    def __init__(self, directory: str, handler: Callable[[dict], Awaitable[dict]]):
+        self.backend = LocalBatchBackend(directory)
+        self.handler = handler
+
+    @classmethod
+    def from_service(cls, directory: str, llm_service: BaseLLMService, model: Optional[str] = None) -> "LocalBatchServer":
+        """Answer requests with `llm_service.call_llm`, optionally overriding the requested model."""
+
+        async def handler(body: dict) -> dict:
+            content = await llm_service.call_llm(model=model or body["model"], messages=body["messages"])
+            if content is None:
+                raise RuntimeError("LLM service returned no content")
+            return {"choices": [{"index": 0, "message": {"role": "assistant", "content": content}}]}
+
+        return cls(directory, handler)
+
+    async def _answer(self, request: dict) -> dict:
+        try:
+            body = await self.handler(request["body"])
+            return {"custom_id": request["custom_id"], "response": {"status_code": 200, "body": body}, "error": None}
+        except Exception as e:
+            return {"custom_id": request["custom_id"], "response": None, "error": {"message": str(e)}}
+
+    async def process_pending(self) -> int:
+        """Answer every batch currently in the inbox. Returns the number of batches processed."""
+        processed = 0
+        for entry in sorted(os.listdir(self.backend.inbox)):
+            if not entry.endswith(".jsonl"):
+                continue
+            inbox_path = os.path.join(self.backend.inbox, entry)
+            with open(inbox_path, "r") as f:
+                requests = [json.loads(line) for line in f if line.strip()]
+
+            answers = await asyncio.gather(*(self._answer(request) for request in requests))
+
+            tmp_path = os.path.join(self.backend.outbox, f".{entry}.tmp")
+            with open(tmp_path, "w") as f:
+                for answer in answers:
+                    f.write(json.dumps(answer) + "\n")
+            os.replace(tmp_path, os.path.join(self.backend.outbox, entry))
+            os.remove(inbox_path)
+
+            logger.debug(f"Local batch server answered {len(answers)} requests in {entry}.")
+            processed += 1
+        return processed
+
+    async def serve_forever(self, poll_interval: float = 1.0):
+        while True:
+            await self.process_pending()
+            await asyncio.sleep(poll_interval)
+
+
+class BatchLLMService(BaseLLMService):
+    """
+    LLM service that defers calls to a batch backend.
+
+    Each call enqueues a chat-completion request and awaits its result. Pending
+    requests are written to a JSONL file and submitted once `batch_size` of them
+    have accumulated or `flush_interval` seconds have passed since the first one,
+    then the batch is polled until complete and every caller is resumed with its
+    own result. Callers see the same interface and return values as `LLMService`,
+    and each call is recorded in the LLM metrics like a chat request, its latency
+    being the batch turnaround.
+    """
+
+    # Batch API requests are billed at half the list price.
+    price_factor = 0.5
+
+    def __init__(
+        self,
+        name: str,
+        backend: BatchBackend,
+        cache: Optional[ResponseCache] = None,
+        batch_size: int = 1000,
+        flush_interval: float = 30.0,
+        poll_interval: float = 60.0,
+        work_directory: str = ".cache/batches",
+    ):
+        self.name = name
+        self.backend = backend
+        self.cache = cache
+        self.usage = {}
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.poll_interval = poll_interval
+        self.work_directory = work_directory
+        os.makedirs(work_directory, exist_ok=True)
+
+        self._pending: List[tuple] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._batches: set = set()
+
+    async def _request(self, body: dict) -> dict:
+        """Queue one chat-completion request and wait for its response body."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((f"req_{uuid.uuid4().hex}", body, future))
+
+        if len(self._pending) >= self.batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.flush_interval, self._flush)
+
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+
+        requests, self._pending = self._pending, []
+        task = asyncio.create_task(self._run_batch(requests))
+        self._batches.add(task)
+        task.add_done_callback(self._batches.discard)
+
+    def _write_batch_file(self, requests: List[tuple]) -> str:
+        path = os.path.join(self.work_directory, f"input_{uuid.uuid4().hex}.jsonl")
+        with open(path, "w") as f:
+            for custom_id, body, _ in requests:
+                record = {"custom_id": custom_id, "method": "POST", "url": CHAT_COMPLETIONS_ENDPOINT, "body": body}
+                f.write(json.dumps(record) + "\n")
+        return path
+
+    async def _run_batch(self, requests: List[tuple]):
+        futures = {custom_id: future for custom_id, _, future in requests}
+        input_path = await asyncio.to_thread(self._write_batch_file, requests)
+        try:
+            batch_id = await self.backend.submit(input_path)
+            logger.info(f"Submitted batch {batch_id} with {len(requests)} requests.")
+
+            started = time.monotonic()
+            while (status := await self.backend.status(batch_id)) == PENDING:
+                await asyncio.sleep(self.poll_interval)
+            if status == FAILED:
+                raise RuntimeError(f"Batch {batch_id} failed")
+
+            records = await self.backend.results(batch_id)
+            logger.info(f"Batch {batch_id} completed in {time.monotonic() - started:.0f}s.")
+
+            for record in records:
+                future = futures.pop(record.get("custom_id"), None)
+                if future is None or future.done():
+                    continue
+                response = record.get("response") or {}
+                if record.get("error") or response.get("status_code") != 200:
+                    future.set_exception(RuntimeError(f"Batch request failed: {record.get('error') or response}"))
+                else:
+                    future.set_result(response["body"])
+
+            for future in futures.values():
+                if not future.done():
+                    future.set_exception(RuntimeError(f"Batch {batch_id} returned no result for request"))
+        except Exception as e:
+            for future in futures.values():
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            os.remove(input_path)
+
+    async def close(self):
+        """Submit anything still pending and wait for all outstanding batches."""
+        self._flush()
+        if self._batches:
+            await asyncio.gather(*self._batches, return_exceptions=True)
+        await self.backend.close()
+
+    async def call_llm(self, model: str, messages: List[dict]):
+        """Call the LLM with the given model and messages via the batch backend."""
+        generic_model_name, model = self._get_model_id(model)
+        try:
+            async with self._slot(generic_model_name, messages) as slot:
+                body = await self._request({"model": model, "messages": messages})
+                slot.tokens = self._record_usage(generic_model_name, body.get("usage"))
+            return body["choices"][0]["message"]["content"] if body.get("choices") else None
+        except Exception as e:
+            logger.error(f"{self.name} batch service failed to call model {generic_model_name}: {e}")
+            return None
+
+    async def call_llm_structured(self, model: str, messages: List[dict], response_format: BaseModel):
+        """Structured call via the batch backend, validated locally against `response_format`."""
+        generic_model_name, model = self._get_model_id(model)
+        cache_key = self._cache_key(model, messages, response_format)
+        cached = await self._cache_get(cache_key, response_format)
+        if cached is not None:
+            return cached
+        try:
+            structured_messages = messages + [schema_instruction(response_format)]
+            async with self._slot(generic_model_name, structured_messages) as slot:
+                body = await self._request({
+                    "model": model,
+                    "messages": structured_messages,
+                    "response_format": {"type": "json_object"},
+                })
+                slot.tokens = self._record_usage(generic_model_name, body.get("usage"))
+            content = body["choices"][0]["message"]["content"]
+            response = response_format.model_validate_json(content[content.find('{'):])
+            await self._cache_set(cache_key, response)
+            return response
+        except Exception as e:
+            logger.error(f"{self.name} batch service failed to call model {generic_model_name}: {e}")
+            return None
+
+    async def call_llm_tools(self, model: str, messages: List[dict], tools: Dict[str, BaseTool], tool_choice: Union[Literal['auto', 'none'], dict] = 'auto'):
+        logger.error(f"{self.name} batch service does not support tool calls.")
+        return None
+
+
+if __name__ == "__main__":
+    import argparse
+    from utils.llm import LocalLLMService
+
+    parser = argparse.ArgumentParser(description="Serve a local batch directory using an Ollama model.")
+    parser.add_argument("directory", help="Directory shared with LocalBatchBackend.")
+    parser.add_argument("--model", required=True, help="Ollama model used to answer every request.")
+    parser.add_argument("--base-url", default="http://localhost:11434")
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    args = parser.parse_args()
+
+    async def serve():
+        async with LocalLLMService(base_url=args.base_url) as llm_service:
+            server = LocalBatchServer.from_service(args.directory, llm_service, model=args.model)
+            await server.serve_forever(poll_interval=args.poll_interval)
+
+    asyncio.run(serve())
@@ -0,0 +1,191 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple, Type
+
+from pydantic import BaseModel
+
+from utils.logger import logger
+
+
+class ResponseCache:
+    """
+    Persistent, content-addressed cache for LLM responses.
+
+    Entries live in a single SQLite file keyed on a hash of
+    (provider, model id, messages, response schema). A small in-memory LRU sits
+    in front of the database so repeated lookups within a run never touch disk.
+    Both apply `max_age_seconds`.
+
+    Calls block on SQLite, so async callers should run them in a thread
+    (`asyncio.to_thread`); the connection is shared under a lock.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_entries: int = 100_000,
+        max_age_seconds: Optional[float] = None,
+        memory_size: int = 1024,
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_seconds
+        self.memory_size = memory_size
+
+        self.hits = 0
+        self.misses = 0
+        self.memory_hits = 0
+        self.evictions = 0
+
+        # key -> (value, created_at)
+        self._memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes_since_evict = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses(accessed_at)")
+        self.evict()
+
+    @staticmethod
+    def make_key(provider: str, model: str, messages: List[dict], response_format: Optional[Type[BaseModel]] = None) -> str:
+        """Build a stable content hash for a request."""
+        payload = {
+            "provider": provider,
+            "model": model,
+            "messages": messages,
+            "schema": response_format.model_json_schema() if response_format is not None else None,
+        }
+        encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+    def _is_expired(self, created_at: float) -> bool:
+        return self.max_age_seconds is not None and time.time() - created_at > self.max_age_seconds
+
+    def _remember(self, key: str, value: str, created_at: float):
+        self._memory[key] = (value, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached value for `key`, or None on a miss."""
+        with self._lock:
+            if key in self._memory:
+                value, created_at = self._memory[key]
+                if not self._is_expired(created_at):
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    self.memory_hits += 1
+                    return value
+                # Expired: drop it here and let the database lookup below delete the row.
+                del self._memory[key]
+
+            row = self._conn.execute(
+                "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            value, created_at = row
+            if self._is_expired(created_at):
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.evictions += 1
+                self.misses += 1
+                return None
+
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            self._remember(key, value, created_at)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: str):
+        """Store `value` under `key`, evicting old entries when the cache grows too large."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            self._remember(key, value, now)
+            self._writes_since_evict += 1
+            should_evict = self._writes_since_evict >= max(1, self.max_entries // 100)
+
+        if should_evict:
+            self.evict()
+
+    def evict(self):
+        """Drop expired entries, then the least recently used ones beyond `max_entries`."""
+        with self._lock:
+            self._writes_since_evict = 0
+            removed = 0
+
+            if self.max_age_seconds is not None:
+                cursor = self._conn.execute(
+                    "DELETE FROM responses WHERE created_at < ?", (time.time() - self.max_age_seconds,)
+                )
+                removed += cursor.rowcount
+
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()
+            overflow = count - self.max_entries
+            if overflow > 0:
+                cursor = self._conn.execute(
+                    "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed_at ASC LIMIT ?)",
+                    (overflow,),
+                )
+                removed += cursor.rowcount
+
+            if removed:
+                self._memory.clear()
+                self.evictions += removed
+                logger.debug(f"Response cache evicted {removed} entries.")
+
+    def get_model(self, key: str, response_format: Type[BaseModel]) -> Optional[BaseModel]:
+        """Return the cached value parsed into `response_format`, treating unparsable entries as misses."""
+        value = self.get(key)
+        if value is None:
+            return None
+        try:
+            return response_format.model_validate_json(value)
+        except ValueError:
+            logger.debug(f"Discarding stale cache entry {key[:12]} that no longer matches {response_format.__name__}.")
+            return None
+
+    def set_model(self, key: str, response: BaseModel):
+        self.set(key, response.model_dump_json())
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "memory_hits": self.memory_hits,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
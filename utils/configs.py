@@ -1,4 +1,32 @@
 import os
 
 OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
\ No newline at end of file
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", ".cache/llm_responses.sqlite")
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "100000"))
+LLM_CACHE_MAX_AGE_SECONDS = float(os.getenv("LLM_CACHE_MAX_AGE_SECONDS", "0")) or None
+
+LLM_INITIAL_CONCURRENCY = int(os.getenv("LLM_INITIAL_CONCURRENCY", "4"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "64"))
+
+# JSON mapping of pipeline stage -> model or cheapest-first list of models, e.g. '{"entities": ["gpt-4o-mini", "gpt-4o"]}'.
+MODEL_ROUTES = os.getenv("MODEL_ROUTES")
+
+# Opt-in semantic trait similarity: a provider embedding model (e.g. "text-embedding-3-small"),
+# or "local:<sentence-transformers model>" to embed on CPU. Empty (the default) keeps exact-match Jaccard.
+TRAIT_EMBEDDING_MODEL = os.getenv("TRAIT_EMBEDDING_MODEL", "")
+EMBEDDING_CACHE_DIRECTORY = os.getenv("EMBEDDING_CACHE_DIRECTORY", ".cache/embeddings")
+
+# Guards for streamed structured output: a generation is cancelled once any list field
+# (entities, relations, ...) exceeds STRUCTURED_MAX_ITEMS items or the response exceeds
+# STRUCTURED_MAX_TOKENS tokens. 0 disables a guard.
+STRUCTURED_MAX_ITEMS = int(os.getenv("STRUCTURED_MAX_ITEMS", "300")) or None
+STRUCTURED_MAX_TOKENS = int(os.getenv("STRUCTURED_MAX_TOKENS", "16000")) or None
+# Re-asks after an invalid or cancelled structured response. The default of 2 (three attempts)
+# matches instructor's default, which LLMService used before it validated responses itself.
+STRUCTURED_MAX_RETRIES = int(os.getenv("STRUCTURED_MAX_RETRIES", "2"))
+
+# Logging: minimum level for the "anyprefer" logger, and "text" (coloured) or "json" (one object per line) output.
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
@@ -9,9 +9,11 @@ GPT_5 = "gpt-5"
 GPT_5_MINI = "gpt-5-mini"
 GPT_5_NANO = "gpt-5-nano"
 GPT_4O_MINI = "gpt-4o-mini"
+TEXT_EMBEDDING_3_SMALL = "text-embedding-3-small"
 
 LLAMA_3_1 = "llama3.1"
 PHI_4 = "phi4"
+NOMIC_EMBED_TEXT = "nomic-embed-text"
 
 PROVIDER_INFORMATION = {
     OPENAI: {
@@ -23,13 +25,29 @@ PROVIDER_INFORMATION = {
             GPT_5_MINI: "gpt-5-mini",
             GPT_5_NANO: "gpt-5-nano",
             GPT_4O_MINI: "gpt-4o-mini",
-        }
+            TEXT_EMBEDDING_3_SMALL: "text-embedding-3-small",
+        },
+        # Per-model (requests/minute, tokens/minute) budgets; None leaves that dimension unbounded.
+        "RATE_LIMITS": {},
+        # Per-model list prices in USD per 1M tokens: (input, cached input, output). Used for cost estimates only.
+        "PRICING": {
+            GPT_4O: (2.50, 1.25, 10.00),
+            GPT_4_1: (2.00, 0.50, 8.00),
+            GPT_5: (1.25, 0.125, 10.00),
+            GPT_5_MINI: (0.25, 0.025, 2.00),
+            GPT_5_NANO: (0.05, 0.005, 0.40),
+            GPT_4O_MINI: (0.15, 0.075, 0.60),
+            TEXT_EMBEDDING_3_SMALL: (0.02, 0.02, 0.0),
+        },
     },
     OLLAMA: {
         "API": (None, "http://localhost:11434"),
         "MODEL_ID": {
             LLAMA_3_1: "llama3.1:latest",
             PHI_4: "phi4:latest",
-        }
+            NOMIC_EMBED_TEXT: "nomic-embed-text:latest",
+        },
+        "RATE_LIMITS": {},
+        "PRICING": {},
     }
 }
\ No newline at end of file
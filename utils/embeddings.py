@@ -0,0 +1,203 @@
+import os
+import json
+import asyncio
+import threading
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from utils.logger import logger
+
+# Model names with this prefix are run locally on CPU with sentence-transformers instead of through the LLM provider.
+LOCAL_PREFIX = "local:"
+
+
+class VectorCache:
+    """
+    Append-only on-disk store of unit-normalised embedding vectors, keyed by text.
+
+    Vectors live in a raw float32 file that is memory-mapped for reads, so a
+    corpus-wide cache costs no resident memory beyond the pages actually touched;
+    `keys.jsonl` records which text owns each row. Rows are written before their
+    keys, so a crash mid-append only leaves unreferenced bytes that are trimmed on open.
+    Should the vectors file still end up short (e.g. a torn write), the keys without
+    a complete row are dropped rather than served as zero vectors.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.vectors_path = os.path.join(directory, "vectors.f32")
+        self.keys_path = os.path.join(directory, "keys.jsonl")
+        self.meta_path = os.path.join(directory, "meta.json")
+
+        self.dim: Optional[int] = None
+        self.rows: Dict[str, int] = {}
+        self._mmap: Optional[np.memmap] = None
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, "r") as f:
+                self.dim = json.load(f)["dim"]
+        torn_keys = False
+        if os.path.exists(self.keys_path):
+            with open(self.keys_path, "r") as f:
+                for line in f:
+                    try:
+                        self.rows.setdefault(json.loads(line), len(self.rows))
+                    except json.JSONDecodeError:
+                        torn_keys = True
+                        break
+        if self.dim is None or not os.path.exists(self.vectors_path):
+            if self.rows:
+                logger.warning(f"Embedding cache {self.directory} has keys but no vectors; starting it afresh.")
+                self.rows = {}
+                self._write_keys()
+            return
+
+        row_bytes = self.dim * 4
+        complete_rows = os.path.getsize(self.vectors_path) // row_bytes
+        if complete_rows < len(self.rows):
+            logger.warning(f"Embedding cache {self.directory} is missing {len(self.rows) - complete_rows} vectors; dropping their keys.")
+            self.rows = {text: row for text, row in self.rows.items() if row < complete_rows}
+            torn_keys = True
+        if torn_keys:
+            self._write_keys()
+        if os.path.getsize(self.vectors_path) != len(self.rows) * row_bytes:
+            # Only ever shrinks: unreferenced rows, or a partial row, from an interrupted append.
+            with open(self.vectors_path, "r+b") as f:
+                f.truncate(len(self.rows) * row_bytes)
+
+    def _write_keys(self):
+        """Atomically rewrite `keys.jsonl` from `rows` (in row order)."""
+        tmp_path = f"{self.keys_path}.tmp"
+        with open(tmp_path, "w") as f:
+            for text in sorted(self.rows, key=self.rows.get):
+                f.write(json.dumps(text) + "\n")
+        os.replace(tmp_path, self.keys_path)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __contains__(self, text: str) -> bool:
+        return text in self.rows
+
+    def _matrix(self) -> np.ndarray:
+        if self._mmap is None or self._mmap.shape[0] != len(self.rows):
+            self._mmap = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(len(self.rows), self.dim))
+        return self._mmap
+
+    def get(self, texts: Sequence[str]) -> np.ndarray:
+        """Stacked vectors for `texts`, all of which must be cached."""
+        with self._lock:
+            return np.asarray(self._matrix()[[self.rows[t] for t in texts]])
+
+    def add(self, texts: Sequence[str], vectors: np.ndarray):
+        """Store vectors for `texts` (normalised to unit length); texts already cached are ignored."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms > 0, norms, 1.0)
+
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                with open(self.meta_path, "w") as f:
+                    json.dump({"dim": self.dim}, f)
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match cache dimension {self.dim}")
+
+            new = [(text, vector) for text, vector in zip(texts, vectors) if text not in self.rows]
+            new = list({text: vector for text, vector in new}.items())
+            if not new:
+                return
+            with open(self.vectors_path, "ab") as f:
+                f.write(np.stack([vector for _, vector in new]).tobytes())
+            with open(self.keys_path, "a") as f:
+                for text, _ in new:
+                    f.write(json.dumps(text) + "\n")
+                    self.rows[text] = len(self.rows)
+
+
+class SentenceTransformerEncoder:
+    """CPU embedding model via sentence-transformers (optional dependency)."""
+
+    def __init__(self, model_name: str):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            raise ImportError("sentence-transformers is not installed. Install it with 'pip install sentence-transformers'.")
+        self.model = SentenceTransformer(model_name, device="cpu")
+
+    async def encode(self, texts: List[str]) -> np.ndarray:
+        return await asyncio.to_thread(self.model.encode, texts, convert_to_numpy=True, show_progress_bar=False)
+
+
+class TextEmbedder:
+    """
+    Embeds short texts (e.g. personality traits) through an LLM service's `embed`
+    or a local CPU model, computing each unique text once and caching its vector
+    on disk. `model` is a provider model name, or `local:<sentence-transformers model>`.
+    """
+
+    def __init__(self, model: str, llm_service=None, cache_directory: str = ".cache/embeddings", batch_size: int = 256):
+        self.model = model
+        self.llm_service = llm_service
+        self.batch_size = batch_size
+        if model.startswith(LOCAL_PREFIX):
+            self.encoder = SentenceTransformerEncoder(model[len(LOCAL_PREFIX):])
+            provider = "local"
+        else:
+            if llm_service is None:
+                raise ValueError(f"An LLM service is required to embed with provider model '{model}'.")
+            self.encoder = None
+            provider = llm_service.name
+        safe_name = "".join(c if c.isalnum() or c in "-_." else "_" for c in f"{provider}_{model}")
+        self.cache = VectorCache(os.path.join(cache_directory, safe_name))
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    async def _encode(self, texts: List[str]) -> Optional[np.ndarray]:
+        if self.encoder is not None:
+            return await self.encoder.encode(texts)
+        vectors = await self.llm_service.embed(model=self.model, texts=texts)
+        return np.asarray(vectors, dtype=np.float32) if vectors is not None else None
+
+    async def embed(self, texts: Sequence[str]) -> Optional[np.ndarray]:
+        """
+        Unit-normalised vectors for `texts`, one row each. Missing texts are embedded in
+        batches of `batch_size`; texts already being embedded by a concurrent call are
+        awaited rather than requested twice. Returns None if embedding fails.
+        """
+        unique = list(dict.fromkeys(texts))
+        missing = [t for t in unique if t not in self.cache and t not in self._inflight]
+        waiting = {self._inflight[t] for t in unique if t in self._inflight}
+
+        if missing:
+            future = asyncio.get_running_loop().create_future()
+            for text in missing:
+                self._inflight[text] = future
+            try:
+                for start in range(0, len(missing), self.batch_size):
+                    batch = missing[start:start + self.batch_size]
+                    vectors = await self._encode(batch)
+                    if vectors is None or len(vectors) != len(batch):
+                        raise RuntimeError(f"embedding model {self.model} returned no vectors")
+                    # Appends to the vector files; VectorCache locks around it, so it can run off the loop.
+                    await asyncio.to_thread(self.cache.add, batch, vectors)
+                future.set_result(True)
+            except Exception as e:
+                logger.error(f"Failed to embed {len(missing)} texts: {e}")
+                future.set_result(False)
+            finally:
+                # Also on cancellation, so concurrent callers waiting on these texts are released.
+                if not future.done():
+                    future.set_result(False)
+                for text in missing:
+                    self._inflight.pop(text, None)
+
+        if waiting:
+            await asyncio.gather(*waiting)
+        if any(t not in self.cache for t in unique):
+            return None
+        return self.cache.get(list(texts))
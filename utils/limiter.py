@@ -0,0 +1,207 @@
+import time
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, Optional, Tuple
+
+from utils.logger import logger
+from utils.streaming import StreamAborted
+
+
+def estimate_tokens(messages) -> int:
+    """Rough prompt-size estimate (~4 characters per token) used for budgeting before a call."""
+    return sum(len(str(m.get("content") or "")) for m in messages) // 4 + 1
+
+
+def is_throttle_error(exc: BaseException) -> bool:
+    """True for rate-limit (429) and server-side (5xx) failures, including wrapped ones."""
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        status = getattr(exc, "status_code", None) or getattr(exc, "status", None)
+        if isinstance(status, int) and (status == 429 or status >= 500):
+            return True
+        if type(exc).__name__ in ("RateLimitError", "APITimeoutError", "InternalServerError"):
+            return True
+        exc = exc.__cause__ or exc.__context__
+    return False
+
+
+class RateBudget:
+    """Token-bucket budget for requests-per-minute and tokens-per-minute of a single model."""
+
+    def __init__(self, rpm: Optional[int] = None, tpm: Optional[int] = None):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._requests = float(rpm) if rpm else 0.0
+        self._tokens = float(tpm) if tpm else 0.0
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        if self.rpm:
+            self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+        if self.tpm:
+            self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+
+    def delay(self, tokens: int) -> float:
+        """Seconds to wait until a request of `tokens` fits the budget (0 if it fits now)."""
+        self._refill()
+        wait = 0.0
+        if self.rpm and self._requests < 1:
+            wait = max(wait, (1 - self._requests) * 60 / self.rpm)
+        if self.tpm:
+            needed = min(tokens, self.tpm)
+            if self._tokens < needed:
+                wait = max(wait, (needed - self._tokens) * 60 / self.tpm)
+        return wait
+
+    def consume(self, tokens: int):
+        self._refill()
+        if self.rpm:
+            self._requests -= 1
+        if self.tpm:
+            self._tokens -= tokens
+
+    def adjust(self, tokens: int):
+        """Correct the token balance once the real usage of a request is known."""
+        if self.tpm:
+            self._tokens -= tokens
+
+
+class Slot:
+    """Handle for an in-flight request; set `tokens` to the actual usage once known."""
+
+    def __init__(self, model: str, estimated_tokens: int):
+        self.model = model
+        self.estimated_tokens = estimated_tokens
+        self.tokens: Optional[int] = None
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limiter for LLM calls.
+
+    The number of in-flight requests grows additively while latency stays close
+    to its observed baseline and is cut multiplicatively on 429/5xx responses or
+    when the p95 latency of recent calls drifts above the baseline. Optional
+    per-model RPM/TPM budgets are enforced on top of the concurrency limit.
+    """
+
+    def __init__(
+        self,
+        initial_limit: int = 4,
+        min_limit: int = 1,
+        max_limit: int = 64,
+        backoff_factor: float = 0.5,
+        latency_tolerance: float = 2.0,
+        window: int = 50,
+        rate_limits: Optional[Dict[str, Tuple[Optional[int], Optional[int]]]] = None,
+    ):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff_factor = backoff_factor
+        self.latency_tolerance = latency_tolerance
+
+        self._latencies: deque = deque(maxlen=window)
+        self._baseline: Optional[float] = None
+        self._last_backoff = 0.0
+        self._in_flight = 0
+        self._condition = asyncio.Condition()
+        self._budgets = {model: RateBudget(rpm, tpm) for model, (rpm, tpm) in (rate_limits or {}).items()}
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def _p95(self) -> Optional[float]:
+        if len(self._latencies) < 10:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[int(0.95 * (len(ordered) - 1))]
+
+    def _backoff(self, reason: str):
+        # Only cut once per observed round-trip, otherwise a burst of failures collapses the limit to the floor.
+        now = time.monotonic()
+        if now - self._last_backoff < (self._baseline or 1.0):
+            return
+        self._last_backoff = now
+        previous = self.limit
+        self.limit = max(self.min_limit, self.limit * self.backoff_factor)
+        logger.debug(f"Concurrency limit {previous:.1f} -> {self.limit:.1f} ({reason}).")
+
+    def _record(self, latency: float, throttled: bool):
+        if throttled:
+            self._backoff("throttled")
+            return
+
+        self._latencies.append(latency)
+        p95 = self._p95()
+        if p95 is None:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            return
+
+        if self._baseline is None or p95 < self._baseline:
+            self._baseline = p95
+        else:
+            # Let the baseline drift slowly so a permanently slower backend doesn't pin the limit low.
+            self._baseline = 0.99 * self._baseline + 0.01 * p95
+
+        if p95 > self._baseline * self.latency_tolerance:
+            self._backoff(f"p95 {p95:.2f}s vs baseline {self._baseline:.2f}s")
+        else:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    async def _acquire(self, model: str, tokens: int):
+        budget = self._budgets.get(model)
+        async with self._condition:
+            while True:
+                await self._condition.wait_for(lambda: self._in_flight < int(self.limit))
+                wait = budget.delay(tokens) if budget else 0.0
+                if wait <= 0:
+                    break
+                # Give up the lock while waiting for the budget so other models can proceed.
+                self._condition.release()
+                try:
+                    await asyncio.sleep(wait)
+                finally:
+                    await self._condition.acquire()
+            if budget:
+                budget.consume(tokens)
+            self._in_flight += 1
+
+    async def _release(self):
+        async with self._condition:
+            self._in_flight -= 1
+            self._condition.notify_all()
+
+    @asynccontextmanager
+    async def slot(self, model: str, estimated_tokens: int = 0):
+        """Hold one request slot for `model` for the duration of the block."""
+        await self._acquire(model, estimated_tokens)
+        slot = Slot(model, estimated_tokens)
+        start = time.monotonic()
+        throttled = cancelled = False
+        try:
+            yield slot
+        except BaseException as e:
+            throttled = is_throttle_error(e)
+            # Cancelled calls (including streams aborted early) say nothing about backend latency.
+            cancelled = isinstance(e, (asyncio.CancelledError, StreamAborted))
+            raise
+        finally:
+            if not cancelled:
+                self._record(time.monotonic() - start, throttled)
+            budget = self._budgets.get(model)
+            if budget and slot.tokens is not None:
+                budget.adjust(slot.tokens - estimated_tokens)
+            await self._release()
+
+
+@asynccontextmanager
+async def null_slot(model: str):
+    """Stand-in for `AdaptiveLimiter.slot` when no limiter is configured."""
+    yield Slot(model, 0)
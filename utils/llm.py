@@ -1,16 +1,147 @@
-import instructor
 from openai import AsyncOpenAI
 from abc import ABC, abstractmethod
-from typing import List, Literal, Union
-from pydantic import BaseModel
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Literal, Optional, Union
+from pydantic import BaseModel, ValidationError
 import json
+import time
+import asyncio
 import aiohttp
 
 from utils.logger import logger
-from utils.constants import PROVIDER_INFORMATION
+from utils.cache import ResponseCache
+from utils.limiter import AdaptiveLimiter, estimate_tokens, null_slot
+from utils.constants import PROVIDER_INFORMATION, OLLAMA
+from utils.configs import STRUCTURED_MAX_ITEMS, STRUCTURED_MAX_TOKENS, STRUCTURED_MAX_RETRIES
+from utils.streaming import StreamAborted, StreamingJSONValidator
+from utils.metrics import (
+    metrics,
+    current_llm_stage,
+    LLM_REQUEST_SECONDS,
+    LLM_QUEUE_WAIT_SECONDS,
+    LLM_REQUESTS_TOTAL,
+    LLM_RETRIES_TOTAL,
+    LLM_TOKENS_TOTAL,
+    LLM_COST_USD_TOTAL,
+)
 from utils.tools.base import BaseTool
 
+def schema_instruction(response_format: BaseModel) -> dict:
+    """
+    System message asking for JSON matching `response_format`. It is appended after
+    the conversation rather than prepended, so calls with different schemas still
+    share their prompt prefix for provider-side prompt caching.
+    """
+    return {
+        "role": "system",
+        "content": (
+            "Respond strictly in JSON format matching this schema:\n"
+            f"{response_format.model_json_schema()}"
+        )
+    }
+
+
 class BaseLLMService(ABC):
+    name: str
+    cache: Optional[ResponseCache] = None
+    limiter: Optional[AdaptiveLimiter] = None
+    # Accumulated token usage per model: prompt, completion and prompt-cache hits.
+    usage: Dict[str, Dict[str, int]]
+    # Multiplier on list prices for cost estimates (e.g. batch API discounts).
+    price_factor: float = 1.0
+
+    @asynccontextmanager
+    async def _slot(self, model: str, messages: List[dict]):
+        """
+        Concurrency/rate-limit slot for one request (a no-op when no limiter is
+        configured). Records the wait for the slot, the request duration and its outcome.
+        """
+        stage = current_llm_stage()
+        requested = time.monotonic()
+        inner = null_slot(model) if self.limiter is None else self.limiter.slot(model, estimate_tokens(messages))
+        async with inner as slot:
+            started = time.monotonic()
+            metrics.observe(LLM_QUEUE_WAIT_SECONDS, started - requested, model=model, stage=stage)
+            outcome = "ok"
+            try:
+                yield slot
+            except StreamAborted:
+                outcome = "cancelled"
+                raise
+            except BaseException:
+                outcome = "error"
+                raise
+            finally:
+                metrics.observe(LLM_REQUEST_SECONDS, time.monotonic() - started, model=model, stage=stage)
+                metrics.inc(LLM_REQUESTS_TOTAL, model=model, stage=stage, outcome=outcome)
+
+    def _get_model_id(self, model: str):
+        """(generic model name, provider model id) for `model`."""
+        model_ids = PROVIDER_INFORMATION[self.name]["MODEL_ID"]
+        if model not in model_ids:
+            raise ValueError(f"Unknown {self.name} model '{model}'. Expected one of {sorted(model_ids)}.")
+        return model, model_ids[model]
+
+    def _record_retry(self, model: str, reason: str):
+        metrics.inc(LLM_RETRIES_TOTAL, model=model, stage=current_llm_stage(), reason=reason)
+
+    def _record_usage(self, model: str, usage: Any) -> Optional[int]:
+        """Accumulate an OpenAI-style usage object or dict for `model`; returns the total tokens."""
+        if usage is None:
+            return None
+        if not isinstance(usage, dict):
+            usage = usage.model_dump()
+        prompt_tokens = usage.get("prompt_tokens") or 0
+        completion_tokens = usage.get("completion_tokens") or 0
+        cached_tokens = (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+
+        totals = self.usage.setdefault(model, {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0})
+        totals["requests"] += 1
+        totals["prompt_tokens"] += prompt_tokens
+        totals["completion_tokens"] += completion_tokens
+        totals["cached_tokens"] += cached_tokens
+
+        stage = current_llm_stage()
+        metrics.inc(LLM_TOKENS_TOTAL, prompt_tokens, model=model, stage=stage, kind="prompt")
+        metrics.inc(LLM_TOKENS_TOTAL, completion_tokens, model=model, stage=stage, kind="completion")
+        metrics.inc(LLM_TOKENS_TOTAL, cached_tokens, model=model, stage=stage, kind="cached")
+        price = PROVIDER_INFORMATION.get(self.name, {}).get("PRICING", {}).get(model)
+        if price is not None:
+            input_price, cached_price, output_price = price
+            cost = ((prompt_tokens - cached_tokens) * input_price + cached_tokens * cached_price + completion_tokens * output_price) / 1e6
+            metrics.inc(LLM_COST_USD_TOTAL, cost * self.price_factor, model=model, stage=stage)
+        return prompt_tokens + completion_tokens
+
+    def _cache_key(self, model: str, messages: List[dict], response_format: BaseModel) -> Optional[str]:
+        if self.cache is None:
+            return None
+        return self.cache.make_key(self.name, model, messages, response_format)
+
+    # The response cache blocks on SQLite (and occasionally evicts), so it is used from a thread.
+    async def _cache_get(self, key: Optional[str], response_format: BaseModel):
+        if key is None:
+            return None
+        return await asyncio.to_thread(self.cache.get_model, key, response_format)
+
+    async def _cache_set(self, key: Optional[str], response: Optional[BaseModel]):
+        if key is not None and response is not None:
+            await asyncio.to_thread(self.cache.set_model, key, response)
+
+    async def close(self):
+        """Release any network resources held by the service."""
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def embed(self, model: str, texts: List[str]) -> Optional[List[List[float]]]:
+        """Embedding vectors for `texts`, one per text, or None when unsupported or failed."""
+        logger.error(f"{self.name} service does not support embeddings.")
+        return None
+
     @abstractmethod
     async def call_llm(self, model: str, messages: List[dict]):
         pass
@@ -24,8 +155,24 @@ class BaseLLMService(ABC):
         pass
 
 class LLMService(BaseLLMService):
-    def __init__(self, name: str):
+    def __init__(
+        self,
+        name: str,
+        cache: Optional[ResponseCache] = None,
+        limiter: Optional[AdaptiveLimiter] = None,
+        max_validation_retries: int = STRUCTURED_MAX_RETRIES,
+        stream_structured: bool = True,
+        max_items: Optional[int] = STRUCTURED_MAX_ITEMS,
+        max_tokens: Optional[int] = STRUCTURED_MAX_TOKENS,
+    ):
         self.name = name
+        self.cache = cache
+        self.limiter = limiter
+        self.usage = {}
+        self.max_validation_retries = max_validation_retries
+        self.stream_structured = stream_structured
+        self.max_items = max_items
+        self.max_tokens = max_tokens
         api_key, base_url = PROVIDER_INFORMATION[name]["API"]
         self.client = AsyncOpenAI(
             api_key=api_key,
@@ -33,46 +180,130 @@ class LLMService(BaseLLMService):
             max_retries=2
         )
 
-    def _get_model_id(self, model: str):
-        return model, PROVIDER_INFORMATION[self.name]["MODEL_ID"][model]
+    async def close(self):
+        await self.client.close()
 
     async def call_llm(self, model: str, messages: List[dict]):
         """Call the LLM with the given model and messages."""
         generic_model_name, model = self._get_model_id(model)
         try:
-            response = await self.client.chat.completions.create(
-                model=model,
-                messages=messages,
-            )
+            async with self._slot(generic_model_name, messages) as slot:
+                response = await self.client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                )
+                slot.tokens = self._record_usage(generic_model_name, response.usage)
             return response.choices[0].message.content if response.choices else None
         except Exception as e:
             logger.error(f"{self.name} LLM service failed to call model {generic_model_name}: {e}")
             return None
 
-    async def call_llm_structured(self, model: str, messages: List[dict], response_format: BaseModel):
-        """Call the LLM with the given model and messages."""
-        generic_model_name, model = self._get_model_id(model)
-        try:
-            structured_client = instructor.from_openai(self.client, mode=instructor.Mode.JSON)
-            response = await structured_client.chat.completions.create(
+    async def _complete_json(self, generic_model_name: str, model: str, messages: List[dict], validator: StreamingJSONValidator) -> str:
+        """
+        One JSON-mode completion, returning its text. When streaming, chunks are fed to
+        `validator` as they arrive; if it raises `StreamAborted` the stream is closed,
+        which drops the connection and stops the generation server-side.
+        """
+        async with self._slot(generic_model_name, messages) as slot:
+            if not self.stream_structured:
+                completion = await self.client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    response_format={"type": "json_object"},
+                )
+                slot.tokens = self._record_usage(generic_model_name, completion.usage)
+                return completion.choices[0].message.content or ""
+
+            stream = await self.client.chat.completions.create(
                 model=model,
                 messages=messages,
-                response_model=response_format,
+                response_format={"type": "json_object"},
+                stream=True,
+                stream_options={"include_usage": True},
             )
+            usage = None
+            try:
+                async for chunk in stream:
+                    if chunk.usage is not None:
+                        usage = chunk.usage
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        validator.feed(chunk.choices[0].delta.content)
+            finally:
+                await stream.close()
+                # A cancelled stream never reports usage; count what was generated.
+                slot.tokens = self._record_usage(generic_model_name, usage or {
+                    "prompt_tokens": estimate_tokens(messages),
+                    "completion_tokens": validator.tokens,
+                })
+            return validator.json_text()
+
+    async def call_llm_structured(self, model: str, messages: List[dict], response_format: BaseModel):
+        """
+        Call the LLM with the given model and messages and parse the reply into `response_format`.
+
+        A reply that fails validation, or a stream cancelled by the validator, is re-asked with
+        the reason up to `max_validation_retries` times. Transport and API errors are not
+        re-asked here; the OpenAI client already retries those.
+        """
+        generic_model_name, model = self._get_model_id(model)
+        cache_key = self._cache_key(model, messages, response_format)
+        cached = await self._cache_get(cache_key, response_format)
+        if cached is not None:
+            return cached
+        try:
+            structured_messages = messages + [schema_instruction(response_format)]
+            for attempt in range(self.max_validation_retries + 1):
+                validator = StreamingJSONValidator(response_format, max_items=self.max_items, max_tokens=self.max_tokens)
+                try:
+                    content = await self._complete_json(generic_model_name, model, structured_messages, validator)
+                    response = response_format.model_validate_json(content)
+                    break
+                except StreamAborted as e:
+                    if attempt == self.max_validation_retries:
+                        raise
+                    logger.debug(f"{generic_model_name} stream for {response_format.__name__} cancelled ({e}); re-asking.")
+                    self._record_retry(generic_model_name, "stream_aborted")
+                    structured_messages = structured_messages + [
+                        {"role": "user", "content": f"Your previous answer was cancelled: {e}. Return complete, valid JSON only."},
+                    ]
+                except ValidationError as e:
+                    if attempt == self.max_validation_retries:
+                        raise
+                    logger.debug(f"{generic_model_name} returned invalid {response_format.__name__}; re-asking.")
+                    self._record_retry(generic_model_name, "validation")
+                    structured_messages = structured_messages + [
+                        {"role": "assistant", "content": content},
+                        {"role": "user", "content": f"That JSON failed validation:\n{e}\nReturn corrected JSON only."},
+                    ]
+            await self._cache_set(cache_key, response)
             return response
         except Exception as e:
             logger.error(f"{self.name} LLM service failed to call model {generic_model_name}: {e}")
             return None
     
+    async def embed(self, model: str, texts: List[str]) -> Optional[List[List[float]]]:
+        """Embed `texts` in a single request."""
+        generic_model_name, model = self._get_model_id(model)
+        try:
+            async with self._slot(generic_model_name, [{"role": "user", "content": " ".join(texts)}]) as slot:
+                response = await self.client.embeddings.create(model=model, input=texts)
+                slot.tokens = self._record_usage(generic_model_name, response.usage)
+            return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+        except Exception as e:
+            logger.error(f"{self.name} LLM service failed to embed with model {generic_model_name}: {e}")
+            return None
+
     async def call_llm_tools(self, model: str, messages: List[dict], tools: dict[str, BaseTool], tool_choice: Union[Literal['auto', 'none'], dict] = 'auto'):
         generic_model_name, model = self._get_model_id(model)
         try:
-            response = await self.client.chat.completions.create(
-                model=model,
-                messages=messages,
-                tools=[tool().openai_dict for tool in tools.values()],
-                tool_choice=tool_choice
-            )
+            async with self._slot(generic_model_name, messages) as slot:
+                response = await self.client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    tools=[tool().openai_dict for tool in tools.values()],
+                    tool_choice=tool_choice
+                )
+                slot.tokens = self._record_usage(generic_model_name, response.usage)
 
             if response.choices and len(response.choices) > 0 and hasattr(response.choices[0].message, 'tool_calls'):
                 tool_response = response.choices[0].message.tool_calls
@@ -86,21 +317,129 @@ class LLMService(BaseLLMService):
             return None
 
 
+class OllamaError(RuntimeError):
+    def __init__(self, status: int, text: str):
+        super().__init__(f"Ollama returned {status}: {text}")
+        self.status = status
+
+
 class LocalLLMService(BaseLLMService):
-    def __init__(self, base_url: str = "http://localhost:11434"):
+    """
+    Ollama-backed service. Owns a pooled, keep-alive HTTP session that is created
+    on first use; use `async with LocalLLMService(...)` (or call `close()`) to release it.
+    """
+
+    def __init__(
+        self,
+        base_url: str = "http://localhost:11434",
+        cache: Optional[ResponseCache] = None,
+        limiter: Optional[AdaptiveLimiter] = None,
+        max_connections_per_host: int = 32,
+        keepalive_timeout: float = 60.0,
+        request_timeout: Optional[float] = 600.0,
+        stream_structured: bool = True,
+        max_items: Optional[int] = STRUCTURED_MAX_ITEMS,
+        max_tokens: Optional[int] = STRUCTURED_MAX_TOKENS,
+    ):
+        self.name = OLLAMA
         self.base_url = base_url.rstrip("/")
+        self.cache = cache
+        self.limiter = limiter
+        self.usage = {}
+        self.stream_structured = stream_structured
+        self.max_items = max_items
+        self.max_tokens = max_tokens
+        self.max_connections_per_host = max_connections_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.request_timeout = request_timeout
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections_per_host,
+                limit_per_host=self.max_connections_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.request_timeout),
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
 
     async def _ollama_chat(self, model: str, messages: List[dict]):
         """Low-level async wrapper for Ollama's /api/chat endpoint."""
         url = f"{self.base_url}/api/chat"
         payload = {"model": model, "messages": messages, "stream": False}
 
-        async with aiohttp.ClientSession() as session:
+        async with self._slot(model, messages) as slot:
+            session = self._get_session()
             async with session.post(url, json=payload) as response:
                 if response.status != 200:
                     text = await response.text()
-                    raise RuntimeError(f"Ollama returned {response.status}: {text}")
-                return await response.json()
+                    raise OllamaError(response.status, text)
+                result = await response.json()
+            slot.tokens = self._record_usage(model, {
+                "prompt_tokens": result.get("prompt_eval_count", 0),
+                "completion_tokens": result.get("eval_count", 0),
+            })
+            return result
+
+    async def _ollama_chat_stream(self, model: str, messages: List[dict], validator: StreamingJSONValidator) -> str:
+        """
+        Streaming /api/chat: each NDJSON chunk is fed to `validator`. If it raises
+        `StreamAborted` the connection is closed, which makes Ollama stop generating.
+        """
+        url = f"{self.base_url}/api/chat"
+        payload = {"model": model, "messages": messages, "stream": True}
+
+        async with self._slot(model, messages) as slot:
+            session = self._get_session()
+            usage = {"prompt_tokens": estimate_tokens(messages), "completion_tokens": 0}
+            try:
+                async with session.post(url, json=payload) as response:
+                    if response.status != 200:
+                        text = await response.text()
+                        raise OllamaError(response.status, text)
+                    try:
+                        async for line in response.content:
+                            if not line.strip():
+                                continue
+                            chunk = json.loads(line)
+                            if chunk.get("done"):
+                                usage = {
+                                    "prompt_tokens": chunk.get("prompt_eval_count", 0),
+                                    "completion_tokens": chunk.get("eval_count", 0),
+                                }
+                                break
+                            validator.feed(chunk.get("message", {}).get("content", ""))
+                    except StreamAborted:
+                        response.close()
+                        usage["completion_tokens"] = validator.tokens
+                        raise
+            finally:
+                slot.tokens = self._record_usage(model, usage)
+            return validator.json_text()
+
+    async def embed(self, model: str, texts: List[str]) -> Optional[List[List[float]]]:
+        """Embed `texts` in a single request to Ollama's /api/embed endpoint."""
+        try:
+            async with self._slot(model, [{"role": "user", "content": " ".join(texts)}]) as slot:
+                session = self._get_session()
+                async with session.post(f"{self.base_url}/api/embed", json={"model": model, "input": texts}) as response:
+                    if response.status != 200:
+                        raise OllamaError(response.status, await response.text())
+                    result = await response.json()
+                slot.tokens = self._record_usage(model, {"prompt_tokens": result.get("prompt_eval_count", 0)})
+            return result["embeddings"]
+        except Exception as e:
+            logger.error(f"Local LLM service failed to embed with model {model}: {e}")
+            return None
 
     async def call_llm(self, model: str, messages: List[dict]):
         """Call local Ollama model."""
@@ -114,24 +453,26 @@ class LocalLLMService(BaseLLMService):
 
     async def call_llm_structured(self, model: str, messages: List[dict], response_format: BaseModel):
         """Simulate structured output by parsing into pydantic model."""
+        cache_key = self._cache_key(model, messages, response_format)
+        cached = await self._cache_get(cache_key, response_format)
+        if cached is not None:
+            return cached
         try:
-            system_instruction = {
-                "role": "system",
-                "content": (
-                    "Respond strictly in JSON format matching this schema:\n"
-                    f"{response_format.model_json_schema()}"
-                )
-            }
-            structured_messages = [system_instruction] + messages
+            structured_messages = messages + [schema_instruction(response_format)]
 
-            response = await self._ollama_chat(model, structured_messages)
-            content = response.get("message", {}).get("content")
+            if self.stream_structured:
+                validator = StreamingJSONValidator(response_format, max_items=self.max_items, max_tokens=self.max_tokens)
+                json_str = await self._ollama_chat_stream(model, structured_messages, validator)
+            else:
+                response = await self._ollama_chat(model, structured_messages)
+                content = response.get("message", {}).get("content")
+                json_start = content.find('{')
+                json_str = content[json_start:]
 
             # Parse the response content into the provided Pydantic model
-            json_start = content.find('{')
-            json_str = content[json_start:]
-            parsed = json.loads(json_str)
-            return response_format.parse_obj(parsed)
+            result = response_format.model_validate_json(json_str)
+            await self._cache_set(cache_key, result)
+            return result
         except Exception as e:
             logger.error(f"Local structured call failed for model {model}: {e}")
             return None
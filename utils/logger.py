@@ -1,18 +1,73 @@
+import atexit
+import copy
+import contextvars
+import json
 import logging
+import logging.handlers
+import queue
 import sys
 import uuid
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from utils.configs import LOG_LEVEL, LOG_FORMAT
+
+TEXT = "text"
+JSON = "json"
+LOG_FORMATS = (TEXT, JSON)
+LOG_LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL")
 
 def get_request_id():
-    """Generate a unique request ID for logging."""
-    return str(uuid.uuid4())
+    """Generate a unique request ID for logging (also used as the id of generated documents)."""
+    return uuid.uuid4().hex
 
-# Create a custom logger
-logger = logging.getLogger("anyprefer")
-logger.setLevel(logging.DEBUG)  # Set lowest level to capture all logs
+# Correlation fields (document id, pipeline stage, ...) attached to every record logged
+# from the current task or thread; see `log_context`.
+_log_context: contextvars.ContextVar[Dict[str, str]] = contextvars.ContextVar("log_context", default={})
+
+
+@contextmanager
+def log_context(**fields: Optional[str]):
+    """
+    Tag records logged inside the block (including from tasks it creates) with `fields`,
+    on top of the enclosing context. A field set to None is removed.
+    """
+    context = {**_log_context.get(), **fields}
+    token = _log_context.set({key: value for key, value in context.items() if value is not None})
+    try:
+        yield
+    finally:
+        _log_context.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    """Copies the current log context onto the record before it leaves the calling task."""
+    def filter(self, record):
+        record.context = _log_context.get()
+        return True
+
+
+class ContextQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler that renders the message in the caller, as the stock one does, but keeps
+    the traceback as `exc_text` instead of folding it into the message, so the JSON formatter
+    can emit it as its own field.
+    """
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = _exception_formatter.formatException(record.exc_info)
+            # Tracebacks hold frame references and cannot cross to the listener thread safely.
+            record.exc_info = None
+        return record
+
+
+_exception_formatter = logging.Formatter()
 
-# Create handler for stdout
-console_handler = logging.StreamHandler(sys.stdout)
-console_handler.setLevel(logging.DEBUG)  # You can adjust this if needed
 
 class ColorFormatter(logging.Formatter):
     """Custom formatter to add colors to log levels."""
@@ -24,17 +79,72 @@ class ColorFormatter(logging.Formatter):
         "CRITICAL": "\033[95m",  # Magenta
     }
     RESET = "\033[0m"
+
+    def __init__(self):
+        super().__init__()
+        # One formatter per level, built once instead of per record.
+        self._formatters = {
+            level: logging.Formatter(f"[%(asctime)s] — ({color}%(levelname)s{self.RESET}) - %(context_text)s{color}%(message)s{self.RESET}")
+            for level, color in self.COLORS.items()
+        }
+        self._default = logging.Formatter("[%(asctime)s] — (%(levelname)s) - %(context_text)s%(message)s")
+
+    def format(self, record):
+        context = getattr(record, "context", None)
+        record.context_text = "".join(f"[{key}={value}] " for key, value in context.items()) if context else ""
+        return self._formatters.get(record.levelname, self._default).format(record)
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line, with the log context as top-level fields."""
     def format(self, record):
-        level_color = self.COLORS.get(record.levelname, self.RESET)
-        log_fmt = f"[%(asctime)s] — ({level_color}%(levelname)s{self.RESET}) - {level_color}%(message)s{self.RESET}"
-        formatter = logging.Formatter(log_fmt)
-        return formatter.format(record)
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            **getattr(record, "context", {}),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = record.stack_info
+        return json.dumps(entry, ensure_ascii=False, default=str)
 
 
-# Formatter
-formatter = ColorFormatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-console_handler.setFormatter(formatter)
+def make_formatter(fmt: str) -> logging.Formatter:
+    if fmt not in LOG_FORMATS:
+        raise ValueError(f"Unknown log format '{fmt}'; expected one of {LOG_FORMATS}.")
+    return JSONFormatter() if fmt == JSON else ColorFormatter()
+
+
+# Create a custom logger
+logger = logging.getLogger("anyprefer")
+logger.setLevel(LOG_LEVEL.upper())
+
+# Create handler for stdout. It runs on a background thread behind a queue, so logging from
+# the event loop only enqueues the record; formatting and writing happen off the loop.
+console_handler = logging.StreamHandler(sys.stdout)
+console_handler.setFormatter(make_formatter(LOG_FORMAT))
+
+_queue: queue.SimpleQueue = queue.SimpleQueue()
+queue_handler = ContextQueueHandler(_queue)
+queue_handler.addFilter(ContextFilter())
+listener = logging.handlers.QueueListener(_queue, console_handler, respect_handler_level=True)
 
 # Avoid duplicate logs if handler already added
 if not logger.hasHandlers():
-    logger.addHandler(console_handler)
+    logger.addHandler(queue_handler)
+    listener.start()
+    # Flush queued records on exit.
+    atexit.register(listener.stop)
+
+
+def configure_logging(level: Optional[str] = None, fmt: Optional[str] = None):
+    """Override the LOG_LEVEL / LOG_FORMAT settings, e.g. from command-line flags."""
+    if level:
+        logger.setLevel(level.upper())
+    if fmt:
+        console_handler.setFormatter(make_formatter(fmt))
@@ -0,0 +1,124 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from typing import Dict, Optional
+
+from pydantic import BaseModel
+
+from utils.logger import logger
+
+DONE = "done"
+FAILED = "failed"
+
+
+def fingerprint(*parts: str) -> str:
+    """Short, stable hash of the given strings (used for pipeline/prompt versions)."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()[:16]
+
+
+class RunManifest:
+    """
+    Append-only journal of processed documents.
+
+    Each line records the content hash of a document, the pipeline version it was
+    processed with and whether it succeeded. Appending a single line per document
+    keeps checkpoints atomic and O(1); the journal is compacted on load so it
+    never grows beyond one line per document.
+
+    `settings` (e.g. the judge policy or result sink) are recorded with each entry
+    but, unlike `version`, do not make finished documents stale; see `changed_settings`.
+    """
+
+    def __init__(self, path: str, version: str, settings: Optional[Dict[str, str]] = None):
+        self.path = path
+        self.version = version
+        self.settings = settings or {}
+        self._entries: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._load()
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    @staticmethod
+    def document_hash(document: BaseModel) -> str:
+        # Unset optional fields are left out, so adding one to a model keeps existing hashes.
+        return hashlib.sha256(document.model_dump_json(exclude_none=True).encode("utf-8")).hexdigest()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn final line from a crash mid-write; everything before it is intact.
+                    continue
+                self._entries[entry["hash"]] = entry
+
+        self._compact()
+        done = sum(1 for entry in self._entries.values() if self._is_current(entry))
+        logger.info(f"Loaded run manifest with {len(self._entries)} documents ({done} up to date).")
+
+    def _compact(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for entry in self._entries.values():
+                f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def _is_current(self, entry: Optional[dict]) -> bool:
+        return entry is not None and entry["status"] == DONE and entry["version"] == self.version
+
+    def is_done(self, doc_hash: str) -> bool:
+        """True if the document was processed successfully by the current pipeline version."""
+        return self._is_current(self._entries.get(doc_hash))
+
+    def changed_settings(self) -> Dict[str, int]:
+        """For each setting, the number of up-to-date documents that were processed with a different value."""
+        changed: Dict[str, int] = {}
+        for entry in self._entries.values():
+            if not self._is_current(entry):
+                continue
+            for key, value in self.settings.items():
+                if entry.get("settings", {}).get(key, value) != value:
+                    changed[key] = changed.get(key, 0) + 1
+        return changed
+
+    def output_for(self, doc_hash: str) -> Optional[str]:
+        entry = self._entries.get(doc_hash)
+        return entry.get("output") if entry else None
+
+    def mark(self, doc_hash: str, status: str, output: Optional[str] = None, error: Optional[str] = None):
+        """Record the outcome for a document and flush it to disk."""
+        entry = {
+            "hash": doc_hash,
+            "version": self.version,
+            "settings": self.settings,
+            "status": status,
+            "output": output,
+            "error": error,
+            "updated_at": time.time(),
+        }
+        with self._lock:
+            self._entries[doc_hash] = entry
+            self._file.write(json.dumps(entry) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        with self._lock:
+            self._file.close()
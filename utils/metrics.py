@@ -0,0 +1,302 @@
+import io
+import os
+import json
+import time
+import bisect
+import pstats
+import cProfile
+import threading
+import tracemalloc
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Upper bounds (seconds) of the latency histogram buckets.
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+COUNTER = "counter"
+HISTOGRAM = "histogram"
+
+# LLM calls, labelled by model and routing stage.
+LLM_REQUEST_SECONDS = "llm_request_seconds"
+LLM_QUEUE_WAIT_SECONDS = "llm_queue_wait_seconds"
+LLM_REQUESTS_TOTAL = "llm_requests_total"
+LLM_RETRIES_TOTAL = "llm_retries_total"
+LLM_ESCALATIONS_TOTAL = "llm_escalations_total"
+LLM_TOKENS_TOTAL = "llm_tokens_total"
+# `kind` label values of LLM_TOKENS_TOTAL; cached tokens are also counted in prompt tokens.
+TOKEN_KINDS = ("prompt", "completion", "cached")
+LLM_COST_USD_TOTAL = "llm_cost_usd_total"
+# Pipeline stages, labelled by stage name.
+STAGE_SECONDS = "pipeline_stage_seconds"
+STAGE_ITEMS_TOTAL = "pipeline_stage_items_total"
+STAGE_IDLE_SECONDS_TOTAL = "pipeline_stage_idle_seconds_total"
+STAGE_BLOCKED_SECONDS_TOTAL = "pipeline_stage_blocked_seconds_total"
+
+Labels = Tuple[Tuple[str, str], ...]
+
+# The routing stage (entities, relations, judge, ...) an LLM call is made for; see `llm_stage`.
+_llm_stage: contextvars.ContextVar[str] = contextvars.ContextVar("llm_stage", default="other")
+
+
+def current_llm_stage() -> str:
+    return _llm_stage.get()
+
+
+@contextmanager
+def llm_stage(stage: str):
+    """Attribute LLM calls made inside the block (including in tasks it creates) to `stage`."""
+    token = _llm_stage.set(stage)
+    try:
+        yield
+    finally:
+        _llm_stage.reset(token)
+
+
+class _Histogram:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the `q` quantile (the largest bound if it overflows)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.buckets[-1]
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "mean": round(self.sum / self.count, 6) if self.count else None,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+        }
+
+
+class MetricsRegistry:
+    """
+    Thread-safe counters and latency histograms, keyed by metric name and labels.
+
+    Exported as Prometheus text exposition (or OpenMetrics) for scraping or the
+    node_exporter textfile collector, and as a JSON profile of the run.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._types: Dict[str, str] = {}
+        self._help: Dict[str, str] = {}
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, _Histogram]] = {}
+        self.started = time.time()
+
+    def describe(self, name: str, kind: str, help_text: str):
+        self._types[name] = kind
+        self._help[name] = help_text
+
+    @staticmethod
+    def _labels(labels: Dict[str, Any]) -> Labels:
+        return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = self._labels(labels)
+        with self._lock:
+            self._types.setdefault(name, COUNTER)
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, buckets: Tuple[float, ...] = LATENCY_BUCKETS, **labels):
+        key = self._labels(labels)
+        with self._lock:
+            self._types.setdefault(name, HISTOGRAM)
+            series = self._histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = _Histogram(buckets)
+            series[key].observe(value)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(name, time.monotonic() - started, **labels)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self.started = time.time()
+
+    # ---------------------- Export ----------------------
+
+    @staticmethod
+    def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+        pairs = list(labels) + ([extra] if extra else [])
+        if not pairs:
+            return ""
+        escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+        return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + "}"
+
+    @staticmethod
+    def _format_value(value: float) -> str:
+        return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+    def to_prometheus(self, openmetrics: bool = False) -> str:
+        """Prometheus text exposition format, or OpenMetrics (counter families without `_total`, `# EOF`)."""
+        lines: List[str] = []
+        with self._lock:
+            for name in sorted(self._counters):
+                family = name[:-len("_total")] if openmetrics and name.endswith("_total") else name
+                if name in self._help:
+                    lines.append(f"# HELP {family} {self._help[name]}")
+                lines.append(f"# TYPE {family} counter")
+                for labels, value in sorted(self._counters[name].items()):
+                    lines.append(f"{name}{self._format_labels(labels)} {self._format_value(value)}")
+            for name in sorted(self._histograms):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+                for labels, histogram in sorted(self._histograms[name].items()):
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{self._format_labels(labels, ('le', repr(float(bound))))} {cumulative}")
+                    lines.append(f"{name}_bucket{self._format_labels(labels, ('le', '+Inf'))} {histogram.count}")
+                    lines.append(f"{name}_sum{self._format_labels(labels)} {self._format_value(round(histogram.sum, 6))}")
+                    lines.append(f"{name}_count{self._format_labels(labels)} {histogram.count}")
+        if openmetrics:
+            lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Every series as {"labels": {...}, "value": n} for counters or a histogram summary."""
+        with self._lock:
+            data: Dict[str, List[Dict[str, Any]]] = {}
+            for name, series in self._counters.items():
+                data[name] = [{"labels": dict(labels), "value": round(value, 6)} for labels, value in sorted(series.items())]
+            for name, series in self._histograms.items():
+                data[name] = [{"labels": dict(labels), **histogram.summary()} for labels, histogram in sorted(series.items())]
+        return data
+
+    def rollup(self, name: str, by: str, **match) -> Dict[str, float]:
+        """Counter `name` summed over every label except `by`, over the series whose labels include `match`."""
+        wanted = self._labels(match)
+        totals: Dict[str, float] = {}
+        with self._lock:
+            for labels, value in self._counters.get(name, {}).items():
+                if not set(wanted) <= set(labels):
+                    continue
+                key = dict(labels).get(by, "")
+                totals[key] = round(totals.get(key, 0) + value, 6)
+        return totals
+
+    def write_prometheus(self, path: str, openmetrics: bool = False):
+        _write_atomic(path, self.to_prometheus(openmetrics=openmetrics))
+
+    def write_profile(self, path: str, extra: Optional[Dict[str, Any]] = None):
+        """JSON profile of the run: wall time, every series, and anything in `extra` (e.g. stage or profiler stats)."""
+        profile = {
+            "started_at": self.started,
+            "wall_seconds": round(time.time() - self.started, 3),
+            "metrics": self.snapshot(),
+            **(extra or {}),
+        }
+        _write_atomic(path, json.dumps(profile, indent=2, default=str))
+
+
+def _write_atomic(path: str, content: str):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+class Profiler:
+    """
+    Optional run-wide profiling hooks: cProfile (CPU time per function, main thread,
+    i.e. the event loop) and tracemalloc (peak memory and top allocation sites).
+    Both are off by default because they slow the process down noticeably.
+    """
+
+    def __init__(self, cpu: bool = False, memory: bool = False, top: int = 25):
+        self.cpu = cpu
+        self.memory = memory
+        self.top = top
+        self._profile: Optional[cProfile.Profile] = None
+
+    def start(self):
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if self.cpu:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+
+    def stop(self, dump_path: Optional[str] = None) -> Dict[str, Any]:
+        """Stop profiling and summarise; the raw cProfile data is written to `dump_path` (for snakeviz etc.) if given."""
+        summary: Dict[str, Any] = {}
+        if self._profile is not None:
+            self._profile.disable()
+            if dump_path:
+                self._profile.dump_stats(dump_path)
+            stats = pstats.Stats(self._profile, stream=io.StringIO())
+            stats.sort_stats(pstats.SortKey.CUMULATIVE)
+            summary["cpu"] = [
+                {
+                    "function": f"{filename}:{line}({function})",
+                    "calls": calls,
+                    "total_seconds": round(total_time, 6),
+                    "cumulative_seconds": round(cumulative_time, 6),
+                }
+                for (filename, line, function), (_, calls, total_time, cumulative_time, _) in _top_stats(stats, self.top)
+            ]
+            self._profile = None
+        if self.memory and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot()
+            summary["memory"] = {
+                "current_bytes": current,
+                "peak_bytes": peak,
+                "top": [
+                    {"site": str(stat.traceback), "bytes": stat.size, "blocks": stat.count}
+                    for stat in snapshot.statistics("lineno")[:self.top]
+                ],
+            }
+            tracemalloc.stop()
+        return summary
+
+
+def _top_stats(stats: pstats.Stats, top: int) -> Iterator[tuple]:
+    for function in stats.fcn_list[:top]:
+        yield function, stats.stats[function]
+
+
+# Process-wide registry, like `utils.logger.logger`.
+metrics = MetricsRegistry()
+metrics.describe(LLM_REQUEST_SECONDS, HISTOGRAM, "Duration of LLM requests once a limiter slot is held.")
+metrics.describe(LLM_QUEUE_WAIT_SECONDS, HISTOGRAM, "Time LLM requests waited for a concurrency/rate-limit slot.")
+metrics.describe(LLM_REQUESTS_TOTAL, COUNTER, "LLM requests by outcome.")
+metrics.describe(LLM_RETRIES_TOTAL, COUNTER, "Structured-output re-asks by reason.")
+metrics.describe(LLM_ESCALATIONS_TOTAL, COUNTER, "Model cascade escalations from the labelled model.")
+metrics.describe(LLM_TOKENS_TOTAL, COUNTER, "LLM tokens by kind (prompt, completion, cached prompt).")
+metrics.describe(LLM_COST_USD_TOTAL, COUNTER, "Estimated LLM cost in USD from list prices.")
+metrics.describe(STAGE_SECONDS, HISTOGRAM, "Time spent processing one item in a pipeline stage.")
+metrics.describe(STAGE_ITEMS_TOTAL, COUNTER, "Items handled by pipeline stages, by outcome.")
+metrics.describe(STAGE_IDLE_SECONDS_TOTAL, COUNTER, "Worker time spent waiting for input from the upstream queue.")
+metrics.describe(STAGE_BLOCKED_SECONDS_TOTAL, COUNTER, "Worker time spent blocked on a full downstream queue.")
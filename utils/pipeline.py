@@ -0,0 +1,145 @@
+import time
+import asyncio
+import contextvars
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from utils.logger import logger, log_context
+from utils.metrics import metrics, STAGE_SECONDS, STAGE_ITEMS_TOTAL, STAGE_IDLE_SECONDS_TOTAL, STAGE_BLOCKED_SECONDS_TOTAL
+
+
+class Stage:
+    """
+    One step of a `StagedPipeline`.
+
+    `handler` receives an item and returns the item to pass downstream, or None to
+    drop it. Async handlers run on the event loop; `blocking` handlers are plain
+    functions run on `executor` (by default a thread pool of `workers` threads), so
+    CPU- or disk-bound steps never stall the network-bound ones. Records logged while
+    handling an item carry the stage name and any correlation fields `log_fields`
+    returns for the item (e.g. a document id).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        handler: Callable[[Any], Any],
+        workers: int = 1,
+        blocking: bool = False,
+        executor: Optional[Executor] = None,
+        log_fields: Optional[Callable[[Any], Dict[str, str]]] = None,
+    ):
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.blocking = blocking
+        self.executor = executor
+        self.log_fields = log_fields
+        self.processed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+
+    async def run(self, item: Any) -> Any:
+        if self.blocking:
+            # Run in a copy of the caller's context so log correlation fields reach the thread.
+            context = contextvars.copy_context()
+            return await asyncio.get_running_loop().run_in_executor(self.executor, context.run, self.handler, item)
+        return await self.handler(item)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"workers": self.workers, "processed": self.processed, "failed": self.failed, "busy_seconds": round(self.busy_seconds, 3)}
+
+
+class StagedPipeline:
+    """
+    Chain of stages connected by bounded queues, each stage with its own worker pool.
+
+    Items flow from a producer into the first stage's queue; each queue holds at most
+    `queue_factor` items per downstream worker, so a slow stage applies backpressure
+    instead of buffering the corpus. A `None` sentinel per worker ends each stage,
+    and a stage's sentinels are only sent downstream once all its workers are done.
+    """
+
+    def __init__(self, stages: List[Stage], queue_factor: int = 2):
+        self.stages = stages
+        self.queues = [asyncio.Queue(maxsize=queue_factor * stage.workers) for stage in stages]
+
+    @property
+    def inbox(self) -> asyncio.Queue:
+        return self.queues[0]
+
+    async def _worker(self, index: int) -> int:
+        stage = self.stages[index]
+        inbox = self.queues[index]
+        outbox = self.queues[index + 1] if index + 1 < len(self.stages) else None
+        processed = 0
+        while True:
+            waiting = time.monotonic()
+            item = await inbox.get()
+            metrics.inc(STAGE_IDLE_SECONDS_TOTAL, time.monotonic() - waiting, stage=stage.name)
+            try:
+                if item is None:
+                    return processed
+                started = time.monotonic()
+                fields = stage.log_fields(item) if stage.log_fields is not None else {}
+                with log_context(stage=stage.name, **fields):
+                    try:
+                        result = await stage.run(item)
+                    except Exception as e:
+                        stage.failed += 1
+                        metrics.inc(STAGE_ITEMS_TOTAL, stage=stage.name, outcome="failed")
+                        logger.error(f"❌ Stage '{stage.name}' failed: {e}")
+                        continue
+                    finally:
+                        elapsed = time.monotonic() - started
+                        stage.busy_seconds += elapsed
+                        metrics.observe(STAGE_SECONDS, elapsed, stage=stage.name)
+                stage.processed += 1
+                processed += 1
+                metrics.inc(STAGE_ITEMS_TOTAL, stage=stage.name, outcome="ok")
+                if result is not None and outbox is not None:
+                    blocked = time.monotonic()
+                    await outbox.put(result)
+                    metrics.inc(STAGE_BLOCKED_SECONDS_TOTAL, time.monotonic() - blocked, stage=stage.name)
+            finally:
+                inbox.task_done()
+
+    async def _run_stage(self, index: int) -> int:
+        workers = [asyncio.create_task(self._worker(index)) for _ in range(self.stages[index].workers)]
+        try:
+            counts = await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+        if index + 1 < len(self.stages):
+            for _ in range(self.stages[index + 1].workers):
+                await self.queues[index + 1].put(None)
+        return sum(counts)
+
+    async def run(self, producer: Callable[[asyncio.Queue, int], Awaitable[Any]]) -> int:
+        """
+        Run `producer(inbox, num_consumers)`, which must put one `None` per first-stage
+        worker when done, until every stage drains. Returns the number of items that
+        completed the last stage.
+        """
+        owned = []
+        for stage in self.stages:
+            if stage.blocking and stage.executor is None:
+                stage.executor = ThreadPoolExecutor(max_workers=stage.workers, thread_name_prefix=stage.name)
+                owned.append(stage)
+
+        feeder = asyncio.create_task(producer(self.inbox, self.stages[0].workers))
+        runners = [asyncio.create_task(self._run_stage(i)) for i in range(len(self.stages))]
+        try:
+            counts = await asyncio.gather(*runners)
+            await feeder
+        finally:
+            for task in [feeder, *runners]:
+                task.cancel()
+            for stage in owned:
+                stage.executor.shutdown(wait=True)
+                stage.executor = None
+        return counts[-1]
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {stage.name: stage.stats() for stage in self.stages}
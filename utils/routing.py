@@ -0,0 +1,88 @@
+import json
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from pydantic import BaseModel
+
+from utils.constants import GPT_4O, PROVIDER_INFORMATION
+from utils.logger import logger
+from utils.metrics import metrics, llm_stage, LLM_ESCALATIONS_TOTAL
+
+ENTITIES_STAGE = "entities"
+RELATIONS_STAGE = "relations"
+PERSONALITY_STAGE = "personality"
+JOINT_STAGE = "joint"
+JUDGE_STAGE = "judge"
+PLAN_STAGE = "plan"
+COMPOSE_STAGE = "compose"
+
+STAGES = (ENTITIES_STAGE, RELATIONS_STAGE, PERSONALITY_STAGE, JOINT_STAGE, JUDGE_STAGE, PLAN_STAGE, COMPOSE_STAGE)
+
+
+class ModelRouter:
+    """
+    Assigns a model, or a cascade of models, to each pipeline stage.
+
+    A route is either a single model name or a list ordered cheapest first. A
+    cascade escalates to the next model when the call fails validation (the
+    service returns None) or the result is rejected by the caller's `accept` check;
+    the last model's answer is returned as-is. Stages without a route use `default`.
+
+    With a `provider`, every routed model must be one of its known models, so a typo
+    in `MODEL_ROUTES` fails at startup rather than part-way through a run.
+    """
+
+    def __init__(self, routes: Optional[Dict[str, Union[str, List[str]]]] = None, default: str = GPT_4O, provider: Optional[str] = None):
+        self.default = default
+        self.routes: Dict[str, List[str]] = {}
+        for stage, models in (routes or {}).items():
+            if stage not in STAGES:
+                raise ValueError(f"Unknown stage '{stage}' in model routes. Expected one of {STAGES}.")
+            self.routes[stage] = [models] if isinstance(models, str) else list(models)
+        if provider is not None:
+            known = PROVIDER_INFORMATION[provider]["MODEL_ID"]
+            unknown = sorted({model for models in [[default], *self.routes.values()] for model in models if model not in known})
+            if unknown:
+                raise ValueError(f"Unknown {provider} models {unknown} in model routes. Expected any of {sorted(known)}.")
+
+    @classmethod
+    def from_json(cls, config: Optional[str], default: str = GPT_4O, provider: Optional[str] = None) -> "ModelRouter":
+        """Build a router from a JSON object such as '{"entities": ["gpt-4o-mini", "gpt-4o"]}'."""
+        return cls(json.loads(config) if config else None, default=default, provider=provider)
+
+    def models(self, stage: str) -> List[str]:
+        return self.routes.get(stage) or [self.default]
+
+    def describe(self) -> str:
+        """Stable description of the routing table, e.g. for pipeline versioning."""
+        return json.dumps({stage: self.models(stage) for stage in STAGES}, sort_keys=True)
+
+    async def _cascade(self, stage: str, call: Callable[[str], Any], accept: Optional[Callable[[Any], bool]]):
+        models = self.models(stage)
+        response = None
+        for i, model in enumerate(models):
+            with llm_stage(stage):
+                response = await call(model)
+            is_last = i == len(models) - 1
+            if is_last:
+                break
+            if response is not None and (accept is None or accept(response)):
+                break
+            logger.debug(f"Escalating {stage} stage from {model} to {models[i + 1]}.")
+            metrics.inc(LLM_ESCALATIONS_TOTAL, model=model, stage=stage)
+        return response
+
+    async def call_structured(self, llm_service, stage: str, messages: List[dict], response_format: BaseModel, accept: Optional[Callable[[Any], bool]] = None):
+        """`call_llm_structured` routed through the cascade for `stage`."""
+        return await self._cascade(
+            stage,
+            lambda model: llm_service.call_llm_structured(model=model, messages=messages, response_format=response_format),
+            accept,
+        )
+
+    async def call(self, llm_service, stage: str, messages: List[dict], accept: Optional[Callable[[Any], bool]] = None):
+        """`call_llm` routed through the cascade for `stage`."""
+        return await self._cascade(
+            stage,
+            lambda model: llm_service.call_llm(model=model, messages=messages),
+            accept,
+        )
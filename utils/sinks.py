@@ -0,0 +1,415 @@
+import os
+import glob
+import json
+import time
+import queue
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from utils.logger import logger
+
+JSON = "json"
+JSONL = "jsonl"
+PARQUET = "parquet"
+SINKS = (JSON, JSONL, PARQUET)
+
+Record = Tuple[str, Dict[str, Any]]
+
+
+class ResultSink(ABC):
+    """
+    Destination for per-document results (`document_metadata`, `knowledge_graph`, `evaluation`).
+
+    `write` only enqueues the record and returns immediately. A background writer
+    thread collects up to `batch_size` records (or whatever arrives within
+    `flush_interval` seconds), persists them with one `_write_batch` call, and then
+    runs each record's `on_written` callback. Anything that must not run before a
+    record is durable, such as checkpointing, belongs in that callback. Writing a
+    record id again replaces the earlier version.
+    """
+
+    def __init__(self, batch_size: int = 256, flush_interval: float = 1.0):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._pending_lock = threading.Lock()
+        self._writer: Optional[threading.Thread] = None
+        self._closed = False
+
+    @abstractmethod
+    def _write_batch(self, records: List[Record]):
+        """Durably persist a batch of (record id, result) pairs."""
+        pass
+
+    @abstractmethod
+    def _read(self, record_id: str) -> Optional[Dict[str, Any]]:
+        pass
+
+    @abstractmethod
+    def _iter_records(self) -> Iterator[Record]:
+        pass
+
+    def locator(self, record_id: str) -> str:
+        """Human-readable location of a record, recorded in the run manifest."""
+        return record_id
+
+    def write(self, record_id: str, result: Dict[str, Any], on_written: Optional[Callable[[], None]] = None):
+        if self._closed:
+            raise RuntimeError("Cannot write to a closed sink.")
+        with self._pending_lock:
+            self._pending[record_id] = result
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._run_writer, name=f"{type(self).__name__}-writer", daemon=True)
+                self._writer.start()
+        self._queue.put((record_id, result, on_written))
+
+    def read(self, record_id: str) -> Optional[Dict[str, Any]]:
+        """The latest version of a record, including one still waiting to be written."""
+        with self._pending_lock:
+            if record_id in self._pending:
+                return self._pending[record_id]
+        return self._read(record_id)
+
+    def records(self) -> Iterator[Record]:
+        """Every persisted record (latest version of each). Call `flush` first to include queued writes."""
+        return self._iter_records()
+
+    def _run_writer(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+
+            self._commit(batch)
+            for _ in range(len(batch) + stop):
+                self._queue.task_done()
+            if stop:
+                return
+
+    def _commit(self, batch: List[tuple]):
+        latest: Dict[str, Dict[str, Any]] = {}
+        for record_id, result, _ in batch:
+            latest[record_id] = result
+        try:
+            self._write_batch(list(latest.items()))
+        except Exception as e:
+            logger.error(f"{type(self).__name__} failed to write {len(latest)} records: {e}")
+            return
+        finally:
+            with self._pending_lock:
+                for record_id, result in latest.items():
+                    if self._pending.get(record_id) is result:
+                        del self._pending[record_id]
+
+        for _, _, on_written in batch:
+            if on_written is not None:
+                try:
+                    on_written()
+                except Exception as e:
+                    logger.error(f"Post-write callback failed: {e}")
+
+    def flush(self):
+        """Block until every record written so far has been persisted."""
+        if self._writer is not None:
+            self._queue.join()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self._writer is not None:
+            self._queue.put(None)
+            self._writer.join()
+
+
+class JsonFileSink(ResultSink):
+    """One pretty-printed `kg_<record id>.json` file per document (the original layout)."""
+
+    def __init__(self, directory: str, **kwargs):
+        super().__init__(**kwargs)
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, record_id: str) -> str:
+        return os.path.join(self.directory, f"kg_{record_id}.json")
+
+    def locator(self, record_id: str) -> str:
+        return self._path(record_id)
+
+    def _write_batch(self, records: List[Record]):
+        for record_id, result in records:
+            tmp_path = f"{self._path(record_id)}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(result, f, indent=4)
+            os.replace(tmp_path, self._path(record_id))
+
+    def _read(self, record_id: str) -> Optional[Dict[str, Any]]:
+        path = self._path(record_id)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r") as f:
+            return json.load(f)
+
+    def _iter_records(self) -> Iterator[Record]:
+        for path in sorted(glob.glob(os.path.join(self.directory, "kg_*.json"))):
+            with open(path, "r") as f:
+                yield os.path.basename(path)[len("kg_"):-len(".json")], json.load(f)
+
+
+class JsonlSink(ResultSink):
+    """
+    All results appended to `results.jsonl`, one compact line per record, with a
+    sidecar `results.index.jsonl` of `{"id", "offset", "length"}` entries so single
+    records can be read back with one seek. The index is written after the data it
+    points to; a torn data tail from a crash is trimmed on open. Rewriting a record
+    appends a new line and the newest index entry wins.
+    """
+
+    def __init__(self, directory: str, **kwargs):
+        super().__init__(**kwargs)
+        os.makedirs(directory, exist_ok=True)
+        self.data_path = os.path.join(directory, "results.jsonl")
+        self.index_path = os.path.join(directory, "results.index.jsonl")
+        self.offsets: Dict[str, Tuple[int, int]] = {}
+        self._load_index()
+
+    def _load_index(self):
+        end = 0
+        if os.path.exists(self.index_path):
+            valid = 0
+            with open(self.index_path, "rb") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        break
+                    valid += len(line)
+                    self.offsets[entry["id"]] = (entry["offset"], entry["length"])
+                    end = max(end, entry["offset"] + entry["length"])
+            # Drop a torn final index line so later appends are not hidden behind it.
+            if os.path.getsize(self.index_path) > valid:
+                with open(self.index_path, "r+b") as f:
+                    f.truncate(valid)
+        if os.path.exists(self.data_path) and os.path.getsize(self.data_path) > end:
+            with open(self.data_path, "r+b") as f:
+                f.truncate(end)
+
+    def locator(self, record_id: str) -> str:
+        return f"{self.data_path}#{record_id}"
+
+    def _write_batch(self, records: List[Record]):
+        lines = [(record_id, (json.dumps(result, ensure_ascii=False, default=str) + "\n").encode("utf-8")) for record_id, result in records]
+        with open(self.data_path, "ab") as f:
+            offset = f.tell()
+            f.write(b"".join(line for _, line in lines))
+            f.flush()
+            os.fsync(f.fileno())
+
+        entries = []
+        for record_id, line in lines:
+            entries.append((record_id, offset, len(line)))
+            offset += len(line)
+        with open(self.index_path, "a") as f:
+            for record_id, start, length in entries:
+                f.write(json.dumps({"id": record_id, "offset": start, "length": length}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        for record_id, start, length in entries:
+            self.offsets[record_id] = (start, length)
+
+    def _read(self, record_id: str) -> Optional[Dict[str, Any]]:
+        location = self.offsets.get(record_id)
+        if location is None:
+            return None
+        with open(self.data_path, "rb") as f:
+            f.seek(location[0])
+            return json.loads(f.read(location[1]))
+
+    def _iter_records(self) -> Iterator[Record]:
+        latest = {offset: record_id for record_id, (offset, _) in self.offsets.items()}
+        if not latest:
+            return
+        with open(self.data_path, "rb") as f:
+            offset = 0
+            for line in f:
+                if offset in latest:
+                    yield latest[offset], json.loads(line)
+                offset += len(line)
+
+
+class ParquetSink(ResultSink):
+    """
+    Columnar layout for analytics: each flushed batch adds one Parquet part file to
+    each of `documents/`, `nodes/`, `edges/` and `evaluations/`, all keyed by
+    `record_id` and a write `version`. Nodes and edges are one row each, and
+    evaluation metrics are flattened into numeric columns, so they can be scanned
+    directly (e.g. with pyarrow.dataset or DuckDB). Readers keep only the newest
+    version of each record. The part holding each record's newest version is
+    indexed on open (from the `record_id` and `version` columns of `documents/`),
+    so reading one record opens a single part per table. Requires pyarrow>=14.
+    """
+
+    TABLES = ("documents", "nodes", "edges", "evaluations")
+
+    def __init__(self, directory: str, **kwargs):
+        try:
+            import pyarrow
+            import pyarrow.parquet  # noqa: F401
+        except ImportError:
+            raise ImportError("pyarrow is not installed. Install it with 'pip install \"pyarrow>=14\"' to use the parquet sink.")
+        # Reading parts with differing schemas relies on `unify_schemas(promote_options=...)`, added in pyarrow 14.
+        if int(pyarrow.__version__.split(".")[0]) < 14:
+            raise ImportError(f"The parquet sink requires pyarrow>=14 (found {pyarrow.__version__}).")
+        super().__init__(**kwargs)
+        self.directory = directory
+        for table in self.TABLES:
+            os.makedirs(os.path.join(directory, table), exist_ok=True)
+        self.parts: Dict[str, Tuple[str, int]] = {}
+        self._load_index()
+
+    def _load_index(self):
+        import pyarrow.parquet as pq
+
+        for path in sorted(glob.glob(os.path.join(self.directory, "documents", "part-*.parquet"))):
+            part = os.path.basename(path)
+            for row in pq.read_table(path, columns=["record_id", "version"]).to_pylist():
+                if row["record_id"] not in self.parts or row["version"] > self.parts[row["record_id"]][1]:
+                    self.parts[row["record_id"]] = (part, row["version"])
+
+    def locator(self, record_id: str) -> str:
+        return f"{self.directory}#{record_id}"
+
+    @staticmethod
+    def _flatten_metrics(evaluation: Dict[str, Any]) -> Dict[str, Any]:
+        row = {}
+        for section in ("supervised_eval", "llm_eval"):
+            for name, value in (evaluation.get(section) or {}).items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    row[f"{section}.{name}"] = float(value)
+        judge = evaluation.get("judge") or {}
+        row["judge.stratum"] = judge.get("stratum")
+        row["judge.selected"] = judge.get("selected")
+        row["error"] = evaluation.get("error")
+        row["evaluation_error"] = evaluation.get("evaluation_error")
+        return row
+
+    def _write_batch(self, records: List[Record]):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        version = time.time_ns()
+        rows: Dict[str, List[dict]] = {table: [] for table in self.TABLES}
+        for record_id, result in records:
+            key = {"record_id": record_id, "version": version}
+            graph = result.get("knowledge_graph")
+            metadata = result.get("document_metadata") or {}
+            rows["documents"].append({
+                **key,
+                "creation_timestamp": metadata.get("creation_timestamp"),
+                "content": metadata.get("content"),
+                "metadata": json.dumps(metadata, ensure_ascii=False, default=str),
+                "has_graph": graph is not None,
+            })
+            for node in (graph or {}).get("nodes", []):
+                node_type = node.get("type")
+                rows["nodes"].append({**key, "name": node["name"], "type": getattr(node_type, "value", node_type), "description": node.get("description")})
+            for edge in (graph or {}).get("edges", []):
+                rows["edges"].append({**key, "source": edge["source"], "relation": edge["relation"], "target": edge["target"]})
+            evaluation = result.get("evaluation") or {}
+            rows["evaluations"].append({
+                **key,
+                **self._flatten_metrics(evaluation),
+                "evaluation": json.dumps(evaluation, ensure_ascii=False, default=str),
+            })
+
+        part = f"part-{version}.parquet"
+        for table, table_rows in rows.items():
+            if not table_rows:
+                continue
+            # from_pylist infers columns from the first row, so give every row the same keys.
+            columns = sorted({column for row in table_rows for column in row})
+            arrow_table = pa.Table.from_pylist([{column: row.get(column) for column in columns} for row in table_rows])
+            tmp_path = os.path.join(self.directory, table, f".{part}.tmp")
+            pq.write_table(arrow_table, tmp_path)
+            os.replace(tmp_path, os.path.join(self.directory, table, part))
+        for record_id, _ in records:
+            self.parts[record_id] = (part, version)
+
+    def _load(self, table: str, record_id: Optional[str] = None, columns: Optional[List[str]] = None, part: Optional[str] = None) -> List[dict]:
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+        import pyarrow.parquet as pq
+
+        path = os.path.join(self.directory, table)
+        if part is not None:
+            # Nodes and edges have no part for a batch without any.
+            files = [f for f in [os.path.join(path, part)] if os.path.exists(f)]
+        else:
+            files = sorted(glob.glob(os.path.join(path, "part-*.parquet")))
+        if not files:
+            return []
+        # Parts differ in columns (e.g. metrics only some documents have) and in all-null types.
+        schema = pa.unify_schemas([pq.read_schema(f) for f in files], promote_options="permissive")
+        dataset = ds.dataset(files, schema=schema, format="parquet")
+        filter_ = ds.field("record_id") == record_id if record_id is not None else None
+        return dataset.to_table(columns=columns, filter=filter_).to_pylist()
+
+    def _assemble(self, record_id: Optional[str] = None, part: Optional[str] = None) -> Iterator[Record]:
+        documents = {}
+        for row in self._load("documents", record_id, part=part):
+            if row["record_id"] not in documents or row["version"] > documents[row["record_id"]]["version"]:
+                documents[row["record_id"]] = row
+        versions = {rid: row["version"] for rid, row in documents.items()}
+
+        evaluations = {row["record_id"]: row for row in self._load("evaluations", record_id, columns=["record_id", "version", "evaluation"], part=part) if versions.get(row["record_id"]) == row["version"]}
+        graphs: Dict[str, Dict[str, list]] = {rid: {"nodes": [], "edges": []} for rid, row in documents.items() if row["has_graph"]}
+        for row in self._load("nodes", record_id, part=part):
+            if versions.get(row["record_id"]) == row["version"] and row["record_id"] in graphs:
+                graphs[row["record_id"]]["nodes"].append({"name": row["name"], "type": row["type"], "description": row["description"]})
+        for row in self._load("edges", record_id, part=part):
+            if versions.get(row["record_id"]) == row["version"] and row["record_id"] in graphs:
+                graphs[row["record_id"]]["edges"].append({"source": row["source"], "relation": row["relation"], "target": row["target"]})
+
+        for rid, row in documents.items():
+            evaluation = evaluations.get(rid)
+            yield rid, {
+                "document_metadata": json.loads(row["metadata"]),
+                "knowledge_graph": graphs.get(rid),
+                "evaluation": json.loads(evaluation["evaluation"]) if evaluation else {},
+            }
+
+    def _read(self, record_id: str) -> Optional[Dict[str, Any]]:
+        location = self.parts.get(record_id)
+        if location is None:
+            return None
+        for _, result in self._assemble(record_id, part=location[0]):
+            return result
+        return None
+
+    def _iter_records(self) -> Iterator[Record]:
+        return self._assemble()
+
+
+def make_sink(kind: str, directory: str, **kwargs) -> ResultSink:
+    if kind == JSON:
+        return JsonFileSink(directory, **kwargs)
+    if kind == JSONL:
+        return JsonlSink(directory, **kwargs)
+    if kind == PARQUET:
+        return ParquetSink(directory, **kwargs)
+    raise ValueError(f"Unknown sink '{kind}'. Expected one of {SINKS}.")
@@ -0,0 +1,140 @@
+import typing
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel, TypeAdapter, ValidationError
+
+
+class StreamAborted(RuntimeError):
+    """Raised by `StreamingJSONValidator.feed` to cancel a structured stream early."""
+
+
+def list_item_adapters(response_format: BaseModel) -> Dict[str, TypeAdapter]:
+    """Validators for the items of each top-level list field of `response_format`."""
+    adapters = {}
+    for name, field in response_format.model_fields.items():
+        annotation = field.annotation
+        if typing.get_origin(annotation) is typing.Union:
+            annotation = next((a for a in typing.get_args(annotation) if a is not type(None)), annotation)
+        if typing.get_origin(annotation) is list and typing.get_args(annotation):
+            adapters[field.alias or name] = TypeAdapter(typing.get_args(annotation)[0])
+    return adapters
+
+
+class StreamingJSONValidator:
+    """
+    Incremental checker for a streamed JSON object such as `{"entities": [...], "relations": [...]}`.
+
+    Text is fed as it arrives. Each element of a top-level list field is validated against
+    the field's item type as soon as it is complete, so a malformed entity or relation
+    cancels the generation at that element instead of at the end. `max_items` (per list)
+    and `max_tokens` (~4 characters per token) stop runaway generations. Anything before
+    the first "{" or after the closing "}" (prose, code fences) is ignored.
+    """
+
+    def __init__(self, response_format: BaseModel, max_items: Optional[int] = None, max_tokens: Optional[int] = None):
+        self.adapters = list_item_adapters(response_format)
+        self.max_items = max_items
+        self.max_tokens = max_tokens
+        self.counts: Dict[str, int] = {}
+        self.chars = 0
+        self._chunks: List[str] = []
+        self._start: Optional[int] = None  # offset of the root "{" in the full text
+        self._end: Optional[int] = None    # offset just past the root "}"
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._string_parts: List[str] = []
+        self._last_string: Optional[str] = None
+        self._key: Optional[str] = None
+        self._list: Optional[str] = None   # list field currently being streamed
+        self._item: Optional[List[str]] = None
+
+    @property
+    def tokens(self) -> int:
+        return self.chars // 4
+
+    @property
+    def complete(self) -> bool:
+        return self._end is not None
+
+    @property
+    def text(self) -> str:
+        return "".join(self._chunks)
+
+    def json_text(self) -> str:
+        """The root JSON object, or everything from its start if the stream ended early."""
+        text = self.text
+        if self._start is None:
+            return text
+        return text[self._start:self._end]
+
+    def feed(self, chunk: str):
+        offset = self.chars
+        self._chunks.append(chunk)
+        self.chars += len(chunk)
+        if self.max_tokens is not None and self.tokens > self.max_tokens:
+            raise StreamAborted(f"response exceeded {self.max_tokens} tokens")
+        if self._end is not None:
+            return
+
+        item_from = 0 if self._item is not None else None
+        for i, char in enumerate(chunk):
+            if self._in_string:
+                if self._depth == 1:
+                    self._string_parts.append(char)
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._last_string = "".join(self._string_parts[:-1])
+                continue
+
+            if self._start is None:
+                if char == "{":
+                    self._start = offset + i
+                    self._depth = 1
+                continue
+
+            if self._depth == 2 and self._list is not None:
+                if char in ",]" and self._item is not None:
+                    self._item.append(chunk[item_from:i])
+                    self._check_item("".join(self._item).strip())
+                    self._item, item_from = None, None
+                elif self._item is None and not char.isspace() and char not in ",]":
+                    self._item, item_from = [], i
+
+            if char == '"':
+                self._in_string = True
+                self._string_parts = []
+            elif char == ":" and self._depth == 1:
+                self._key = self._last_string
+            elif char in "{[":
+                self._depth += 1
+                if self._depth == 2 and char == "[" and self._key in self.adapters:
+                    self._list = self._key
+                    self.counts.setdefault(self._list, 0)
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 1:
+                    self._list = None
+                elif self._depth == 0:
+                    self._end = offset + i + 1
+                    return
+
+        if self._item is not None:
+            self._item.append(chunk[item_from:])
+
+    def _check_item(self, text: str):
+        if not text:
+            return
+        field = self._list
+        self.counts[field] += 1
+        if self.max_items is not None and self.counts[field] > self.max_items:
+            raise StreamAborted(f"'{field}' exceeded {self.max_items} items")
+        try:
+            self.adapters[field].validate_json(text)
+        except ValidationError as e:
+            raise StreamAborted(f"item {self.counts[field]} of '{field}' is invalid: {e}") from e